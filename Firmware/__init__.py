@@ -3,6 +3,7 @@ Firmware package for medicine dispenser control logic
 """
 
 from .dispense_controller import DispenseController
+from .dispense_engine import DispenseEngine
 from .state_manager import StateManager
 
-__all__ = ['DispenseController', 'StateManager']
\ No newline at end of file
+__all__ = ['DispenseController', 'DispenseEngine', 'StateManager']
@@ -0,0 +1,406 @@
+"""
+Backend bridge
+
+Talks to the software team's Java service at JAVA_API_URL:
+
+    GET  /prescriptions?date=YYYY-MM-DD&kiosk=ID   the day's patients and doses
+         -> {"patients": [{"id", "name", "room", "doses": [{"medication", "pills",
+             "due", "channel", "instructions"}]}]}   (ETag / If-None-Match honoured)
+    POST /events   {"kiosk": ID, "events": [...]}    a batch of dispense events;
+                   every event carries a unique "id" so retried batches can be
+                   de-duplicated by the backend
+    POST /notifications   one staff alert (notifications.HttpNotifySink)
+
+Kiosk screens never wait on the network. The UI only ever reads the local
+prescription store and logs events as usual; BackendSync runs everything
+else on one background thread:
+
+- prefetch: the day's prescriptions are downloaded into the store every
+  BACKEND_PREFETCH_INTERVAL (304 when nothing changed)
+- outbox: uploaded event kinds (BACKEND_EVENT_KINDS) are queued in memory,
+  written to a SQLite outbox and sent in batches of BACKEND_BATCH_SIZE;
+  they are only deleted once the backend accepted them, so they survive
+  the backend being down and the kiosk restarting
+- BackendClient keeps its HTTP connections alive between requests
+
+python -m Firmware.backend_stub runs a local stand-in for the backend.
+"""
+
+import http.client
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+from config.hardware_config import (BACKEND_BATCH_SIZE, BACKEND_EVENT_KINDS,
+                                    BACKEND_FLUSH_INTERVAL, BACKEND_OUTBOX, BACKEND_OUTBOX_MAX,
+                                    BACKEND_POOL_SIZE, BACKEND_PREFETCH_INTERVAL,
+                                    BACKEND_RETRY_MAX, BACKEND_TIMEOUT, JAVA_API_URL, KIOSK_ID,
+                                    MEDICATION_CHANNELS)
+from hardware.tracing import tracer
+
+
+class BackendError(Exception):
+    pass
+
+
+def prescription_list(body):
+    """The patients of a /prescriptions response, checked before they replace the
+    store's. Raises BackendError when the payload is not what the kiosk expects."""
+    if not isinstance(body, dict) or not isinstance(body.get("patients", []), list):
+        raise BackendError("prescriptions response is not {\"patients\": [...]}")
+    patients = body.get("patients", [])
+    seen = set()
+    for patient in patients:
+        if not isinstance(patient, dict) or not isinstance(patient.get("id"), str) \
+                or not isinstance(patient.get("name"), str):
+            raise BackendError(f"patient without an id or name: {patient!r:.80}")
+        if patient["id"] in seen:
+            raise BackendError(f"patient {patient['id']} listed twice")
+        seen.add(patient["id"])
+        doses = patient.get("doses", [])
+        if not isinstance(doses, list):
+            raise BackendError(f"doses of patient {patient['id']} are not a list")
+        for dose in doses:
+            if not isinstance(dose, dict) or not isinstance(dose.get("medication"), str) \
+                    or not isinstance(dose.get("pills"), int) \
+                    or not isinstance(dose.get("due"), str) or len(dose["due"]) != 5:
+                raise BackendError(f"bad dose for patient {patient['id']}: {dose!r:.80}")
+    return patients
+
+
+class BackendClient:
+    """JSON over HTTP/1.1 with a small pool of keep-alive connections (thread-safe)"""
+
+    def __init__(self, base_url=JAVA_API_URL, timeout=BACKEND_TIMEOUT,
+                 pool_size=BACKEND_POOL_SIZE):
+        url = urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.idle = []                  # open connections not in use
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0            # connections opened (requests / connections = reuse)
+
+    def get(self, path, params=None, headers=None):
+        if params:
+            path += "?" + urlencode(params)
+        return self.request("GET", path, headers=headers)
+
+    def post(self, path, body):
+        return self.request("POST", path, body)
+
+    def request(self, method, path, body=None, headers=None):
+        """Returns (status, headers, decoded JSON or None). Raises BackendError."""
+        data = None if body is None else json.dumps(body, default=str).encode()
+        headers = dict(headers or {})
+        headers["Accept"] = "application/json"
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+        with tracer.span("backend_request", "backend", method=method, path=path):
+            for attempt in range(2):
+                connection, reused = self._checkout()
+                try:
+                    connection.request(method, self.prefix + path, data, headers)
+                    response = connection.getresponse()
+                    payload = response.read()   # drained, so the connection can be reused
+                except (http.client.HTTPException, OSError) as e:
+                    connection.close()
+                    # A kept-alive connection the server has since closed: retry on a fresh one
+                    if reused and attempt == 0:
+                        continue
+                    raise BackendError(f"{method} {path}: {e}") from e
+                self.requests += 1
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._checkin(connection)
+                break
+        if response.status >= 400:
+            raise BackendError(f"{method} {path}: HTTP {response.status}")
+        try:
+            decoded = json.loads(payload) if payload else None
+        except ValueError as e:
+            raise BackendError(f"{method} {path}: bad JSON ({e})") from e
+        return response.status, response.headers, decoded
+
+    def _checkout(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+            self.connections += 1
+        factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return factory(self.host, self.port, timeout=self.timeout), False
+
+    def _checkin(self, connection):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        return {"requests": self.requests, "connections": self.connections}
+
+
+class Outbox:
+    """Events waiting for the backend, in a SQLite file (used from one thread)"""
+
+    def __init__(self, path=BACKEND_OUTBOX, max_events=BACKEND_OUTBOX_MAX):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            # One cheap commit per batch; a power cut loses at most the last batch
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS outbox "
+                        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL)")
+        self.db.commit()
+        self.max_events = max_events
+        self.pending = self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.dropped = 0
+
+    def add(self, events):
+        with self.db:
+            self.db.executemany("INSERT INTO outbox (body) VALUES (?)",
+                                [(json.dumps(event, default=str),) for event in events])
+            self.pending += len(events)
+            excess = self.pending - self.max_events
+            if excess > 0:
+                self.db.execute("DELETE FROM outbox WHERE seq IN "
+                                "(SELECT seq FROM outbox ORDER BY seq LIMIT ?)", (excess,))
+                self.pending -= excess
+                self.dropped += excess
+
+    def peek(self, limit):
+        """The oldest events as (last seq, [event, ...])"""
+        rows = self.db.execute("SELECT seq, body FROM outbox ORDER BY seq LIMIT ?",
+                               (limit,)).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [json.loads(body) for seq, body in rows]
+
+    def remove(self, last_seq):
+        """Delete everything up to and including last_seq (accepted by the backend)"""
+        with self.db:
+            removed = self.db.execute("DELETE FROM outbox WHERE seq <= ?", (last_seq,)).rowcount
+        self.pending -= removed
+
+    def close(self):
+        self.db.close()
+
+
+class BackendSync:
+    def __init__(self, store, client=None, outbox=None, on_update=None, kiosk_id=KIOSK_ID,
+                 kinds=BACKEND_EVENT_KINDS, batch_size=BACKEND_BATCH_SIZE,
+                 flush_interval=BACKEND_FLUSH_INTERVAL,
+                 prefetch_interval=BACKEND_PREFETCH_INTERVAL, retry_max=BACKEND_RETRY_MAX,
+                 channels=MEDICATION_CHANNELS, clock=time.monotonic):
+        self.store = store              # prescription_store.PrescriptionStore
+        self.client = client or BackendClient()
+        self.outbox = outbox            # opened on the sync thread when None
+        self.on_update = on_update      # on_update(patients) after new prescriptions (sync thread)
+        self.kiosk_id = kiosk_id
+        self.kinds = set(kinds)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prefetch_interval = prefetch_interval
+        self.retry_max = retry_max
+        self.channels = channels        # where a medication is loaded, if the backend doesn't say
+        self.clock = clock
+
+        self.queue = queue.Queue(maxsize=10000)
+        self.thread = None
+        self.online = None              # None until the first request
+        self.failures = 0
+        self.last_error = ""
+        self.etag = None
+        self.flush_at = None            # when the buffered events are due to be sent
+        self.retry_at = 0.0
+        self.prefetch_at = 0.0
+        self.uploaded = 0
+        self.prefetched = 0
+        self.dropped = 0
+
+    # --- Any thread ---
+
+    def put(self, entry):
+        """EventLog listener: queue an event for upload (never blocks)"""
+        if entry["kind"] not in self.kinds:
+            return
+        event = dict(entry, id=uuid.uuid4().hex)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="backend-sync", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=BACKEND_TIMEOUT + 1):
+        """Write queued events to the outbox, try one last upload and stop"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def status(self):
+        return {"online": self.online, "pending": self.outbox.pending if self.outbox else 0,
+                "uploaded": self.uploaded, "prefetched": self.prefetched,
+                "dropped": self.dropped + (self.outbox.dropped if self.outbox else 0),
+                "error": self.last_error, **self.client.stats()}
+
+    # --- Sync thread ---
+
+    def _run(self):
+        if self.outbox is None:
+            self.outbox = Outbox()
+        if self.outbox.pending:
+            print(f"📮 {self.outbox.pending} event(s) waiting in the outbox")
+            self.flush_at = self.clock()
+        stop = False
+        while not stop:
+            events, stop = self._collect(self._wait_time())
+            try:
+                self._sync(events, stop)
+            except Exception as e:
+                # Anything unexpected must not end uploads for the rest of the shift
+                print(f"⚠️ Backend sync error: {e!r}")
+                self.last_error = repr(e)
+                self.failures += 1
+                self.retry_at = self.clock() + min(self.retry_max, 2 ** (self.failures - 1))
+        self.client.close()
+        self.outbox.close()
+
+    def _sync(self, events, stop):
+        """One pass of the sync thread: outbox the new events, upload and prefetch when due"""
+        if events:
+            self.outbox.add(events)
+            if self.flush_at is None:
+                self.flush_at = self.clock() + self.flush_interval
+        now = self.clock()
+        if self.flush_at is not None and now >= self.retry_at and (
+                stop or now >= self.flush_at or self.outbox.pending >= self.batch_size):
+            self.upload()
+        if not stop and now >= self.prefetch_at and now >= self.retry_at:
+            self.prefetch()
+
+    def _wait_time(self):
+        """Seconds until the next upload or prefetch is due"""
+        due = self.prefetch_at
+        if self.flush_at is not None:
+            due = min(due, self.flush_at)
+        return max(0.0, max(due, self.retry_at) - self.clock())
+
+    def _collect(self, timeout):
+        """Queued events (waiting up to timeout for the first), and whether to stop"""
+        events = []
+        try:
+            entry = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return events, False
+        while entry is not None:
+            events.append(entry)
+            try:
+                entry = self.queue.get_nowait()
+            except queue.Empty:
+                return events, False
+        return events, True
+
+    def upload(self):
+        """Send the outbox in batches until it is empty or the backend fails"""
+        while self.outbox.pending:
+            last_seq, events = self.outbox.peek(self.batch_size)
+            if last_seq is None:
+                break
+            try:
+                self.client.post("/events", {"kiosk": self.kiosk_id, "events": events})
+            except BackendError as e:
+                self._failed(e)
+                return False
+            self.outbox.remove(last_seq)
+            self.uploaded += len(events)
+            self._succeeded()
+        self.flush_at = None
+        return True
+
+    def prefetch(self):
+        """Download the day's prescriptions into the store (unless unchanged)"""
+        headers = {"If-None-Match": self.etag} if self.etag else None
+        try:
+            status, response_headers, body = self.client.get(
+                "/prescriptions", {"date": date.today().isoformat(), "kiosk": self.kiosk_id},
+                headers)
+        except BackendError as e:
+            self._failed(e)
+            return False
+        self._succeeded()
+        self.prefetch_at = self.clock() + self.prefetch_interval
+        if status == 304:
+            return True
+        try:
+            patients = prescription_list(body)
+        except BackendError as e:
+            # The backend is up but sent something unusable - keep the prescriptions we have
+            print(f"⚠️ Prescriptions not updated: {e}")
+            self.last_error = str(e)
+            return False
+        for patient in patients:
+            for dose in patient.get("doses", []):
+                if dose.get("channel") is None:
+                    dose["channel"] = self.channels.get(dose["medication"])
+        self.store.replace_patients(patients)
+        self.store.load_shift("00:00", "23:59")     # warm the cache here, not on the UI thread
+        self.etag = response_headers.get("ETag")
+        self.prefetched += 1
+        if self.on_update is not None:
+            self.on_update(len(patients))
+        return True
+
+    def _succeeded(self):
+        if self.online is not True:
+            print(f"🌐 Backend online ({self.client.host}:{self.client.port})")
+        self.online = True
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def _failed(self, error):
+        if self.online is not False:
+            print(f"⚠️ Backend unavailable, working offline: {error}")
+        self.online = False
+        self.last_error = str(error)
+        self.failures += 1
+        self.retry_at = self.clock() + min(self.retry_max, 2 ** (self.failures - 1))
+
+
+def start_backend(store, event_log, engine):
+    """BackendSync for a kiosk: uploads event_log's dispense events and posts a
+    "prescriptions" engine event when new prescriptions arrived. None when
+    JAVA_API_URL is not set."""
+    if not JAVA_API_URL:
+        return None
+    sync = BackendSync(store, on_update=lambda patients: engine.emit("prescriptions",
+                                                                     patients=patients))
+    event_log.add_listener(sync.put)
+    return sync.start()
@@ -0,0 +1,258 @@
+"""
+Local stand-in for the Java backend
+
+Serves the API that backend.BackendClient talks to, so the kiosk can be
+run and tested without the software team's service:
+
+    python -m Firmware.backend_stub serve [--port 8080] [--fail-rate 0.2]
+    python -m Firmware.backend_stub check [--events 2000]
+
+serve answers the kiosk (point JAVA_API_URL at it - the default already
+is localhost:8080). check runs a BackendSync against a stub on a free
+port: prefetch, events uploaded in batches, the backend going down and
+coming back, the kiosk restarting with events still in the outbox -
+and verifies every event arrived exactly once.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .prescription_store import DEMO_PATIENTS
+
+
+def demo_prescriptions():
+    return [{"id": patient_id, "name": name, "room": room,
+             "doses": [{"medication": medication, "pills": pills, "channel": channel, "due": due,
+                        "instructions": instructions}
+                       for medication, pills, channel, due, instructions in doses]}
+            for patient_id, name, room, doses in DEMO_PATIENTS]
+
+
+class StubBackend:
+    def __init__(self, host="127.0.0.1", port=0, patients=None, fail_rate=0.0, latency=0.0,
+                 prefix="/api", seed=None):
+        self.patients = patients if patients is not None else demo_prescriptions()
+        self.fail_rate = fail_rate      # share of requests answered 503
+        self.latency = latency          # seconds added to every request
+        self.prefix = prefix
+        self.down = False               # answer everything 503 (backend outage)
+        self.rng = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.events = {}                # event id -> event
+        self.notifications = []
+        self.duplicates = 0             # events received again after a lost reply
+        self.batches = 0
+        self.requests = 0
+        self.connections = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="backend-stub",
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def body(self):
+        return json.dumps({"patients": self.patients}).encode()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive
+
+            def setup(self):
+                super().setup()
+                # Headers and body are separate writes; don't let Nagle hold the body back
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def route(self):
+                with stub.lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlsplit(self.path)
+                if not url.path.startswith(stub.prefix):
+                    return self.reply(404)
+                if stub.down or stub.rng.random() < stub.fail_rate:
+                    return self.reply(503)
+                return url.path[len(stub.prefix):], parse_qs(url.query)
+
+            def do_GET(self):
+                routed = self.route()
+                if routed is None:
+                    return
+                path, query = routed
+                if path == "/health":
+                    return self.reply(200, b'{"status": "ok"}')
+                if path != "/prescriptions":
+                    return self.reply(404)
+                body = stub.body()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self.reply(304, headers={"ETag": etag})
+                self.reply(200, body, {"ETag": etag})
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                routed = self.route()
+                if routed is None:
+                    return
+                path, query = routed
+                if path == "/notifications":
+                    with stub.lock:
+                        stub.notifications.append(json.loads(data))
+                    return self.reply(200, b'{"status": "ok"}')
+                if path != "/events":
+                    return self.reply(404)
+                events = json.loads(data).get("events", [])
+                with stub.lock:
+                    stub.batches += 1
+                    for event in events:
+                        if event["id"] in stub.events:
+                            stub.duplicates += 1
+                        stub.events[event["id"]] = event
+                self.reply(200, json.dumps({"accepted": len(events)}).encode())
+
+        return Handler
+
+    def report(self):
+        return {"requests": self.requests, "connections": self.connections,
+                "batches": self.batches, "events": len(self.events),
+                "duplicates": self.duplicates, "notifications": len(self.notifications)}
+
+
+# --- Self-check ---
+
+def check(args):
+    from .backend import BackendClient, BackendSync, Outbox
+    from .event_log import EventLog
+    from .prescription_store import PrescriptionStore
+
+    directory = tempfile.mkdtemp(prefix="backend-check-")
+    outbox_path = os.path.join(directory, "outbox.db")
+    stub = StubBackend(fail_rate=args.fail_rate, seed=args.seed).start()
+    store = PrescriptionStore(":memory:")
+    updates = []
+
+    def kiosk():
+        log = EventLog()
+        sync = BackendSync(store, BackendClient(stub.url, timeout=1), Outbox(outbox_path),
+                           on_update=updates.append, flush_interval=0.05, retry_max=0.2)
+        log.add_listener(sync.put)
+        return log, sync.start()
+
+    log, sync = kiosk()
+    started = time.perf_counter()
+    slowest = 0.0
+    sent = 0
+
+    def log_events(count):
+        nonlocal sent, slowest
+        for _ in range(count):
+            t = time.perf_counter()
+            log.event("dispensed", "Vitamin D dispensed (1/2)", patient_id="001", seq=sent)
+            slowest = max(slowest, time.perf_counter() - t)
+            sent += 1
+            if sent % 50 == 0:
+                time.sleep(0.01)
+
+    log_events(args.events // 4)
+    print("🔌 Backend down")
+    stub.down = True
+    log_events(args.events // 4)
+    time.sleep(0.3)
+    offline_pending = sync.outbox.pending
+    print(f"   {offline_pending} event(s) held in the outbox")
+    print("🔁 Kiosk restart while the backend is down")
+    sync.stop()
+    log, sync = kiosk()
+    log_events(args.events // 4)
+    print("🔌 Backend back")
+    stub.down = False
+    log_events(args.events - sent)
+    deadline = time.monotonic() + 10
+    while len(stub.events) < sent and time.monotonic() < deadline:
+        time.sleep(0.05)
+    sync.stop()
+    stub.stop()
+    wall = time.perf_counter() - started
+
+    server = stub.report()
+    client = sync.client.stats()
+    print(f"🧪 {sent} events logged, {server['events']} received by the backend "
+          f"({server['duplicates']} duplicate(s) de-duplicated) in {wall:.2f}s")
+    print(f"   {server['batches']} batch(es), {server['requests']} request(s) over "
+          f"{server['connections']} connection(s); slowest log call "
+          f"{slowest * 1e6:.0f}us")
+    print(f"   prescriptions prefetched {len(updates)}x, "
+          f"{len(store.schedule())} dose time(s) in the store")
+    ok = server["events"] == sent and offline_pending > 0 and updates
+    print("✅ All events delivered exactly once" if ok else "❌ Events lost")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Java backend")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    serve_parser = modes.add_parser("serve", help="answer the kiosk until Ctrl+C")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    check_parser = modes.add_parser("check", help="outage / restart test of the kiosk client")
+    check_parser.add_argument("--events", type=int, default=2000)
+    for mode in (serve_parser, check_parser):
+        mode.add_argument("--fail-rate", type=float, default=0.0,
+                          help="share of requests answered 503")
+        mode.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.mode == "check":
+        return check(args)
+    stub = StubBackend(args.host, args.port, fail_rate=args.fail_rate, seed=args.seed)
+    print(f"🧪 Stub backend on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
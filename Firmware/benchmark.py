@@ -0,0 +1,177 @@
+"""
+Dispense-cycle benchmark
+
+Runs many simulated prescriptions (hardware.simulator, virtual time) and
+reports latency percentiles, so changes to the motion or detection code
+can be compared between commits:
+
+    time per pill, attempts per pill, time to first pill, total time
+
+Both targets run DispenseController.dispense, the entry the kiosks call:
+    pillwheel   all medications in one call, the channels overlapped - as
+                the kiosks run it
+    serial      one call per medication, one channel after another (the
+                old sequential dispensing, for comparison)
+
+Usage:
+    python -m Firmware.benchmark --runs 2000 --jam-rate 0.05 --miss-rate 0.02 --json bench.json
+    python -m Firmware.benchmark --health --hopper 2     # learned retry policy, hoppers run out
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import time
+
+from hardware.simulator import SimulatedDispenser
+
+from .channel_health import HealthMonitor
+
+# Same prescription as main_dual_servo: name -> (PCA9685 channel, pills)
+DEFAULT_PRESCRIPTION = {"Vitamin D": (0, 2), "Vitamin C": (1, 1)}
+
+
+def percentiles(values):
+    """p50/p95/p99/mean/max of a list (linear interpolation)"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        pos = (len(ordered) - 1) * q
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    return {
+        "count": len(ordered),
+        "p50": round(pick(0.50), 4),
+        "p95": round(pick(0.95), 4),
+        "p99": round(pick(0.99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class Stats:
+    def __init__(self):
+        self.pill_times = []
+        self.attempts = []
+        self.first_pill = []
+        self.totals = []
+        self.successes = 0
+        self.runs = 0
+
+    def add_run(self, success, total, pills):
+        """pills: list of (finished_at, seconds_for_pill, attempts)"""
+        self.runs += 1
+        self.successes += bool(success)
+        self.totals.append(total)
+        if pills:
+            self.first_pill.append(min(p[0] for p in pills))
+        for finished_at, seconds, attempts in pills:
+            self.pill_times.append(seconds)
+            self.attempts.append(attempts)
+
+    def report(self, wall_time):
+        return {
+            "runs": self.runs,
+            "success_rate": round(self.successes / max(self.runs, 1), 4),
+            "time_per_pill_s": percentiles(self.pill_times),
+            "attempts_per_pill": percentiles(self.attempts),
+            "time_to_first_pill_s": percentiles(self.first_pill),
+            "total_time_s": percentiles(self.totals),
+            "runs_per_second": round(self.runs / wall_time, 1) if wall_time else None,
+        }
+
+
+def bench_pillwheel(runs, prescription, seed, serial=False, health=False, **hardware_options):
+    monitor = HealthMonitor(path=None) if health else None
+    dispenser = SimulatedDispenser(seed=seed, health=monitor, **hardware_options)
+    stats = Stats()
+    for _ in range(runs):
+        result = dispenser.run(prescription, serial=serial)
+        last_pill = {name: 0.0 for name in prescription}
+        last_attempt = {}
+        pills = []
+        for t, kind, data in result["events"]:
+            if kind == "attempt":
+                last_attempt[data["name"]] = data["attempt"]
+            elif kind == "dispensed":
+                name = data["name"]
+                pills.append((t, t - last_pill[name], last_attempt.get(name, 1)))
+                last_pill[name] = t
+        stats.add_run(result["success"], result["duration"], pills)
+    return stats
+
+
+def bench_serial(runs, prescription, seed, health=False, **hardware_options):
+    return bench_pillwheel(runs, prescription, seed, True, health, **hardware_options)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulated dispense cycles")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drop-prob", type=float, default=0.9,
+                        help="chance a sweep releases a pill")
+    parser.add_argument("--jam-rate", type=float, default=0.0,
+                        help="chance a sweep jams the wheel")
+    parser.add_argument("--miss-rate", type=float, default=0.0,
+                        help="chance the sensor does not see a falling pill")
+    parser.add_argument("--outlier-rate", type=float, default=0.0,
+                        help="chance a sensor reading is a 10-40mm outlier")
+    parser.add_argument("--drift", type=float, default=0.0,
+                        help="mm/s the empty-tray reading drifts")
+    parser.add_argument("--hopper", type=int, default=None,
+                        help="pills in each hopper per run (default unlimited)")
+    parser.add_argument("--health", action="store_true",
+                        help="learn channel health across runs (retry policy uses it)")
+    parser.add_argument("--target", choices=("pillwheel", "serial", "both"), default="both")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    options = dict(drop_prob=args.drop_prob, jam_rate=args.jam_rate, miss_rate=args.miss_rate,
+                   outlier_rate=args.outlier_rate, drift=args.drift, pills=args.hopper,
+                   health=args.health)
+    targets = ("pillwheel", "serial") if args.target == "both" else (args.target,)
+    benches = {"pillwheel": bench_pillwheel, "serial": bench_serial}
+
+    output = {
+        "revision": git_revision(),
+        "config": dict(options, runs=args.runs, seed=args.seed,
+                       prescription={name: list(v) for name, v in DEFAULT_PRESCRIPTION.items()}),
+        "results": {},
+    }
+    for target in targets:
+        started = time.perf_counter()
+        stats = benches[target](args.runs, DEFAULT_PRESCRIPTION, args.seed, **options)
+        report = stats.report(time.perf_counter() - started)
+        output["results"][target] = report
+
+        print(f"\n{target}  ({report['runs']} runs, {report['runs_per_second']} runs/s, "
+              f"success {report['success_rate']:.1%})")
+        for metric in ("time_per_pill_s", "attempts_per_pill", "time_to_first_pill_s",
+                       "total_time_s"):
+            values = report[metric]
+            if values["count"]:
+                print(f"  {metric:<22} p50 {values['p50']:>7.3f}  p95 {values['p95']:>7.3f}  "
+                      f"p99 {values['p99']:>7.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Channel health and retry policy
+
+Every pill a channel is asked for ends as a "try": the attempt it dropped
+on, or minus the attempts made if the channel gave up. The last
+CHANNEL_HEALTH_WINDOW tries per servo channel are kept (and saved to
+CHANNEL_HEALTH_FILE), which gives
+
+    p_attempt(k)     chance attempt k drops a pill, given k-1 misses
+    miss_rate        misses per attempt while the channel works (pills that
+                     dropped in the end) - empty-hopper episodes are left out
+    p_empty          how often a pill ended with the channel giving up
+    mean_attempts    attempts per dispensed pill
+    streak           misses in a row right now (carried across doses)
+    retries          how often each retry move has dropped a pill
+
+RetryPolicy uses them to pick the next move for a channel:
+
+    sweep     the normal dispense sweep
+    wiggle    rock the wheel (JAM_WIGGLE_ANGLE) before sweeping, to free a
+              jam. Which of the two a retry uses is learned per channel:
+              each is tried until it has RETRY_MIN_SAMPLES outcomes, then
+              the one with more pills per second of retry wins - wiggling
+              pays off on channels that jam, plain sweeps on ones that
+              just miss now and then
+    give_up   MAX_ROTATES reached; or, given the miss streak, the chance
+              the channel still works is below EMPTY_GIVE_UP_PROB - weighing
+              miss_rate ** streak against p_empty, so channels that often
+              run empty are given up on sooner than ones that never do. The
+              streak carries across doses, so after a channel has given up
+              one probe is enough; otherwise at least three attempts are made.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+from config.hardware_config import (CHANNEL_HEALTH_FILE, CHANNEL_HEALTH_WINDOW,
+                                    EMPTY_GIVE_UP_PROB, HEALTH_MIN_TRIES, MAX_ROTATES,
+                                    RETRY_MIN_SAMPLES)
+
+RETRY_ACTIONS = ("sweep", "wiggle")
+
+
+class ChannelHealth:
+    def __init__(self, channel, window=CHANNEL_HEALTH_WINDOW, tries=(), streak=0,
+                 longest_streak=0, retries=None):
+        self.channel = channel
+        self.tries = deque(tries, maxlen=window)    # attempt a pill dropped on, -attempts = gave up
+        self.streak = streak                        # consecutive misses, across doses
+        self.longest_streak = longest_streak
+        self.retries = {action: [0, 0] for action in RETRY_ACTIONS}  # action -> [tried, dropped]
+        self.retries.update(retries or {})
+
+    def record_attempt(self, success):
+        if success:
+            self.streak = 0
+        else:
+            self.streak += 1
+            self.longest_streak = max(self.longest_streak, self.streak)
+
+    def record_retry(self, action, success):
+        """Outcome of a retry (an attempt after a miss) made with `action`"""
+        self.retries[action][0] += 1
+        self.retries[action][1] += bool(success)
+
+    def retry_success(self, action):
+        """Chance a retry with `action` drops a pill (smoothed)"""
+        tried, dropped = self.retries[action]
+        return (dropped + 1) / (tried + 2)
+
+    def record_try(self, attempts, success):
+        """A pill finished: dropped on attempt `attempts`, or the channel gave up after them"""
+        self.tries.append(attempts if success else -attempts)
+
+    def reset(self):
+        """Hopper refilled / jam cleared by staff"""
+        self.streak = 0
+
+    @property
+    def trusted(self):
+        return len(self.tries) >= HEALTH_MIN_TRIES
+
+    def p_attempt(self, k):
+        reached = [a for a in self.tries if abs(a) >= k]
+        if not reached:
+            return None
+        return sum(1 for a in reached if a == k) / len(reached)
+
+    @property
+    def miss_rate(self):
+        """Misses per attempt for pills that dropped (smoothed, so never 0)"""
+        attempts = sum(a for a in self.tries if a > 0)
+        pills = sum(1 for a in self.tries if a > 0)
+        return (attempts - pills + 1) / (attempts + 2)
+
+    @property
+    def p_empty(self):
+        """Share of pills the channel gave up on (smoothed)"""
+        return (sum(1 for a in self.tries if a < 0) + 1) / (len(self.tries) + 2)
+
+    def p_working(self, streak):
+        """Chance the channel still works after `streak` misses in a row"""
+        working = (1 - self.p_empty) * self.miss_rate ** streak
+        return working / (working + self.p_empty)
+
+    @property
+    def mean_attempts(self):
+        pills = [a for a in self.tries if a > 0]
+        return sum(pills) / len(pills) if pills else None
+
+    def summary(self):
+        p1 = self.p_attempt(1)
+        return {
+            "channel": self.channel,
+            "tries": len(self.tries),
+            "p_first_attempt": None if p1 is None else round(p1, 3),
+            "mean_attempts": None if self.mean_attempts is None else round(self.mean_attempts, 2),
+            "gave_up": sum(1 for a in self.tries if a < 0),
+            "streak": self.streak,
+            "longest_streak": self.longest_streak,
+            "retries": {action: {"tried": tried, "dropped": dropped}
+                        for action, (tried, dropped) in self.retries.items()},
+        }
+
+    def to_dict(self):
+        return {"tries": list(self.tries), "streak": self.streak,
+                "longest_streak": self.longest_streak, "retries": self.retries}
+
+
+class HealthMonitor:
+    """ChannelHealth per servo channel, persisted as JSON (path=None keeps it in memory)"""
+
+    def __init__(self, path=CHANNEL_HEALTH_FILE, window=CHANNEL_HEALTH_WINDOW):
+        self.path = path
+        self.window = window
+        self.channels = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for channel, data in json.load(f).items():
+                        self.channels[int(channel)] = ChannelHealth(int(channel), window, **data)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"⚠️ Channel health not loaded: {e}")
+
+    def get(self, channel):
+        with self.lock:
+            if channel not in self.channels:
+                self.channels[channel] = ChannelHealth(channel, self.window)
+            return self.channels[channel]
+
+    def reset(self, channel=None):
+        """Staff refilled / cleared a channel (all channels by default)"""
+        for number, health in self.channels.items():
+            if channel is None or number == channel:
+                health.reset()
+
+    def summary(self):
+        return {channel: health.summary() for channel, health in sorted(self.channels.items())}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {str(channel): health.to_dict() for channel, health in self.channels.items()}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
+
+
+class RetryPolicy:
+    def __init__(self, give_up_prob=EMPTY_GIVE_UP_PROB, min_attempts=3,
+                 min_samples=RETRY_MIN_SAMPLES):
+        self.give_up_prob = give_up_prob
+        self.min_attempts = min_attempts            # attempts before giving up early
+        self.min_samples = min_samples              # retries per action before comparing them
+
+    def next_action(self, health, misses, max_attempts=MAX_ROTATES, costs=None):
+        """(action, reason) for the next attempt after `misses` misses on this pill.
+
+        health is the channel's ChannelHealth (None: plain sweeps up to
+        max_attempts). costs maps each retry action to its seconds.
+        """
+        if misses >= max_attempts:
+            return "give_up", "max_attempts"
+        if misses == 0 or health is None:
+            return "sweep", None
+        carried = health.streak > misses    # misses left over from an earlier dose
+        if (health.trusted and (carried or misses >= self.min_attempts)
+                and health.p_working(health.streak) < self.give_up_prob):
+            return "give_up", "empty"
+
+        untried = [action for action in RETRY_ACTIONS
+                   if health.retries[action][0] < self.min_samples]
+        if untried:
+            return min(untried, key=lambda action: health.retries[action][0]), "learning"
+        costs = costs or {"sweep": 1.0, "wiggle": 1.0}
+        best = max(RETRY_ACTIONS, key=lambda action: health.retry_success(action) / costs[action])
+        return best, "learned"
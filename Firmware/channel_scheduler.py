@@ -0,0 +1,317 @@
+"""
+Multi-channel dispense scheduler
+
+Drives several PCA9685 servo channels at once instead of finishing one
+medication before starting the next. Each attempt on a channel is a
+timed cycle:
+
+    out     sweep 0° → DISPENSE_SWEEP_ANGLE (the pill is released at the end)
+    back    sweep back to 0°
+    settle  wait for the pill to land
+    detect  sample the ToF sensor
+
+The part of the cycle from the end of the out sweep to the end of detect
+is the channel's detection window. Channels that share a sensor never
+have overlapping windows, so a reading is always attributed to the right
+channel; the next channel's out sweep is started early so that its pill
+is released just as the previous window closes. Channels with their own
+sensor run fully in parallel.
+
+With a HealthMonitor every attempt feeds the channel's statistics, and
+before each retry the RetryPolicy (channel_health) picks the move from
+them: a normal sweep, a wiggle first (the wheel is rocked at the home
+position, where nothing can drop) when that frees this channel's jams,
+or giving up early when the channel looks empty. Without one, a channel
+simply sweeps until MAX_ROTATES attempts.
+
+A job with a streaming DropDetector (fed by hardware.tof_sensor.ToFSampler)
+skips the settle/detect polling: it watches the detector from the moment
+the pill is released and finishes its window as soon as the drop is seen.
+If the job has more pills to go, the return sweep is aborted there too
+(early exit): the pill is already out, so the next out sweep starts from
+the angle the wheel reached instead of from 0°.
+A polled job compares its samples against a BaselineTracker per sensor,
+kept up to date from the samples themselves, so no extra read is taken
+per attempt and slow drift (pills piling up in the tray) is followed.
+
+The scheduler never blocks on a servo move - it starts the move on the
+channel's motion profile and wakes up when the profile says the move is
+done - so the loop only runs when some channel has something to do.
+run() drives it with a sleep function; begin()/step() let a caller
+interleave it with other work instead.
+"""
+
+import time
+
+from config.hardware_config import (DISPENSE_SWEEP_ANGLE, JAM_WIGGLE_ANGLE, JAM_WIGGLES,
+                                    MAX_ROTATES, PILL_SETTLE_TIME)
+from hardware.tracing import tracer
+
+from .channel_health import RetryPolicy
+from .detection import BaselineTracker, pill_detected
+
+DETECT_TIME = 1.0    # seconds of sensor sampling per attempt
+SAMPLE_PERIOD = 0.1  # seconds between sensor reads
+CONFIRM_TIME = 0.1   # streaming mode: extra time for the detector to confirm a drop
+
+
+class ChannelJob:
+    """One medication on one servo channel"""
+
+    def __init__(self, name, motion, required, sensor, detector=None, max_attempts=MAX_ROTATES):
+        self.name = name
+        self.motion = motion        # hardware.motion.ServoMotion for the channel
+        self.required = required
+        self.sensor = sensor        # callable returning distance in mm
+        self.detector = detector    # detection.DropDetector fed by a ToFSampler, optional
+        self.max_attempts = max_attempts
+
+        self.dispensed = 0
+        self.attempts = 0           # attempts on the current pill
+        self.failed = False
+        self.wiggled = False        # the current attempt started with a wiggle
+        self.retry_action = None    # move the current attempt used, if it is a retry
+        self.clear_moves = []
+
+        self.phase = "idle"
+        self.next_time = 0.0        # when this job next needs attention
+        self.attempt_started = 0.0
+        self.window_open = 0.0
+        self.window_end = 0.0
+        self.baseline = None
+        self.samples = []
+        self.sample_times = []
+
+    @property
+    def finished(self):
+        return self.failed or self.dispensed >= self.required
+
+
+class ChannelScheduler:
+    def __init__(self, jobs, emit=None, clock=time.monotonic, recorder=None, verbose=True,
+                 health=None, policy=None, baselines=None):
+        self.jobs = jobs
+        self.emit = emit or (lambda kind, **data: None)
+        self.clock = clock
+        self.recorder = recorder    # trace_recorder.TraceRecorder, optional
+        self.health = health        # channel_health.HealthMonitor, optional
+        self.policy = policy or RetryPolicy()
+        self.verbose = verbose      # print per-attempt progress
+        self.sensor_free_at = {}    # sensor -> time its current window closes
+        # sensor -> BaselineTracker for polled detection; pass the same dict
+        # to the next scheduler to keep the baselines across runs
+        self.baselines = {} if baselines is None else baselines
+        self.result = None          # True/False once step() reports finished
+
+    def run(self, sleep):
+        """Run all jobs to completion. Returns True if every pill was dispensed.
+
+        sleep(seconds) must return False to abort (e.g. engine.sleep).
+        """
+        delay = self.begin()
+        while delay is not None:
+            if not sleep(delay):
+                return False
+            delay = self.step()
+        return self.result
+
+    def begin(self):
+        """Home every channel (without waiting). Returns seconds until step() is due."""
+        self.result = None
+        homing = max([job.motion.start_move(0) for job in self.jobs], default=0.0)
+        for job in self.jobs:
+            job.next_time = self.clock() + homing
+        return homing
+
+    def step(self):
+        """Advance every job that is due - never blocks.
+
+        Returns seconds until the next call is needed, or None when finished
+        (self.result is then True if every pill was dispensed).
+        """
+        now = self.clock()
+        for job in self.jobs:
+            if not job.finished and now >= job.next_time:
+                self._step(job, now)
+
+        if any(job.failed for job in self.jobs):
+            self.result = False
+            return None
+        pending = [job for job in self.jobs if not job.finished]
+        if not pending:
+            self.result = True
+            return None
+        return max(0.0, min(job.next_time for job in pending) - self.clock())
+
+    def _step(self, job, now):
+        if job.phase == "idle":
+            self._start_attempt(job, now)
+        elif job.phase == "clear":
+            if job.clear_moves:
+                job.next_time = now + job.motion.start_move(job.clear_moves.pop(0))
+            else:
+                self._reserve_window(job, now)
+        elif job.phase == "wait":
+            job.phase = "out"
+            job.next_time = now + job.motion.start_move(DISPENSE_SWEEP_ANGLE)
+        elif job.phase == "out" and job.detector is not None:
+            job.window_open = now
+            job.motion.start_move(0)
+            job.phase = "watch"
+            self._watch(job, now)
+        elif job.phase == "out":
+            job.window_open = now
+            job.baseline = self._baseline(job)
+            job.phase = "back"
+            job.next_time = now + job.motion.start_move(0)
+        elif job.phase == "back":
+            job.phase = "settle"
+            job.next_time = now + PILL_SETTLE_TIME
+            tracer.record("pill_settle", "dispense", tracer.clock(), PILL_SETTLE_TIME)
+        elif job.phase == "settle":
+            job.phase = "detect"
+            job.samples = []
+            job.sample_times = []
+            job.next_time = now
+            self._sample(job, now)
+        elif job.phase == "detect":
+            self._sample(job, now)
+        elif job.phase == "watch":
+            self._watch(job, now)
+
+    def _health(self, job):
+        return self.health.get(job.motion.channel) if self.health is not None else None
+
+    def _start_attempt(self, job, now):
+        health = self._health(job)
+        action, reason = self.policy.next_action(health, job.attempts, job.max_attempts,
+                                                 self._retry_costs(job))
+        if action == "give_up":
+            if self.verbose:
+                print(f"\n❌ {'MAX ATTEMPTS' if reason == 'max_attempts' else 'EMPTY'} "
+                      f"for {job.name} after {job.attempts} attempt(s)")
+            job.failed = True
+            if health is not None:
+                health.record_try(job.attempts, False)
+            self.emit("max_attempts", name=job.name, reason=reason, attempts=job.attempts)
+            return
+
+        job.attempts += 1
+        job.attempt_started = now
+        job.retry_action = action if job.attempts > 1 else None
+        job.wiggled = action == "wiggle"
+        self.emit("attempt", name=job.name, attempt=job.attempts,
+                  count=job.dispensed, target=job.required, action=action)
+        if self.verbose:
+            print(f"   🔄 {job.name}: attempt {job.attempts}/{job.max_attempts} "
+                  f"({job.dispensed}/{job.required}){' - wiggling' if job.wiggled else ''}")
+
+        if job.wiggled:
+            job.clear_moves = [JAM_WIGGLE_ANGLE, 0] * JAM_WIGGLES
+            job.phase = "clear"
+            job.next_time = now + job.motion.remaining()
+            return
+        self._reserve_window(job, now)
+
+    def _retry_costs(self, job):
+        """Seconds a retry takes with each move (a wiggle adds its rocks to a sweep)"""
+        motion = job.motion
+        sweep = (motion.move_time(DISPENSE_SWEEP_ANGLE, start=0) * 2 + PILL_SETTLE_TIME
+                 + (CONFIRM_TIME if job.detector is not None else DETECT_TIME))
+        wiggle = motion.move_time(JAM_WIGGLE_ANGLE, start=0) * 2 * JAM_WIGGLES
+        return {"sweep": sweep, "wiggle": sweep + wiggle}
+
+    def _reserve_window(self, job, now):
+        # Reserve this channel's detection window on its sensor (the out sweep
+        # starts wherever the last move leaves the wheel)
+        out_time = job.motion.move_time(DISPENSE_SWEEP_ANGLE)
+        back_time = job.motion.move_time(0, start=DISPENSE_SWEEP_ANGLE)
+        hold = CONFIRM_TIME if job.detector is not None else DETECT_TIME
+        earliest = now + job.motion.remaining() + out_time
+        window_start = max(earliest, self.sensor_free_at.get(job.sensor, 0.0))
+        job.window_end = window_start + back_time + PILL_SETTLE_TIME + hold
+        self.sensor_free_at[job.sensor] = job.window_end
+
+        job.phase = "wait"
+        job.next_time = window_start - out_time
+        if job.next_time <= now:
+            self._step(job, now)
+
+    def _sample(self, job, now):
+        job.samples.append(job.sensor())
+        job.sample_times.append(now - job.window_open)
+        if now + SAMPLE_PERIOD < job.window_end:
+            job.next_time = now + SAMPLE_PERIOD
+            return
+
+        detected = pill_detected(job.samples, job.baseline)
+        if self.verbose:
+            print(f"   📏 {job.name}: baseline {job.baseline:.0f}mm, "
+                  f"range {min(job.samples):.0f} - {max(job.samples):.0f}mm "
+                  f"{'✅ DETECTED' if detected else '❌ NOT DETECTED'}")
+        if self.recorder is not None:
+            self.recorder.record(job.name, job.sample_times, job.samples, job.baseline, detected)
+        self._track_baseline(job, detected)
+        self._finish_attempt(job, now, now if detected else None)
+
+    def _baseline(self, job):
+        """Current empty-tray distance for the job's sensor (only reads it before the first window)"""
+        tracker = self.baselines.setdefault(job.sensor, BaselineTracker())
+        while not tracker.ready:
+            tracker.update(job.sensor())
+        return tracker.value
+
+    def _track_baseline(self, job, detected):
+        """Update the sensor's baseline from the window just sampled"""
+        tracker = self.baselines[job.sensor]
+        if not detected:
+            for distance in job.samples:
+                tracker.update(distance)
+            return
+        # A pill landed: the tray is a little higher once the readings settle
+        tail = job.samples[-3:]
+        if max(tail) - min(tail) < tracker.delta:
+            tracker.reset(sorted(tail)[len(tail) // 2])
+
+    def _watch(self, job, now):
+        """Streaming mode: check the detector until the drop is seen or the window closes"""
+        seen_at = job.detector.detected_since(job.window_open)
+        if seen_at is None and now < job.window_end:
+            job.next_time = min(now + SAMPLE_PERIOD, job.window_end)
+            return
+
+        if seen_at is not None:
+            if self.verbose:
+                print(f"   📏 {job.name}: ✅ DETECTED {seen_at - job.window_open:.2f}s after release")
+            if job.dispensed + 1 < job.required:
+                job.motion.stop()   # early exit: abort the return sweep
+            # Hand the rest of the window back to the sensor
+            if self.sensor_free_at.get(job.sensor) == job.window_end:
+                self.sensor_free_at[job.sensor] = now
+        elif self.verbose:
+            print(f"   📏 {job.name}: ❌ NOT DETECTED")
+        if self.recorder is not None:
+            self.recorder.record_window(job.name, job.window_open, now, seen_at is not None)
+        self._finish_attempt(job, now, seen_at)
+
+    def _finish_attempt(self, job, now, seen_at):
+        detected = seen_at is not None
+        tracer.record_since("detect_window", "dispense", now - job.window_open,
+                            channel=job.name, detected=detected)
+        tracer.record_since("attempt", "dispense", now - job.attempt_started,
+                            channel=job.name, attempt=job.attempts, detected=detected)
+        health = self._health(job)
+        if health is not None:
+            health.record_attempt(seen_at is not None)
+            if job.retry_action is not None:
+                health.record_retry(job.retry_action, seen_at is not None)
+            if seen_at is not None:
+                health.record_try(job.attempts, True)
+        if seen_at is not None:
+            job.dispensed += 1
+            job.attempts = 0
+            self.emit("dispensed", name=job.name, count=job.dispensed,
+                      target=job.required, t=seen_at)
+        job.phase = "idle"
+        job.next_time = now
+
@@ -0,0 +1,134 @@
+"""
+Pill drop detection rules for the ToF sensor
+"""
+
+import threading
+from collections import deque
+from statistics import median
+
+# A pill is detected when the reading moves this far from the baseline...
+DETECT_DELTA_MM = 5
+# ...or when the readings in the window spread by at least this much
+DETECT_VARIATION_MM = 8
+# Streaming detector: readings in the sliding window, and consecutive readings
+# off the baseline that confirm a drop edge
+DETECT_WINDOW = 8
+DETECT_CONFIRM = 2
+# Weight of each quiet reading in the running baseline (~0.4 s time constant at 50 Hz)
+BASELINE_ALPHA = 0.05
+
+
+def pill_detected(samples, baseline, delta=DETECT_DELTA_MM, variation=DETECT_VARIATION_MM):
+    """Return True if the distance samples show a pill drop against the baseline"""
+    if not samples:
+        return False
+    min_dist = min(samples)
+    max_dist = max(samples)
+    return (abs(min_dist - baseline) >= delta or
+            abs(max_dist - baseline) >= delta or
+            max_dist - min_dist >= variation)
+
+
+class BaselineTracker:
+    """Running estimate of the distance to the empty tray.
+
+    Starts from the median of the first `warmup` readings rather than one
+    noisy read, then follows slow drift with an EWMA over quiet readings
+    (within `delta` of the estimate). Readings further off - a falling
+    pill, an outlier - are ignored; a lasting step such as the tray level
+    rising as pills pile up is adopted with reset().
+    """
+
+    def __init__(self, alpha=BASELINE_ALPHA, warmup=5, delta=DETECT_DELTA_MM):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.delta = delta
+        self.value = None
+        self.pending = []
+
+    @property
+    def ready(self):
+        return self.value is not None
+
+    def update(self, distance):
+        """Take one reading into account. Returns the baseline (None while warming up)."""
+        if self.value is None:
+            self.pending.append(distance)
+            if len(self.pending) >= self.warmup:
+                self.value = median(self.pending)
+                self.pending = []
+        elif abs(distance - self.value) < self.delta:
+            self.value += self.alpha * (distance - self.value)
+        return self.value
+
+    def reset(self, value):
+        self.value = value
+        self.pending = []
+
+
+class DropDetector:
+    """Online pill-drop detector fed one reading at a time.
+
+    Keeps a sliding window of recent readings. A drop is reported when
+    `confirm` consecutive readings sit at least `delta` mm from the
+    baseline (drop edge), or when the window spreads by `variation` mm
+    leaving out its `confirm` - 1 highest and lowest readings - so one
+    outlier is not a drop under either rule.
+    The baseline is a BaselineTracker fed from the stream, so it follows
+    slow drift without any extra reads. After a detection the detector
+    re-arms once the readings are steady again and takes their median as
+    the new baseline (the tray is a pill higher).
+    """
+
+    def __init__(self, window=DETECT_WINDOW, confirm=DETECT_CONFIRM, delta=DETECT_DELTA_MM,
+                 variation=DETECT_VARIATION_MM, alpha=BASELINE_ALPHA):
+        self.window = deque(maxlen=window)
+        self.confirm = confirm
+        self.delta = delta
+        self.variation = variation
+
+        self.tracker = BaselineTracker(alpha, delta=delta)
+        self.armed = True
+        self.edge_count = 0
+        self.events = deque(maxlen=64)    # detection timestamps
+        self.lock = threading.Lock()
+
+    def feed(self, t, distance):
+        """Process one reading taken at time t"""
+        with self.lock:
+            self.window.append(distance)
+            if not self.tracker.ready:
+                self.tracker.update(distance)
+                return
+
+            ordered = sorted(self.window)
+            if not self.armed:
+                if len(self.window) == self.window.maxlen and ordered[-1] - ordered[0] < self.delta:
+                    self.tracker.reset(median(self.window))
+                    self.armed = True
+                return
+            trim = min(self.confirm - 1, (len(ordered) - 1) // 2)
+            spread = ordered[-1 - trim] - ordered[trim]
+
+            if abs(distance - self.tracker.value) >= self.delta:
+                self.edge_count += 1
+            else:
+                self.edge_count = 0
+                self.tracker.update(distance)
+
+            if self.edge_count >= self.confirm or spread >= self.variation:
+                self.events.append(t)
+                self.armed = False
+                self.edge_count = 0
+
+    @property
+    def baseline(self):
+        return self.tracker.value
+
+    def detected_since(self, t0):
+        """Time of the first detection at or after t0, or None"""
+        with self.lock:
+            for t in self.events:
+                if t >= t0:
+                    return t
+        return None
@@ -1,35 +1,280 @@
-import hardware.servo_controller
-import hardware.ir_sensor
-
-# Configuration parameters
-max_rotates = 5
-medicine_dispensed = 0
-
-def dispense_all_medicines():
-    global medicine_dispensed
-
-    # Need to import medicine_required from software side
-    while medicine_dispensed < medicine_required:
-        if dispense_individual_medicine():
-            medicine_dispensed += 1
-        else:
-            return False
-    return True
-
-def dispense_individual_medicine():
-    number_of_rotates = 0
-    successful_dispense = False
-
-    # In hardware/servo_controller.py
-    while number_of_rotates < max_rotates and not successful_dispense:
-        hardware.servo_controller.rotate_motor()
-
-        # In hardware/ir_sensor.py
-        ir_sensor_status = hardware.ir_sensor.retrieve_ir_sensor_status()
-    
-        if ir_sensor_status == True:
-            successful_dispense = True
-        else:
-            number_of_rotates += 1
-    
-    return successful_dispense
\ No newline at end of file
+"""
+Dispense controller
+
+The one implementation of "dispense these pills", shared by both kiosk
+UIs, main.py, the simulator and the benchmark. Hardware is injected:
+
+    servos    anything with servo(channel) returning an object with .angle -
+              HardwareProvider (PCA9685), hardware.servo_controller.MotorController
+              (GPIO pins) or hardware.simulator.SimulatedHardware
+    detector  anything with detected_since(t0) - a DropDetector fed by a
+              ToFSampler (VL53L0X or simulated), or hardware.ir_sensor.IRSensor
+    sensor    distance callable, for polled detection when there is no detector
+
+Medications are mapped to servo channels (MEDICATION_CHANNELS). With a
+StateManager the controller records every attempt and pill, so an
+interrupted dose resumes without re-dispensing; with a HoldingStage the
+pills are collected behind the gate and released together at the end.
+With a HealthMonitor each channel's attempts feed its health statistics,
+which the retry policy uses (see channel_health). With an Inventory every
+detected pill is counted off its carousel, and a dose the carousels can't
+cover is refused before any servo moves (see inventory).
+
+begin()/step() never block - step() says how long until it wants to be
+called again - and dispense() drives them with a sleep function.
+"""
+
+import time
+
+from config.hardware_config import (HOLDING_GATE_CHANNEL, HOLDING_GATE_INSTALLED,
+                                    MEDICATION_CHANNELS, SPARE_CHANNELS,
+                                    TOF_TIMING_BUDGET_US)
+from hardware.holding_stage import HoldingStage
+from hardware.motion import ServoMotion
+from hardware.tof_sensor import ToFSampler
+from hardware.tracing import tracer
+
+from .channel_health import HealthMonitor
+from .channel_scheduler import ChannelJob, ChannelScheduler
+from .detection import DropDetector
+from .inventory import Inventory
+from .trace_recorder import TraceRecorder
+
+
+class DispenseController:
+    def __init__(self, channels=MEDICATION_CHANNELS, sensor=None, detector=None, stage=None,
+                 state=None, recorder=None, clock=time.monotonic, verbose=True, health=None,
+                 inventory=None, spares=None):
+        self.channels = dict(channels)  # medication -> servo channel
+        self.spares = dict(spares or {})    # medication -> more channels holding it
+        self.sensor = sensor
+        self.detector = detector
+        self.stage = stage
+        self.state = state
+        self.recorder = recorder
+        self.health = health            # channel_health.HealthMonitor, optional
+        self.inventory = inventory      # inventory.Inventory, optional
+        self.clock = clock
+        self.verbose = verbose
+        self.motions = {channel: ServoMotion(None, channel, clock=clock)
+                        for channel in sorted({channel for name in self.channels
+                                               for channel in self.holding(name)})}
+        self.sampler = None             # ToFSampler feeding the detector (for_kiosk)
+        self.baselines = {}             # polled detection: sensor -> BaselineTracker
+
+        self.scheduler = None
+        self.phase = "idle"             # idle / dispensing / releasing / closing
+        self.result = None
+        self.released = {}              # what the last release dropped into the tray
+        self.routes = {}                # medication -> channel it is taken from this run
+        self.dose_key = None
+        self.hold = False
+        self.emit = None
+
+    @classmethod
+    def for_kiosk(cls, hardware, channels=MEDICATION_CHANNELS):
+        """Controller wired the way the kiosks run it: streamed ToF detection,
+        trace recording, channel health and the holding stage (if the gate is installed)"""
+        sampler = ToFSampler(hardware.read_distance)
+        detector = DropDetector()
+        sampler.add_listener(detector.feed)
+        recorder = TraceRecorder()
+        sampler.add_listener(recorder.feed)
+        stage = None
+        if HOLDING_GATE_INSTALLED:
+            stage = HoldingStage(ServoMotion(None, HOLDING_GATE_CHANNEL))
+        controller = cls(channels, hardware.read_distance, detector, stage, recorder=recorder,
+                         health=HealthMonitor(), inventory=Inventory(), spares=SPARE_CHANNELS)
+        controller.sampler = sampler
+        return controller
+
+    # --- Setup ---
+
+    def attach(self, servos):
+        """Take servo objects for every channel (and the gate) from a servo backend"""
+        for channel, motion in self.motions.items():
+            motion.servo = servos.servo(channel)
+        if self.stage is not None:
+            self.stage.motion.servo = servos.servo(self.stage.motion.channel)
+
+    def use_state(self, state):
+        """Track doses in a StateManager; pills of an unfinished dose are still in the stage"""
+        self.state = state
+        if self.stage is not None and state.in_progress:
+            self.stage.staged = dict(state.state["dispensed"])
+            self.stage.dose_key = state.dose_key()
+
+    def start_hardware(self, hardware, sleep=time.sleep):
+        """Initialize a HardwareProvider and start sensing (blocking)"""
+        hardware.initialize()
+        self.attach(hardware)
+        if self.stage is not None:
+            self.stage.close(sleep)
+        if self.sampler is not None:
+            hardware.start_ranging(TOF_TIMING_BUDGET_US)  # via the bus manager
+            self.sampler.start()
+
+    def shutdown(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.state is not None:
+            self.state.close()
+
+    # --- Inventory ---
+
+    def holding(self, name):
+        """Channels loaded with a medication, main channel first"""
+        return [self.channels[name]] + [channel for channel in self.spares.get(name, ())
+                                        if channel != self.channels[name]]
+
+    def route(self, name, pills):
+        """Channel to take pills of a medication from, or None if none has enough"""
+        for channel in self.holding(name):
+            if self.inventory is None or self.inventory.has(channel, pills):
+                return channel
+        return None
+
+    def unavailable(self, required, dose_key=None):
+        """Why {medication: pills} can't be dispensed here, or None if it can"""
+        unloaded = [name for name in required if name not in self.channels]
+        if unloaded:
+            return f"Not loaded in this dispenser: {', '.join(unloaded)}"
+        short = [f"{name} ({self.inventory.stock(self.holding(name))} left, {count} needed)"
+                 for name, count in self._remaining(required, dose_key).items()
+                 if count > 0 and self.route(name, count) is None]
+        if short:
+            return f"Not enough left in this dispenser: {', '.join(short)}"
+        return None
+
+    def refill(self, name, count=None, channel=None):
+        """Staff refilled a medication's carousel (its main one unless channel is given)"""
+        channel = self.channels[name] if channel is None else channel
+        if self.inventory is not None:
+            self.inventory.refill(channel, count)
+        if self.health is not None:
+            self.health.reset(channel)
+        return channel
+
+    def _remaining(self, required, dose_key):
+        """Pills still to dispense - less what an unfinished run of the same dose dropped"""
+        if (dose_key is not None and self.state is not None and self.state.in_progress
+                and self.state.dose_key() == tuple(dose_key)):
+            return self.state.remaining()
+        return dict(required)
+
+    # --- Dispensing ---
+
+    def begin(self, required, dose_key=None, emit=None, hold=False):
+        """Start dispensing {medication: pills} (non-blocking).
+
+        dose_key (patient_id, due) ties the run to a dose in the state
+        manager - an unfinished run of the same dose is resumed. hold keeps
+        the pills in the holding stage (pre-staging). Returns seconds until
+        step() is due. Raises ValueError if a medication is not loaded or
+        not enough of it is left, or if another dose is unfinished.
+        """
+        problem = self.unavailable(required, dose_key)
+        if problem:
+            raise ValueError(problem)
+        if (self.stage is not None and self.stage.staged and self.stage.dose_key != dose_key
+                and self.state is None):
+            raise ValueError("Holding stage has pills for another dose")
+
+        self.emit = emit or (lambda kind, **data: None)
+        self.dose_key = dose_key if self.state is not None else None
+        self.hold = hold
+        remaining = dict(required)
+        if self.dose_key is not None:
+            self.state.start(dose_key[0], dose_key[1], required)
+            remaining = self.state.remaining()
+        if self.stage is not None:
+            self.stage.dose_key = dose_key
+
+        key = self.sensor if self.sensor is not None else self.detector
+        self.routes = {name: self.route(name, count) for name, count in remaining.items()
+                       if count > 0}
+        jobs = [ChannelJob(name, self.motions[self.routes[name]], count, key, self.detector)
+                for name, count in remaining.items() if count > 0]
+        self.scheduler = ChannelScheduler(jobs, self._on_event, self.clock, self.recorder,
+                                          self.verbose, self.health, baselines=self.baselines)
+        self.phase = "dispensing"
+        self.result = None
+        self.released = {}
+        return self.scheduler.begin()
+
+    def step(self):
+        """Advance the run (non-blocking). Returns seconds until the next step,
+        or None when finished (self.result says whether it succeeded)."""
+        if self.phase == "dispensing":
+            delay = self.scheduler.step()
+            if delay is not None:
+                return delay
+            if not self.scheduler.result:
+                return self._finish(False, "max attempts")
+            if self.stage is not None and not self.hold:
+                self.phase = "releasing"
+                return self.stage.open_gate()
+            return self._finish(True)
+        if self.phase == "releasing":
+            self.released, closing = self.stage.close_gate()
+            self.emit("released", items=self.released)
+            self.phase = "closing"
+            return closing
+        if self.phase == "closing":
+            return self._finish(True)
+        return None
+
+    def dispense(self, required, sleep=time.sleep, dose_key=None, emit=None, hold=False):
+        """Blocking dispense. Returns True when every pill is out (or staged, with hold)."""
+        with tracer.span("dispense", "dispense", pills=sum(required.values()), hold=hold):
+            delay = self.begin(required, dose_key, emit, hold)
+            while delay is not None:
+                if not sleep(delay):
+                    self.cancel()
+                    break
+                delay = self.step()
+        return self.result
+
+    def reset_dose(self):
+        """Staff emptied the holding stage and dealt with an unfinished dose - start afresh"""
+        if self.state is not None and self.state.in_progress:
+            self.state.reset()
+        if self.stage is not None:
+            self.stage.staged = {}
+            self.stage.dose_key = None
+
+    def cancel(self):
+        """Stop mid-run (engine shutdown); the dose is left failed so it can be resumed"""
+        if self.phase != "idle":
+            self._finish(False, "cancelled")
+
+    def _on_event(self, kind, **data):
+        if kind == "attempt" and self.dose_key is not None:
+            self.state.attempt(data["name"])
+        elif kind == "dispensed":
+            if self.dose_key is not None:
+                self.state.pill(data["name"])
+            if self.stage is not None:
+                self.stage.add(data["name"])
+            if self.inventory is not None:
+                self.inventory.take(self.routes[data["name"]])
+        elif kind == "max_attempts" and self.inventory is not None:
+            if data["reason"] == "empty":
+                self.inventory.empty(self.routes[data["name"]])
+        self.emit(kind, **data)
+
+    def _finish(self, success, reason=""):
+        self.phase = "idle"
+        self.result = success
+        if self.health is not None:
+            self.health.save()
+        if self.inventory is not None:
+            self.inventory.save()
+        if self.dose_key is not None:
+            if not success:
+                self.state.fail(reason)
+            elif not self.hold:
+                self.state.complete()
+        return None
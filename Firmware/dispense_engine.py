@@ -0,0 +1,141 @@
+"""
+Background dispense engine
+
+Runs servo/sensor jobs on a worker thread so the Tk main loop never blocks.
+Jobs are taken from a command queue one at a time. Progress events are put
+on an event queue which is drained on the Tk thread with root.after, so
+widgets are only ever touched from the UI thread. The queue is polled
+every ENGINE_POLL_MS while a job runs and every ENGINE_IDLE_POLL_MS
+otherwise, so an idle kiosk barely wakes up.
+
+InlineEngine has the same interface but runs jobs on the loop thread, for
+headless runs on virtual time.
+"""
+
+import queue
+import threading
+
+from config.hardware_config import ENGINE_IDLE_POLL_MS, ENGINE_POLL_MS
+from hardware.tracing import tracer
+
+
+class DispenseEngine:
+    def __init__(self, root, on_event, poll_ms=ENGINE_POLL_MS, idle_poll_ms=ENGINE_IDLE_POLL_MS):
+        self.root = root
+        self.on_event = on_event
+        self.poll_ms = poll_ms
+        self.idle_poll_ms = idle_poll_ms
+        self.poll_id = None
+
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.busy = False
+
+        self.thread = threading.Thread(target=self._worker, name="dispense-engine",
+                                       daemon=True)
+        self.thread.start()
+        self._poll_events()
+
+    def submit(self, job, *args):
+        """Queue a job to run on the worker thread as job(engine, *args) (Tk thread)"""
+        self.commands.put((job, args))
+        # Back to fast polling straight away, the job's events are coming
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+        self.poll_id = self.root.after(self.poll_ms, self._poll_events)
+
+    def emit(self, kind, **data):
+        """Post an event for the UI thread (safe to call from the worker)"""
+        self.events.put((kind, data))
+
+    def sleep(self, seconds):
+        """Interruptible sleep for jobs - returns False if the job was cancelled"""
+        with tracer.span("engine_sleep", "engine"):
+            return not self.cancelled.wait(seconds)
+
+    def cancel(self):
+        """Ask the running job to stop at its next sleep"""
+        self.cancelled.set()
+
+    def stop(self, timeout=2.0):
+        """Cancel the current job and shut the worker down"""
+        self.cancel()
+        self.commands.put(None)
+        self.thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            job, args = item
+            self.cancelled.clear()
+            self.busy = True
+            try:
+                with tracer.span(job.__name__, "engine"):
+                    job(self, *args)
+            except Exception as e:
+                print(f"⚠️ Dispense engine error: {e}")
+                self.emit("error", message=str(e))
+            finally:
+                self.busy = False
+
+    def _poll_events(self):
+        """Deliver queued events to the UI callback, then reschedule"""
+        # Checked first, so the last events of a job that ends meanwhile are
+        # still picked up by the next fast poll
+        active = self.busy or not self.commands.empty()
+        while True:
+            try:
+                kind, data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            active = True
+            self.on_event(kind, data)
+        self.poll_id = self.root.after(self.poll_ms if active else self.idle_poll_ms,
+                                       self._poll_events)
+
+
+class InlineEngine:
+    """DispenseEngine stand-in that runs jobs on the loop thread itself.
+
+    For headless runs on virtual time: sleep() just advances the virtual
+    clock, so a job finishes in microseconds and no worker thread is needed.
+    Events reach on_event through the loop, after the job returns.
+    """
+
+    def __init__(self, root, on_event, sleep):
+        self.root = root
+        self.on_event = on_event
+        self._sleep = sleep
+        self.cancelled = False
+        self.busy = False
+
+    def submit(self, job, *args):
+        self.root.after_idle(self._run, job, args)
+
+    def emit(self, kind, **data):
+        self.root.after_idle(self.on_event, kind, data)
+
+    def sleep(self, seconds):
+        self._sleep(seconds)
+        return not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+    def stop(self, timeout=None):
+        self.cancel()
+
+    def _run(self, job, args):
+        self.cancelled = False
+        self.busy = True
+        try:
+            with tracer.span(job.__name__, "engine"):
+                job(self, *args)
+        except Exception as e:
+            print(f"⚠️ Dispense engine error: {e}")
+            self.emit("error", message=str(e))
+        finally:
+            self.busy = False
@@ -0,0 +1,241 @@
+"""
+Dose scheduler
+
+Keeps every upcoming dose of the ward in a heap keyed by due time and
+arms a single Tk timer for exactly the next one - nothing polls. Each
+event is O(log n) in the size of the schedule.
+
+When a dose falls due the patient joins the calling queue (several
+patients can be due at once) and the UI is told. Missed doses escalate
+in steps (MISSED_DOSE_ESCALATION) until the dose is marked collected.
+Every dose reschedules itself for the same local time the next day when
+it fires (so a DST change doesn't shift it by an hour). With a
+lead time, an "upcoming" event fires that long before each dose (used to
+pre-dispense it into the holding stage).
+
+load() can run again at any time (new prescriptions from the backend):
+occurrences that already fired are not fired again and pending
+escalations are kept. With a path, what fired and what is still
+uncollected is saved there, so a restart doesn't call a patient twice
+for the same dose either - and still calls the ones who were waiting.
+
+Events passed to on_event(kind, data), on the Tk thread:
+    upcoming {"patient_id", "due"}
+    due      {"patient_id", "due"}
+    missed   {"patient_id", "due", "level", "minutes"}
+"""
+
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from config.hardware_config import DOSE_SCHEDULE_FILE, MISSED_DOSE_ESCALATION
+
+def next_occurrence(due, now, grace=0):
+    """Epoch time of the next "HH:MM", counting today's if it passed less than grace ago"""
+    moment = datetime.fromtimestamp(now)
+    hours, minutes = (int(part) for part in due.split(":"))
+    occurrence = moment.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    if occurrence.timestamp() < now - grace:
+        occurrence += timedelta(days=1)
+    return occurrence.timestamp()
+
+
+def following_occurrence(due, occurrence):
+    """Epoch time of the "HH:MM" after the one at `occurrence` (tomorrow's, local time)"""
+    return next_occurrence(due, occurrence + 1)
+
+
+class DoseScheduler:
+    def __init__(self, store, on_event, clock=time.time, escalation=MISSED_DOSE_ESCALATION,
+                 lead=0, path=DOSE_SCHEDULE_FILE):
+        self.store = store
+        self.on_event = on_event
+        self.clock = clock
+        self.escalation = escalation
+        self.lead = lead                # seconds before each dose to fire "upcoming" (0 = off)
+
+        self.heap = []                  # (time, seq, kind, patient_id, due, occurrence, level)
+        self.seq = itertools.count()    # tie-break so entries never compare by name
+        self.waiting = deque()          # (patient_id, due) due and not yet called
+        self.outstanding = {}           # (patient_id, due) -> occurrence not yet collected
+        self.fired = {}                 # (kind, patient_id, due) -> last occurrence fired
+        self.path = path                # JSON file for fired / outstanding (None = memory only)
+        self._restore()
+
+        self.root = None
+        self.timer = None
+        self.timer_at = None
+
+    def load(self):
+        """(Re)build the heap from the prescription store, without firing again
+        what already fired or dropping escalations that are still pending"""
+        now = self.clock()
+        grace = self.escalation[-1][0] if self.escalation else 0
+        schedule = set(self.store.schedule())
+        doses = {(patient_id, due) for due, patient_id in schedule}
+        # Doses that left the prescription are no longer called or escalated
+        self.outstanding = {key: at for key, at in self.outstanding.items() if key in doses}
+        self.waiting = deque(key for key in self.waiting if key in doses)
+        self.fired = {key: at for key, at in self.fired.items() if key[1:] in doses}
+        escalating = set()
+        self.heap = [entry for entry in self.heap if entry[2] == "missed"
+                     and self.outstanding.get((entry[3], entry[4])) == entry[5]]
+        for entry in self.heap:
+            escalating.add((entry[3], entry[4]))
+        for due, patient_id in sorted(schedule):
+            at = self._unfired("due", patient_id, due, next_occurrence(due, now, grace))
+            self.heap.append((at, next(self.seq), "due", patient_id, due, at, 0))
+            if self.lead:
+                at = self._unfired("upcoming", patient_id, due, next_occurrence(due, now))
+                self.heap.append((max(now, at - self.lead), next(self.seq), "upcoming",
+                                  patient_id, due, at, 0))
+        # Uncollected doses whose escalation entries were lost (restart): the next level only
+        for (patient_id, due), occurrence in self.outstanding.items():
+            if (patient_id, due) not in escalating:
+                for level, (delay, name) in enumerate(self.escalation):
+                    if occurrence + delay > now:
+                        self.heap.append((occurrence + delay, next(self.seq), "missed",
+                                          patient_id, due, occurrence, level))
+                        break
+        heapq.heapify(self.heap)
+        print(f"📅 {len(schedule)} dose time(s) scheduled")
+        self._arm()
+
+    def _unfired(self, kind, patient_id, due, at):
+        """The first occurrence at or after `at` that has not fired yet"""
+        fired = self.fired.get((kind, patient_id, due))
+        if fired is not None and at <= fired:
+            at = following_occurrence(due, fired)
+        return at
+
+    def start(self, root):
+        """Load the schedule and run the timer on a Tk root"""
+        self.root = root
+        self.load()
+
+    def stop(self):
+        if self.root is not None and self.timer is not None:
+            self.root.after_cancel(self.timer)
+        self.timer = None
+        self.timer_at = None
+
+    def add_dose(self, patient_id, due):
+        """Schedule a dose time added after load()"""
+        at = next_occurrence(due, self.clock())
+        self._push(at, "due", patient_id, due, at)
+        if self.lead:
+            self._push(max(self.clock(), at - self.lead), "upcoming", patient_id, due, at)
+        if self.timer_at is None or at < self.timer_at:
+            self._arm()
+
+    def mark_collected(self, patient_id, due):
+        """Stop escalating this dose (its pending missed entries are skipped when popped)"""
+        self.outstanding.pop((patient_id, due), None)
+        if (patient_id, due) in self.waiting:
+            self.waiting.remove((patient_id, due))
+        self._save()
+
+    def outstanding_due(self, patient_id):
+        """Due time of the patient's oldest dose that fired and wasn't collected (or None)"""
+        doses = [(at, due) for (pid, due), at in self.outstanding.items() if pid == patient_id]
+        return min(doses)[1] if doses else None
+
+    def next_waiting(self):
+        """Pop the next patient to call as (patient_id, due), or None"""
+        return self.waiting.popleft() if self.waiting else None
+
+    def next_delay(self):
+        """Seconds until the next event (None when nothing is scheduled)"""
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - self.clock())
+
+    def run_due(self):
+        """Fire every event whose time has come, then re-arm the timer"""
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            at, _, kind, patient_id, due, occurrence, level = heapq.heappop(self.heap)
+            if kind == "due":
+                self._fire_due(patient_id, due, occurrence)
+            elif kind == "upcoming":
+                self.fired[("upcoming", patient_id, due)] = occurrence
+                self._save()
+                following = following_occurrence(due, occurrence)
+                self._push(following - self.lead, "upcoming", patient_id, due, following)
+                self.on_event("upcoming", {"patient_id": patient_id, "due": due})
+            elif self.outstanding.get((patient_id, due)) == occurrence:
+                delay, name = self.escalation[level]
+                self._escalate(patient_id, due, occurrence, level + 1)
+                self.on_event("missed", {"patient_id": patient_id, "due": due,
+                                         "level": name, "minutes": delay // 60})
+        self._arm()
+
+    def _fire_due(self, patient_id, due, occurrence):
+        following = following_occurrence(due, occurrence)
+        self._push(following, "due", patient_id, due, following)
+        self.fired[("due", patient_id, due)] = occurrence
+        self.outstanding[(patient_id, due)] = occurrence
+        self._escalate(patient_id, due, occurrence, 0)
+        if (patient_id, due) not in self.waiting:
+            self.waiting.append((patient_id, due))
+        self._save()
+        self.on_event("due", {"patient_id": patient_id, "due": due})
+
+    def _escalate(self, patient_id, due, occurrence, level):
+        if level < len(self.escalation):
+            self._push(occurrence + self.escalation[level][0], "missed", patient_id, due,
+                       occurrence, level)
+
+    def _restore(self):
+        """Fired / outstanding doses from the last run; the uncollected ones wait again"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.fired = {tuple(key.split("|")): at for key, at in data["fired"].items()}
+            self.outstanding = {tuple(key.split("|")): at
+                                for key, at in data["outstanding"].items()}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Dose schedule not restored: {e}")
+            return
+        self.waiting.extend(sorted(self.outstanding, key=self.outstanding.get))
+
+    def _save(self):
+        if not self.path:
+            return
+        data = {"fired": {"|".join(key): at for key, at in self.fired.items()},
+                "outstanding": {"|".join(key): at for key, at in self.outstanding.items()}}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
+
+    def _push(self, at, kind, patient_id, due, occurrence, level=0):
+        heapq.heappush(self.heap, (at, next(self.seq), kind, patient_id, due, occurrence, level))
+
+    def _arm(self):
+        """Point the single Tk timer at the earliest event"""
+        if self.root is None:
+            return
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+        delay = self.next_delay()
+        self.timer_at = self.heap[0][0] if self.heap else None
+        if delay is not None:
+            # Tk timers are whole ms; a little late is fine, early is not
+            self.timer = self.root.after(int(delay * 1000) + 1, self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        self.timer_at = None
+        self.run_due()
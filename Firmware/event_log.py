@@ -0,0 +1,144 @@
+"""
+Structured event logging for the kiosk
+
+EventLog keeps the most recent lines in a fixed-size ring buffer (this is
+what the on-screen log shows) and hands every event to a FileSink, which
+writes them to disk from a background thread in batches, as JSON lines,
+rotating the file when it gets too big. Listeners (the backend outbox)
+get the same structured entries. Logging an event never touches
+the disk on the caller's thread, so it is safe from the UI and the
+dispense path alike. If the sink falls behind, events are dropped and
+counted rather than blocking.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config.hardware_config import (EVENT_LOG_BACKUPS, EVENT_LOG_FILE, EVENT_LOG_MAX_BYTES,
+                                    LOG_VIEW_LINES)
+
+
+class EventLog:
+    def __init__(self, capacity=LOG_VIEW_LINES, sink=None):
+        self.lines = deque(maxlen=capacity)
+        self.sink = sink
+        self.listeners = []             # callback(entry), must not block
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def event(self, kind, message="", **fields):
+        """Record a structured event. Returns the display line."""
+        now = time.time()
+        line = f"[{datetime.fromtimestamp(now).strftime('%H:%M:%S')}] {message or kind}"
+        self.lines.append(line)
+        if self.sink is not None or self.listeners:
+            entry = {"time": now, "kind": kind, "message": message}
+            entry.update(fields)
+            if self.sink is not None:
+                self.sink.put(entry)
+            for callback in self.listeners:
+                callback(entry)
+        return line
+
+    def log(self, message):
+        """Plain text message (kind "log")"""
+        return self.event("log", message)
+
+    def recent(self):
+        return list(self.lines)
+
+
+class FileSink:
+    def __init__(self, path=EVENT_LOG_FILE, max_bytes=EVENT_LOG_MAX_BYTES,
+                 backups=EVENT_LOG_BACKUPS, batch_size=100, flush_interval=0.5,
+                 queue_size=10000, name="event-log-writer"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def put(self, entry):
+        """Queue an event for writing (never blocks)"""
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2.0):
+        """Flush what is queued and stop the writer"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                entry = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            stop = entry is None
+            if not stop:
+                batch.append(entry)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        text = "".join(json.dumps(entry, default=str) + "\n" for entry in batch)
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(text) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write(text)
+        except OSError as e:
+            self.dropped += len(batch)
+            print(f"⚠️ Event log write error: {e}")
+
+    def _rotate(self):
+        """events.jsonl -> events.jsonl.1 -> ... -> events.jsonl.N (oldest dropped)"""
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+_shared_log = None
+_shared_lock = threading.Lock()
+
+
+def get_event_log():
+    """The process-wide event log, with its file sink started on first use"""
+    global _shared_log
+    with _shared_lock:
+        if _shared_log is None:
+            _shared_log = EventLog(sink=FileSink())
+        return _shared_log
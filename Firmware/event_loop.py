@@ -0,0 +1,86 @@
+"""
+Headless event loop
+
+The timer part of a Tk root - after(), after_idle(), after_cancel(),
+mainloop(), quit() - without a display, so the dispense engine, dose
+scheduler, UI bus and kiosk workflow run the same way with no widgets.
+
+Real time by default. Given a virtual clock's monotonic/sleep it runs on
+virtual time instead: the loop jumps straight to the next timer, so soak
+tests get through hours of kiosk time in seconds.
+
+Other threads hand work to the loop with call_soon_threadsafe().
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class EventLoop:
+    def __init__(self, clock=time.monotonic, sleep=None):
+        self.clock = clock
+        self.sleep = sleep              # virtual time: advances the clock (None = real time)
+        self.timers = []                # heap of (time, id)
+        self.callbacks = {}             # id -> (callback, args); cancelled ids are removed
+        self.ids = itertools.count(1)
+        self.posted = deque()           # callbacks from other threads
+        self.wakeup = threading.Event()
+        self.running = False
+
+    # --- Tk-compatible timers ---
+
+    def after(self, ms, callback, *args):
+        timer_id = next(self.ids)
+        self.callbacks[timer_id] = (callback, args)
+        heapq.heappush(self.timers, (self.clock() + ms / 1000, timer_id))
+        return timer_id
+
+    def after_idle(self, callback, *args):
+        return self.after(0, callback, *args)
+
+    def after_cancel(self, timer_id):
+        self.callbacks.pop(timer_id, None)
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Run callback(*args) on the loop thread (safe from any thread)"""
+        self.posted.append((callback, args))
+        self.wakeup.set()
+
+    # --- Running ---
+
+    def mainloop(self):
+        """Run timers until quit() - or, on virtual time, until none are left"""
+        self.running = True
+        while self.running:
+            while self.posted:
+                callback, args = self.posted.popleft()
+                callback(*args)
+            while self.timers and self.timers[0][1] not in self.callbacks:
+                heapq.heappop(self.timers)
+            if not self.timers:
+                if self.sleep is not None:
+                    break
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            at, timer_id = self.timers[0]
+            delay = at - self.clock()
+            if delay > 1e-9:
+                if self.sleep is not None:
+                    self.sleep(delay)
+                else:
+                    self.wakeup.wait(delay)
+                    self.wakeup.clear()
+                continue
+            heapq.heappop(self.timers)
+            callback, args = self.callbacks.pop(timer_id)
+            callback(*args)
+        self.running = False
+
+    def quit(self):
+        self.running = False
+        self.wakeup.set()
@@ -0,0 +1,223 @@
+"""
+Fleet controller
+
+Coordinates several PillWheel units. Each unit is a separate process
+(standing in for a Pi) with its own job queue; all units report back on
+one shared results queue. Due patients go to the least-loaded unit -
+fewest outstanding patients, then least estimated work - so ward
+throughput grows with the number of units.
+
+Units here run the simulated dispenser (hardware.simulator); time_scale
+maps simulated seconds to wall-clock seconds so a ward round can be
+played back quickly. Messages:
+
+    to a unit       ("dispense", job_id, patient_id, prescription) / ("stop",)
+    from a unit     ("ready", unit_id) / ("done", unit_id, job_id, success, seconds)
+                    ("error", unit_id, job_id, message)
+
+Usage:
+    python -m Firmware.fleet --units 1 2 4 --patients 120
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import queue
+import random
+import time
+
+
+def unit_main(unit_id, jobs, results, time_scale, seed, hardware_options):
+    """Dispenser unit process: dispense each job it is given and report back"""
+    from hardware.simulator import SimulatedDispenser
+
+    dispenser = SimulatedDispenser(seed=seed, **hardware_options)
+    results.put(("ready", unit_id))
+    while True:
+        message = jobs.get()
+        if message[0] == "stop":
+            return
+        _, job_id, patient_id, prescription = message
+        try:
+            result = dispenser.run(prescription)
+            # The simulator runs on virtual time - spend the scaled real time here
+            time.sleep(result["duration"] * time_scale)
+            results.put(("done", unit_id, job_id, result["success"], result["duration"]))
+        except Exception as e:
+            results.put(("error", unit_id, job_id, str(e)))
+
+
+class UnitStatus:
+    def __init__(self, unit_id):
+        self.unit_id = unit_id
+        self.ready = False
+        self.outstanding = {}           # job_id -> estimated seconds
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0         # simulated dispensing time
+
+    @property
+    def load(self):
+        return (len(self.outstanding), sum(self.outstanding.values()))
+
+
+class FleetController:
+    def __init__(self, units=2, time_scale=0.01, seed=1, **hardware_options):
+        self.time_scale = time_scale
+        self.hardware_options = hardware_options
+        self.seed = seed
+        self.results = multiprocessing.Queue()
+        self.units = [UnitStatus(unit_id) for unit_id in range(units)]
+        self.queues = [multiprocessing.Queue() for _ in range(units)]
+        self.processes = []
+        self.job_ids = itertools.count(1)
+        self.jobs = {}                  # job_id -> (unit_id, patient_id, pills)
+        self.pills_done = 0
+        self.started = None
+
+    def start(self, timeout=30):
+        """Spawn the unit processes and wait until they are all ready"""
+        for unit, jobs in zip(self.units, self.queues):
+            process = multiprocessing.Process(
+                target=unit_main, name=f"pillwheel-unit-{unit.unit_id}", daemon=True,
+                args=(unit.unit_id, jobs, self.results, self.time_scale,
+                      self.seed + unit.unit_id, self.hardware_options))
+            process.start()
+            self.processes.append(process)
+        deadline = time.monotonic() + timeout
+        while not all(unit.ready for unit in self.units):
+            if not self.poll(max(0.0, deadline - time.monotonic())):
+                raise RuntimeError("Dispenser units did not start")
+        print(f"🏥 Fleet of {len(self.units)} unit(s) ready")
+        self.started = time.monotonic()
+        return self
+
+    def assign(self, patient_id, prescription):
+        """Send a due patient to the least-loaded unit. Returns (job_id, unit_id)."""
+        unit = min(self.units, key=lambda u: u.load)
+        job_id = next(self.job_ids)
+        unit.outstanding[job_id] = self.estimate(prescription)
+        self.jobs[job_id] = (unit.unit_id, patient_id,
+                             sum(count for channel, count in prescription.values()))
+        self.queues[unit.unit_id].put(("dispense", job_id, patient_id, prescription))
+        return job_id, unit.unit_id
+
+    def estimate(self, prescription):
+        """Rough simulated seconds for a prescription, from the fleet's seconds per pill so far"""
+        busy = sum(unit.busy_seconds for unit in self.units)
+        per_pill = busy / self.pills_done if self.pills_done else 1.5
+        return per_pill * sum(count for channel, count in prescription.values())
+
+    def poll(self, timeout=0.0):
+        """Apply one unit message. Returns False if none arrived in time."""
+        try:
+            message = self.results.get(timeout=timeout) if timeout else self.results.get_nowait()
+        except queue.Empty:
+            return False
+        kind, unit_id = message[0], message[1]
+        unit = self.units[unit_id]
+        if kind == "ready":
+            unit.ready = True
+        elif kind == "done":
+            _, _, job_id, success, seconds = message
+            unit.outstanding.pop(job_id, None)
+            unit.busy_seconds += seconds
+            self.pills_done += self.jobs[job_id][2]
+            if success:
+                unit.completed += 1
+            else:
+                unit.failed += 1
+        elif kind == "error":
+            _, _, job_id, error = message
+            unit.outstanding.pop(job_id, None)
+            unit.failed += 1
+            print(f"⚠️ Unit {unit_id} job {job_id} error: {error}")
+        return True
+
+    def outstanding(self):
+        return sum(len(unit.outstanding) for unit in self.units)
+
+    def wait(self, timeout=None):
+        """Block until every assigned patient has been handled"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.outstanding():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.poll(0.5 if remaining is None else min(0.5, remaining))
+        return True
+
+    def status(self):
+        """Per-unit and fleet-wide status, with throughput in patients per (simulated) hour"""
+        elapsed = (time.monotonic() - self.started) if self.started else 0.0
+        # time_scale 0 plays the round back as fast as possible: no hours to divide by
+        simulated_hours = elapsed / self.time_scale / 3600 if elapsed and self.time_scale else 0.0
+        completed = sum(unit.completed for unit in self.units)
+        return {
+            "units": [{"unit": unit.unit_id, "outstanding": len(unit.outstanding),
+                       "completed": unit.completed, "failed": unit.failed,
+                       "busy_seconds": round(unit.busy_seconds, 1)}
+                      for unit in self.units],
+            "completed": completed,
+            "failed": sum(unit.failed for unit in self.units),
+            "outstanding": self.outstanding(),
+            "patients_per_hour": round(completed / simulated_hours, 1) if simulated_hours else None,
+        }
+
+    def stop(self):
+        for jobs in self.queues:
+            jobs.put(("stop",))
+        for process in self.processes:
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+
+def prescription_for(store, patient_id, due):
+    """{medication: (channel, pills)} for a patient's dose, as the units expect"""
+    prescription = {}
+    for dose in store.doses_due(patient_id, due):
+        if dose["channel"] is not None:
+            channel, pills = prescription.get(dose["medication"], (dose["channel"], 0))
+            prescription[dose["medication"]] = (channel, pills + dose["pills"])
+    return prescription
+
+
+def ward_round(units, patients, time_scale, seed, **hardware_options):
+    """Dispense one dose for each of `patients` random patients; returns the fleet status"""
+    rng = random.Random(seed)
+    fleet = FleetController(units, time_scale, seed, **hardware_options).start()
+    try:
+        for patient in range(patients):
+            fleet.assign(f"{patient + 1:03d}", {"Vitamin D": (0, rng.randint(1, 3)),
+                                                 "Vitamin C": (1, rng.randint(0, 2))})
+        fleet.wait()
+        return fleet.status()
+    finally:
+        fleet.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated multi-dispenser ward round")
+    parser.add_argument("--units", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--patients", type=int, default=120)
+    parser.add_argument("--time-scale", type=float, default=0.005,
+                        help="wall seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--jam-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    baseline = None
+    for units in args.units:
+        status = ward_round(units, args.patients, args.time_scale, args.seed,
+                            jam_rate=args.jam_rate)
+        rate = status["patients_per_hour"]
+        baseline = baseline or (rate / units)
+        print(f"  {units} unit(s): {rate} patients/hour "
+              f"({rate / baseline / units:.0%} of linear), "
+              f"{status['completed']} done, {status['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
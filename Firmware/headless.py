@@ -0,0 +1,375 @@
+"""
+Headless kiosk
+
+Runs the kiosk workflow (workflow.KioskWorkflow) with no display:
+
+    python -m Firmware.headless soak --flows 5000        # patient flows on virtual time
+    python -m Firmware.headless cli [--sim] [--offline]  # commands on stdin
+    python -m Firmware.headless serve [--sim] [--port]   # the same commands over TCP
+
+soak drives simulated patients through call → ready → confirm → collect
+against the simulated hardware on virtual time - thousands of flows a
+minute, no widgets - and reports the outcomes.
+
+cli and serve run the real kiosk (or, with --sim, the simulated hardware
+in real time). Commands, one per line:
+
+    call [patient] [due]    verify [patient] [due]    ready
+    confirm | yes           reject | no               collect
+    reset (staff: clear a failed dose)     refill <medication> [pills]
+    stock (inventory forecast)             status     quit
+
+Every workflow event is written back as one JSON line.
+Like the touchscreen kiosks they refresh prescriptions from the backend
+and upload dispense events in the background (--offline to skip).
+"""
+
+import argparse
+import json
+import random
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from config.hardware_config import HEADLESS_PORT, KIOSK_PATIENT_ID, MEDICATION_CHANNELS
+from hardware.simulator import SimulatedHardware, VirtualClock
+from hardware.tof_sensor import ToFSampler
+
+from .backend import start_backend
+from .detection import DropDetector
+from .dispense_controller import DispenseController
+from .dispense_engine import DispenseEngine, InlineEngine
+from .event_loop import EventLoop
+from .inventory import Inventory
+from .notifications import start_notifier
+from .prescription_store import PrescriptionStore
+from .state_manager import StateManager
+from .workflow import ASSISTANCE, CALLING, DONE, HOME, VERIFICATION, KioskWorkflow
+
+
+def simulated_controller(sim, clock, channels=MEDICATION_CHANNELS, health=None, inventory=None):
+    """DispenseController on SimulatedHardware with streamed detection.
+    Returns (controller, sampler); the caller polls or starts the sampler."""
+    sampler = ToFSampler(sim.read_distance, clock=clock)
+    detector = DropDetector()
+    sampler.add_listener(detector.feed)
+    controller = DispenseController(channels, sim.read_distance, detector, clock=clock,
+                                    verbose=False, health=health, inventory=inventory)
+    controller.attach(sim)
+    return controller, sampler
+
+
+def soak_store(patients, rng, unloaded_rate=0.0):
+    """In-memory store of simulated patients, one or two medications each"""
+    store = PrescriptionStore(":memory:")
+    names = list(MEDICATION_CHANNELS)
+    for number in range(1, patients + 1):
+        patient_id = f"{number:03d}"
+        store.add_patient(patient_id, f"Patient {number}")
+        for name in rng.sample(names, rng.randint(1, len(names))):
+            store.add_dose(patient_id, name, rng.randint(1, 3), "08:00",
+                           MEDICATION_CHANNELS[name], "Take with food")
+        if rng.random() < unloaded_rate:
+            store.add_dose(patient_id, "Paracetamol", 1, "08:00")
+    return store
+
+
+# --- Soak test ---
+
+def soak(args):
+    rng = random.Random(args.seed)
+    clock = VirtualClock()
+    # The sensor is only polled while a job sleeps; idle kiosk time is skipped
+    loop = EventLoop(clock.monotonic, clock.advance)
+    sim = SimulatedHardware(clock.monotonic, seed=args.seed, drop_prob=args.drop_prob,
+                            jam_rate=args.jam_rate, miss_rate=args.miss_rate, pills=args.hopper)
+    # With --hopper the carousels run out; the inventory knows unless --no-inventory
+    inventory = None
+    if args.hopper is not None and not args.no_inventory:
+        inventory = Inventory(path=None, capacity=args.hopper)
+    controller, sampler = simulated_controller(sim, clock.monotonic, inventory=inventory)
+    for name in MEDICATION_CHANNELS if inventory is not None else ():
+        controller.refill(name)
+    clock.every(sampler.period, sampler.poll)
+    if args.state:
+        controller.use_state(StateManager(tempfile.mkdtemp(prefix="soak-state-")))
+    store = soak_store(args.patients, rng, args.unloaded_rate)
+    patients = [patient_id for due, patient_id in store.schedule()]
+
+    flow = None
+    engine = InlineEngine(loop, lambda kind, data: flow.handle_engine_event(kind, data),
+                          clock.sleep)
+    flow = KioskWorkflow(loop, store, controller, engine)
+    outcomes = {}
+    durations = []
+    started = {"at": 0.0, "outcome": None, "flows": 0}
+
+    def staff_refill():
+        for name, channel in MEDICATION_CHANNELS.items():
+            sim.servo(channel).drop_model.pills = args.hopper
+            flow.refill(name)
+        flow.staff_reset()
+
+    def next_flow():
+        if started["flows"] >= args.flows:
+            loop.quit()
+            return
+        started["flows"] += 1
+        started["at"] = clock.now
+        started["outcome"] = None
+        flow.call(rng.choice(patients))
+
+    def patient(kind, data):
+        """A simulated patient answering the screens"""
+        if kind != "screen":
+            return
+        screen = data["screen"]
+        if screen == CALLING:
+            loop.after(rng.uniform(2, 30) * 1000, flow.ready)
+        elif screen == VERIFICATION:
+            answer = flow.reject if rng.random() < args.reject_rate else flow.confirm
+            loop.after(rng.uniform(1, 5) * 1000, answer)
+        elif screen == DONE:
+            started["outcome"] = "collected"
+            if rng.random() < 0.5:
+                loop.after(rng.uniform(1, 3) * 1000, flow.collect)
+        elif screen == ASSISTANCE:
+            started["outcome"] = "assistance: " + data["reason"].split(" - ")[0].split(":")[0]
+            if args.hopper is not None and not data["reason"].startswith("Verification"):
+                # Staff check and refill the carousels (and clear the interrupted dose)
+                loop.after(rng.uniform(30, 120) * 1000, staff_refill)
+            elif controller.state is not None and controller.state.in_progress:
+                # A care worker comes over and clears the failed dose
+                loop.after(rng.uniform(1, 8) * 1000, flow.staff_reset)
+        elif screen == HOME and started["outcome"] is not None:
+            outcomes[started["outcome"]] = outcomes.get(started["outcome"], 0) + 1
+            durations.append(clock.now - started["at"])
+            loop.after(rng.uniform(0, 10) * 1000, next_flow)
+
+    flow.add_listener(patient)
+    wall = time.perf_counter()
+    loop.after_idle(next_flow)
+    loop.mainloop()
+    wall = time.perf_counter() - wall
+
+    finished = len(durations)
+    print(f"🧪 Soak: {finished}/{args.flows} flows in {wall:.2f}s "
+          f"({finished / wall * 60:.0f} flows/min, {clock.now / 3600:.1f}h kiosk time)")
+    for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]):
+        print(f"   {count:6d}  {outcome}")
+    if inventory is not None:
+        print(f"   pills left per carousel: {inventory.summary()}")
+    if durations:
+        ordered = sorted(durations)
+        print(f"   flow time p50 {ordered[len(ordered) // 2]:.1f}s  "
+              f"p95 {ordered[int(len(ordered) * 0.95)]:.1f}s  max {ordered[-1]:.1f}s")
+    if finished < args.flows:
+        print(f"⚠️ Stopped in state '{flow.state}' - a flow never got back home")
+        return 1
+    return 0
+
+
+# --- Interactive (cli / serve) ---
+
+def kiosk(args, loop, on_event):
+    """The workflow on real hardware, or on the simulator in real time with --sim"""
+    from .dose_scheduler import DoseScheduler
+    from .event_log import get_event_log
+    from .prescription_store import get_prescription_store
+
+    store = get_prescription_store()
+    event_log = get_event_log()
+    flow = None
+
+    def on_engine_event(kind, data):
+        if kind == "prescriptions":
+            scheduler.load()    # new prescriptions from the backend
+        else:
+            flow.handle_engine_event(kind, data)
+
+    engine = DispenseEngine(loop, on_engine_event)
+    if args.sim:
+        sim = SimulatedHardware(seed=args.seed)
+        controller, sampler = simulated_controller(sim, time.monotonic, inventory=Inventory())
+        sampler.start()
+        stop = sampler.stop
+    else:
+        from hardware.provider import HardwareProvider
+        hardware = HardwareProvider()
+        controller = DispenseController.for_kiosk(hardware)
+        engine.submit(lambda engine: controller.start_hardware(hardware, engine.sleep))
+        stop = hardware.shutdown
+    controller.use_state(StateManager())
+
+    scheduler = DoseScheduler(store, lambda kind, data: flow.handle_dose_event(kind, data))
+    flow = KioskWorkflow(loop, store, controller, engine, scheduler,
+                         log=lambda kind, message="", **fields: event_log.event(
+                             kind, message, ui="headless", **fields))
+    flow.add_listener(on_event)
+    scheduler.start(loop)
+    backend = None if args.offline else start_backend(store, event_log, engine)
+    notifier = start_notifier(event_log)
+
+    def shutdown():
+        scheduler.stop()
+        engine.stop()
+        if backend is not None:
+            backend.stop()
+        notifier.stop()
+        controller.shutdown()
+        stop()
+    return flow, shutdown
+
+
+def execute(flow, line):
+    """Run one command line against the workflow. Returns the reply."""
+    words = line.split()
+    if not words:
+        return None
+    command, arguments = words[0].lower(), words[1:]
+    if command == "stock":
+        forecast = flow.check_stock()
+        return {"reply": "stock", "carousels": flow.controller.inventory.summary(),
+                "forecast": forecast}
+    if command == "refill":
+        count = int(arguments.pop()) if arguments and arguments[-1].isdigit() else None
+        return {"reply": "refill", "ok": flow.refill(" ".join(arguments), count),
+                "state": flow.state}
+    actions = {"call": flow.call, "verify": flow.verify, "ready": flow.ready,
+               "confirm": flow.confirm, "yes": flow.confirm, "reject": flow.reject,
+               "no": flow.reject, "collect": flow.collect, "reset": flow.staff_reset}
+    if command == "status":
+        return {"reply": "status", **flow.snapshot()}
+    if command not in actions:
+        return {"reply": "error", "message": f"Unknown command '{command}'"}
+    if command in ("call", "verify"):
+        arguments = arguments or [KIOSK_PATIENT_ID]
+    elif command in ("reject", "no"):
+        arguments = [" ".join(arguments)] if arguments else []
+    else:
+        arguments = []
+    return {"reply": command, "ok": bool(actions[command](*arguments)), "state": flow.state}
+
+
+def to_json(message):
+    return json.dumps(message, default=str)
+
+
+def cli(args):
+    loop = EventLoop()
+    flow, shutdown = kiosk(args, loop, lambda kind, data: print(to_json({"event": kind, **data})))
+
+    def handle(line):
+        if line is None or line.strip().lower() == "quit":
+            loop.quit()
+            return
+        reply = execute(flow, line)
+        if reply is not None:
+            print(to_json(reply))
+
+    def read_stdin():
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(handle, line)
+        loop.call_soon_threadsafe(handle, None)
+
+    threading.Thread(target=read_stdin, name="stdin", daemon=True).start()
+    print("⌨️  Headless kiosk - commands: call, verify, ready, confirm, reject, collect, "
+          "reset, status, quit")
+    try:
+        loop.mainloop()
+    finally:
+        shutdown()
+    return 0
+
+
+def serve(args):
+    loop = EventLoop()
+    clients = set()
+    lock = threading.Lock()
+
+    def broadcast(message):
+        data = (to_json(message) + "\n").encode()
+        with lock:
+            for client in list(clients):
+                try:
+                    client.wfile.write(data)
+                except OSError:
+                    clients.discard(client)
+
+    flow, shutdown = kiosk(args, loop, lambda kind, data: broadcast({"event": kind, **data}))
+
+    def handle(client, line):
+        if line.strip().lower() == "quit":
+            loop.quit()
+            return
+        reply = execute(flow, line)
+        if reply is not None:
+            try:
+                client.wfile.write((to_json(reply) + "\n").encode())
+            except OSError:
+                pass
+
+    class Client(socketserver.StreamRequestHandler):
+        def handle(self):
+            with lock:
+                clients.add(self)
+            try:
+                for raw in self.rfile:
+                    loop.call_soon_threadsafe(handle, self, raw.decode(errors="replace"))
+            finally:
+                with lock:
+                    clients.discard(self)
+
+    server = socketserver.ThreadingTCPServer((args.host, args.port), Client)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="headless-server", daemon=True).start()
+    print(f"🔌 Headless kiosk listening on {args.host}:{args.port}")
+    try:
+        loop.mainloop()
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutdown()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the kiosk workflow without a display")
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    soak_parser = modes.add_parser("soak", help="simulated patient flows on virtual time")
+    soak_parser.add_argument("--flows", type=int, default=1000)
+    soak_parser.add_argument("--patients", type=int, default=20)
+    soak_parser.add_argument("--seed", type=int, default=1)
+    soak_parser.add_argument("--drop-prob", type=float, default=0.9)
+    soak_parser.add_argument("--jam-rate", type=float, default=0.0)
+    soak_parser.add_argument("--miss-rate", type=float, default=0.0)
+    soak_parser.add_argument("--reject-rate", type=float, default=0.02,
+                             help="chance a patient answers NO at verification")
+    soak_parser.add_argument("--unloaded-rate", type=float, default=0.05,
+                             help="share of patients with a medication that is not loaded")
+    soak_parser.add_argument("--hopper", type=int, default=None,
+                             help="pills per carousel; staff refill when they run out")
+    soak_parser.add_argument("--no-inventory", action="store_true",
+                             help="with --hopper: don't track pills (find empties by retrying)")
+    soak_parser.add_argument("--state", action="store_true",
+                             help="record every dose in a StateManager (temp dir, fsyncs)")
+
+    for name in ("cli", "serve"):
+        mode = modes.add_parser(name)
+        mode.add_argument("--sim", action="store_true", help="simulated hardware, real time")
+        mode.add_argument("--seed", type=int, default=None)
+        mode.add_argument("--offline", action="store_true",
+                          help="don't sync with the backend (JAVA_API_URL)")
+        if name == "serve":
+            mode.add_argument("--host", default="127.0.0.1")
+            mode.add_argument("--port", type=int, default=HEADLESS_PORT)
+
+    args = parser.parse_args()
+    return {"soak": soak, "cli": cli, "serve": serve}[args.mode](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Pill inventory per carousel
+
+How many pills are left on each servo channel, saved to INVENTORY_FILE:
+
+    refill     staff filled a carousel (to CAROUSEL_CAPACITY unless counted)
+    take       a detected pill left the carousel
+    empty      the retry policy gave up on the channel as empty - the count
+               was wrong, so it is set to 0 until the next refill
+
+A channel nobody has counted yet (no refill since the file was created)
+is "unknown" and never blocks a dose. DispenseController checks the
+counts before any servo moves: a medication is taken from its main
+channel, or from a SPARE_CHANNELS channel when the main one is short,
+and a dose no channel can cover is refused instead of spending
+MAX_ROTATES attempts per pill finding out.
+
+forecast() walks the dose schedule forward from now and says when each
+medication runs out.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from config.hardware_config import CAROUSEL_CAPACITY, INVENTORY_FILE
+
+
+def dose_schedule(store):
+    """Pills of each medication due at each time of day: [(due, {medication: pills})]"""
+    schedule = {}
+    for due, patient_id in store.schedule():
+        needs = schedule.setdefault(due, {})
+        for dose in store.doses_due(patient_id, due):
+            needs[dose["medication"]] = needs.get(dose["medication"], 0) + dose["pills"]
+    return sorted(schedule.items())
+
+
+class Inventory:
+    """Pills left per servo channel, persisted as JSON (path=None keeps it in memory)"""
+
+    def __init__(self, path=INVENTORY_FILE, capacity=CAROUSEL_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.counts = {}                # channel -> pills left (missing = never counted)
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.counts = {int(channel): count for channel, count in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Inventory not loaded: {e}")
+
+    def left(self, channel):
+        """Pills left on a channel, or None if it was never counted"""
+        return self.counts.get(channel)
+
+    def has(self, channel, pills):
+        left = self.counts.get(channel)
+        return left is None or left >= pills
+
+    def stock(self, channels):
+        """Pills left over several channels (None if any is uncounted)"""
+        counts = [self.counts.get(channel) for channel in channels]
+        return None if None in counts else sum(counts)
+
+    def refill(self, channel, count=None):
+        with self.lock:
+            self.counts[channel] = self.capacity if count is None else count
+        self.save()
+
+    def take(self, channel, pills=1):
+        with self.lock:
+            if channel in self.counts:
+                self.counts[channel] = max(0, self.counts[channel] - pills)
+
+    def empty(self, channel):
+        with self.lock:
+            self.counts[channel] = 0
+
+    def forecast(self, schedule, channels, now=None):
+        """When each medication runs out on the schedule (dose_schedule()).
+
+        channels maps medication -> the channels holding it. Returns
+        medication -> {"left", "per_day", "runs_out"}, runs_out being the
+        datetime of the first dose that can't be covered (None if the
+        medication is uncounted or not on the schedule).
+        """
+        now = now or datetime.now()
+        result = {}
+        for medication, held in channels.items():
+            left = self.stock(held)
+            doses = [(due, needs[medication]) for due, needs in schedule if medication in needs]
+            per_day = sum(pills for due, pills in doses)
+            runs_out = None
+            if left is not None and per_day:
+                runs_out = self._runs_out(left, doses, now)
+            result[medication] = {"left": left, "per_day": per_day, "runs_out": runs_out}
+        return result
+
+    def _runs_out(self, left, doses, now):
+        doses = [(datetime.strptime(due, "%H:%M").time(), pills) for due, pills in doses]
+        day = now.date()
+        while True:
+            for due, pills in doses:
+                at = datetime.combine(day, due)
+                if at < now:
+                    continue
+                if left < pills:
+                    return at
+                left -= pills
+            day += timedelta(days=1)
+
+    def summary(self):
+        return dict(sorted(self.counts.items()))
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {str(channel): count for channel, count in self.counts.items()}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
@@ -1,78 +1,44 @@
 #!/usr/bin/env python3
+import os
+import sys
 import tkinter as tk
 import time
 
-# Import PCA9685 library
-try:
-    import board
-    import busio
-    from adafruit_pca9685 import PCA9685
-    from adafruit_motor import servo
-    PCA_OK = True
-    print("✅ PCA9685 library loaded")
-except Exception as e:
-    PCA_OK = False
-    print(f"⚠️ PCA9685 error: {e}")
+STARTED = time.perf_counter()
 
-# Import sensor
-try:
-    import adafruit_vl53l0x
-    i2c = board.I2C()
-    tof = adafruit_vl53l0x.VL53L0X(i2c)
-    SENSOR_OK = True
-    print("✅ Sensor initialized")
-except Exception as e:
-    SENSOR_OK = False
-    print(f"⚠️ Sensor error: {e}")
+# Allow running this file directly (python3 Firmware/main_dual_servo.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.hardware_config import (KIOSK_PATIENT_ID, MAX_ROTATES, MEDICATION_CHANNELS,
+                                    PRESTAGE_LEAD_TIME)
+from Firmware.dispense_controller import DispenseController
+from Firmware.dispense_engine import DispenseEngine
+from Firmware.dose_scheduler import DoseScheduler
+from Firmware.backend import start_backend
+from Firmware.event_log import get_event_log
+from Firmware.notifications import start_notifier
+from Firmware.prescription_store import get_prescription_store, pill_text
+from Firmware.screen_manager import ScreenManager
+from Firmware.state_manager import StateManager
+from Firmware.ui_bus import UIBus
+from Firmware.workflow import KioskWorkflow
+from hardware.provider import HardwareProvider
+from hardware.tracing import tracer
 
-# Initialize PCA9685
-if PCA_OK:
-    try:
-        pca = PCA9685(i2c)
-        pca.frequency = 50  # 50Hz for servos
-        
-        # Create servo objects for channels 0 and 1
-        servo1 = servo.Servo(pca.channels[0])  # Vitamin D dispenser
-        servo2 = servo.Servo(pca.channels[1])  # Vitamin C dispenser
-        
-        print("✅ Servos initialized on PCA9685")
-        print("   Channel 0: Vitamin D dispenser")
-        print("   Channel 1: Vitamin C dispenser")
-    except Exception as e:
-        print(f"⚠️ PCA9685 init error: {e}")
-        PCA_OK = False
+def set_servo_angle(motion, angle, sleep=time.sleep):
+    """Set servo angle 0-180 and wait only as long as the move takes"""
+    return motion.move_to(angle, sleep)
 
-def get_distance():
-    """Read TOF sensor distance"""
-    if SENSOR_OK:
-        return tof.range
-    return 150  # Simulation
-
-def set_servo_angle(servo_obj, angle):
-    """Set servo angle 0-180"""
-    if PCA_OK:
-        servo_obj.angle = angle
-        time.sleep(0.5)
-
-def rotate_servo_cycle(servo_obj, servo_name):
-    """Rotate servo 0° → 180° → 0° (one dispense cycle)"""
+def rotate_servo_cycle(motion, servo_name, sleep=time.sleep, pill_seen=None):
+    """Rotate servo 0° → 180° → 0° (one dispense cycle)
+    
+    pill_seen enables early exit: the return sweep stops once the sensor sees the pill.
+    """
     print(f"   🔄 {servo_name}: 0° → 180° → 0°")
-    set_servo_angle(servo_obj, 0)
-    time.sleep(0.5)
-    set_servo_angle(servo_obj, 180)
-    time.sleep(0.5)
-    set_servo_angle(servo_obj, 0)
-    time.sleep(0.5)
-
-# State variables
-numberOfRotates = 0
-vitaminD_dispensed = 0
-vitaminC_dispensed = 0
-baseline_distance = None
+    return motion.dispense_cycle(sleep, pill_seen)
 
-# Prescription requirements
-VITAMIN_D_REQUIRED = 2
-VITAMIN_C_REQUIRED = 1
+# Workflow state -> screen (this kiosk has no calling screen)
+SCREENS = {"home": "home", "verification": "verification", "dispensing": "dispensing",
+           "done": "success", "assistance": "assistance"}
 
 class PillWheelUI:
     def __init__(self, root):
@@ -85,14 +51,73 @@ class PillWheelUI:
         self.main_frame = tk.Frame(root, bg="#f0f0f0")
         self.main_frame.pack(expand=True, fill="both")
         
-        self.current_dispenser = None  # Track which dispenser is active
-        self.show_home_screen()
-        
-    def show_home_screen(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+        self.channel_status = {}  # Per-dispenser progress text
+        self.event_log = get_event_log()
+        
+        # The dose being dispensed comes from the prescription store (cached lookup)
+        self.store = get_prescription_store()
+        self.prestaging = False
+        
+        # Devices are brought up in the background by the provider. Streaming ToF
+        # detection, trace recording and the holding stage gate under the chute;
+        # servo objects are attached once the PCA9685 is up.
+        self.hardware = HardwareProvider()
+        self.controller = DispenseController.for_kiosk(self.hardware)
+        self.holding_stage = self.controller.stage
+        
+        # Crash-safe dispense state; an unfinished dose's pills are still in the stage
+        self.state = StateManager()
+        self.controller.use_state(self.state)
+        
+        # Pre-dispenses each dose into the holding stage PRESTAGE_LEAD_TIME before it is due
+        # (only with a gate - without one the pills would wait in the open tray)
+        lead = PRESTAGE_LEAD_TIME if self.holding_stage is not None else 0
+        self.scheduler = DoseScheduler(self.store, self.handle_dose_event, lead=lead)
+        
+        # Screens are built once and raised on each transition
+        self.screens = ScreenManager(self.main_frame)
+        self.screens.register("home", self.build_home_screen, self.update_home_screen)
+        self.screens.register("verification", self.build_verification, self.update_verification)
+        self.screens.register("dispensing", self.build_dispensing, self.update_dispensing_labels)
+        self.screens.register("success", self.build_success, self.update_success)
+        self.screens.register("assistance", self.build_assistance)
+        # Label changes are coalesced per frame and applied only to the visible screen
+        self.ui = UIBus(root, self.screens)
+
+        # Servo/sensor work runs here so the UI never freezes
+        self.engine = DispenseEngine(root, self.handle_engine_event)
+        
+        # Shared kiosk flow; this kiosk serves one patient, who starts it with the button
+        self.flow = KioskWorkflow(root, self.store, self.controller, self.engine, self.scheduler,
+                                  log=lambda kind, message="", **fields: self.event_log.event(
+                                      kind, message, ui="PillWheelUI", **fields),
+                                  auto_call=False, collect_timeout=None)
+        self.flow.add_listener(self.render)
+        self.flow.home()
+
+        # Prescriptions are refreshed and dispense events uploaded in the background
+        self.backend = start_backend(self.store, self.event_log, self.engine)
+        # Assistance calls and missed doses alert the staff, off the UI thread
+        self.notifier = start_notifier(self.event_log)
+        
+        # Bring the hardware up behind the home screen; dispense jobs queue after it
+        self.root.after_idle(self.log_startup_time)
+        self.engine.submit(self.init_hardware_job)
+        self.scheduler.start(root)
+    
+    def log_startup_time(self):
+        print(f"⏱  Home screen shown {(time.perf_counter() - STARTED) * 1000:.0f}ms after start")
+    
+    def init_hardware_job(self, engine):
+        """Initialize devices on the engine worker thread"""
+        self.controller.start_hardware(self.hardware, engine.sleep)
+        print(f"⏱  Hardware ready {(time.perf_counter() - STARTED) * 1000:.0f}ms after start")
+        self.event_log.event("hardware_ready", self.hardware.status_text(),
+                             timings=self.hardware.timings)
+        engine.emit("hardware_ready")
+        
+    def build_home_screen(self, frame):
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
         
         tk.Label(container, text="PillWheel", font=("Arial", 60, "bold"),
@@ -101,21 +126,19 @@ class PillWheelUI:
         tk.Label(container, text="Dual Dispenser System",
                  font=("Arial", 28), fg="#34495e", bg="#f0f0f0").pack(pady=10)
         
-        # Status
-        status_text = []
-        if PCA_OK:
-            status_text.append("Servos: OK ✅")
-        else:
-            status_text.append("Servos: Simulation")
+        # Status (updated when the hardware finishes starting)
+        hardware_label = tk.Label(container, font=("Arial", 14), bg="#f0f0f0")
+        hardware_label.pack(pady=5)
+        self.ui.bind("home", "hardware", hardware_label)
         
-        if SENSOR_OK:
-            status_text.append("Sensor: OK ✅")
-        else:
-            status_text.append("Sensor: Simulation")
+        # Pre-dispensed dose waiting in the holding stage
+        stage_label = tk.Label(container, font=("Arial", 14), fg="#2980b9", bg="#f0f0f0")
+        stage_label.pack(pady=5)
+        self.ui.bind("home", "stage", stage_label)
         
-        tk.Label(container, text=" | ".join(status_text), font=("Arial", 14),
-                 fg="#27ae60" if (PCA_OK and SENSOR_OK) else "#95a5a6",
-                 bg="#f0f0f0").pack(pady=5)
+        stock_label = tk.Label(container, font=("Arial", 14), fg="#2c3e50", bg="#f0f0f0")
+        stock_label.pack(pady=5)
+        self.ui.bind("home", "stock", stock_label)
         
         # TEST BUTTONS FRAME
         test_frame = tk.Frame(container, bg="#e8f4f8", relief="solid", borderwidth=2)
@@ -139,46 +162,124 @@ class PillWheelUI:
         tk.Label(test_frame, text="Each test rotates 0° → 180° → 0°",
                  font=("Arial", 12), bg="#e8f4f8", fg="#7f8c8d").pack(pady=5)
         
-        # Main dispense button
+        # Staff: a carousel was filled up
+        refill_frame = tk.Frame(test_frame, bg="#e8f4f8")
+        refill_frame.pack(pady=10, padx=20)
+        for name in MEDICATION_CHANNELS:
+            tk.Button(refill_frame, text=f"Refilled {name}", font=("Arial", 14),
+                      bg="#16a085", fg="white", padx=15, pady=10,
+                      command=lambda name=name: self.refill(name)).pack(side="left", padx=10)
+        
+        # Main dispense button (serves the staged / unfinished / overdue dose first)
         tk.Button(container, text="Start Full Dispense", font=("Arial", 20, "bold"),
                   bg="#27ae60", fg="white", padx=40, pady=20,
-                  command=self.show_verification).pack(pady=30)
+                  command=lambda: self.flow.verify(KIOSK_PATIENT_ID)).pack(pady=30)
+    
+    def update_home_screen(self, widgets):
+        self.update_hardware_label()
+        self.update_stage_label()
+        self.update_stock_label()
+    
+    def refill(self, name):
+        if self.flow.refill(name):
+            self.update_stock_label()
+    
+    def update_stock_label(self):
+        """Pills left per medication and when they run out on the dose schedule"""
+        parts = []
+        for name, item in self.flow.check_stock().items():
+            if item["left"] is None:
+                parts.append(f"{name}: not counted")
+            elif item["runs_out"] is None:
+                parts.append(f"{name}: {item['left']} left")
+            else:
+                parts.append(f"{name}: {item['left']} left, "
+                             f"until {item['runs_out']:%a %d %b %H:%M}")
+        self.ui.set("home", "stock", text="💊 " + "   ".join(parts) if parts else "")
+    
+    def update_stage_label(self):
+        staged = dict(self.holding_stage.staged) if self.holding_stage is not None else {}
+        if staged:
+            items = ", ".join(f"{name} ×{count}" for name, count in staged.items())
+            self.ui.set("home", "stage", text=f"📦 Ready for {self.holding_stage.dose_key[1]}: {items}")
+        else:
+            self.ui.set("home", "stage", text="")
+    
+    def handle_dose_event(self, kind, data):
+        """Dose scheduler events (Tk thread)"""
+        if data["patient_id"] != KIOSK_PATIENT_ID:
+            return
+        if kind == "upcoming":
+            self.prestage(data["patient_id"], data["due"])
+        else:
+            self.flow.handle_dose_event(kind, data)
+    
+    def prestage(self, patient_id, due):
+        """Queue pre-dispensing of a dose into the holding stage"""
+        if self.holding_stage.staged or self.prestaging:
+            print("⚠️ Holding stage in use - dose will be dispensed on demand")
+            return
+        dose = self.store.patient_view(patient_id, due)
+        if dose is None:
+            print(f"⚠️ No prescription for patient {patient_id} at {due} - nothing to pre-stage")
+            return
+        print(f"\n📦 Pre-staging the {due} dose for {dose['name']}")
+        self.prestaging = True
+        self.engine.submit(self.prestage_job, dose)
+    
+    def prestage_job(self, engine, dose):
+        """Dispense a dose into the closed holding stage (engine worker thread)"""
+        def emit(kind, **data):
+            self.event_log.event(kind, stage=True, **data)
+        
+        try:
+            complete = self.controller.dispense(dose["required"], engine.sleep,
+                                                (dose["id"], dose["due"]), emit, hold=True)
+        except ValueError as e:
+            print(f"⚠️ Cannot pre-stage: {e}")
+            complete = False
+        engine.emit("staged", complete=complete, due=dose["due"])
+    
+    def update_hardware_label(self):
+        self.ui.set("home", "hardware", text=self.hardware.status_text(),
+                    fg="#27ae60" if (self.hardware.pca_ok and self.hardware.sensor_ok) else "#95a5a6")
     
     def test_servo1(self):
         """Test Servo 1 (Vitamin D dispenser)"""
-        print("\n" + "="*50)
-        print("TESTING SERVO 1 (Vitamin D Dispenser)")
-        print("="*50)
-        
-        if PCA_OK:
-            rotate_servo_cycle(servo1, "Servo 1 (Vitamin D)")
-            print("✅ Test complete!")
-        else:
-            print("⚠️ Simulation mode - no hardware")
-        
-        # Show feedback on screen
-        self.show_test_feedback("Servo 1 (Vitamin D)")
+        self.run_servo_test(1, "Servo 1 (Vitamin D)")
     
     def test_servo2(self):
         """Test Servo 2 (Vitamin C dispenser)"""
+        self.run_servo_test(2, "Servo 2 (Vitamin C)")
+    
+    def run_servo_test(self, number, servo_name):
+        """Queue a servo test on the dispense engine"""
+        if self.engine.busy:
+            print("⚠️ Dispenser busy - test ignored")
+            return
+        self.engine.submit(self.servo_test_job, number, servo_name)
+    
+    def servo_test_job(self, engine, number, servo_name):
+        """Worker-side servo test (runs off the UI thread)"""
         print("\n" + "="*50)
-        print("TESTING SERVO 2 (Vitamin C Dispenser)")
+        print(f"TESTING {servo_name.upper()} Dispenser")
         print("="*50)
         
-        if PCA_OK:
-            rotate_servo_cycle(servo2, "Servo 2 (Vitamin C)")
+        if self.hardware.pca_ok:
+            # Servo 1 is the Vitamin D dispenser, servo 2 Vitamin C
+            rotate_servo_cycle(self.controller.motions[number - 1], servo_name, engine.sleep)
             print("✅ Test complete!")
         else:
             print("⚠️ Simulation mode - no hardware")
         
-        # Show feedback on screen
-        self.show_test_feedback("Servo 2 (Vitamin C)")
+        engine.emit("test_done", servo_name=servo_name)
     
     def show_test_feedback(self, servo_name):
         """Show temporary feedback overlay"""
         # Create overlay
         overlay = tk.Frame(self.main_frame, bg="white", relief="solid", borderwidth=3)
         overlay.place(relx=0.5, rely=0.5, anchor="center")
+        overlay.lift()
         
         tk.Label(overlay, text="✓", font=("Arial", 60),
                  fg="#27ae60", bg="white").pack(pady=20, padx=60)
@@ -194,11 +295,8 @@ class PillWheelUI:
         # Auto-dismiss after 2 seconds
         self.root.after(2000, overlay.destroy)
                   
-    def show_verification(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def build_verification(self, frame):
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
         
         tk.Label(container, text="Verify Prescription",
@@ -211,19 +309,10 @@ class PillWheelUI:
         tk.Label(details, text="Today's Vitamins:",
                  font=("Arial", 26, "bold"), bg="white", fg="#2c3e50").pack(pady=15, padx=50)
         
-        # Vitamin D
-        vit_d_frame = tk.Frame(details, bg="white")
-        vit_d_frame.pack(pady=10, padx=50)
-        tk.Label(vit_d_frame, text="🔸", font=("Arial", 24), bg="white").pack(side="left", padx=5)
-        tk.Label(vit_d_frame, text=f"Vitamin D - {VITAMIN_D_REQUIRED} pills",
-                 font=("Arial", 24), bg="white", fg="#34495e").pack(side="left")
-        
-        # Vitamin C
-        vit_c_frame = tk.Frame(details, bg="white")
-        vit_c_frame.pack(pady=10, padx=50)
-        tk.Label(vit_c_frame, text="🔸", font=("Arial", 24), bg="white").pack(side="left", padx=5)
-        tk.Label(vit_c_frame, text=f"Vitamin C - {VITAMIN_C_REQUIRED} pill",
-                 font=("Arial", 24), bg="white", fg="#34495e").pack(side="left")
+        # One line per medication in the dose
+        doses_label = tk.Label(details, font=("Arial", 24), bg="white", fg="#34495e",
+                               justify="left")
+        doses_label.pack(pady=10, padx=50)
         
         tk.Label(details, text=" ", bg="white").pack(pady=5)
         
@@ -236,154 +325,103 @@ class PillWheelUI:
         
         tk.Button(btn_frame, text="YES", font=("Arial", 28, "bold"),
                   bg="#27ae60", fg="white", width=10, padx=30, pady=20,
-                  command=self.start_dispense).pack(side="left", padx=20)
+                  command=self.flow.confirm).pack(side="left", padx=20)
         
         tk.Button(btn_frame, text="NO", font=("Arial", 28, "bold"),
                   bg="#e74c3c", fg="white", width=10, padx=30, pady=20,
-                  command=self.call_assistance).pack(side="left", padx=20)
-    
-    def start_dispense(self):
-        global baseline_distance, numberOfRotates, vitaminD_dispensed, vitaminC_dispensed
+                  command=lambda: self.flow.reject()).pack(side="left", padx=20)
         
-        print("\n" + "="*60)
-        print("STARTING DUAL DISPENSE WORKFLOW")
-        print("="*60)
-        print(f"Target: {VITAMIN_D_REQUIRED}x Vitamin D, {VITAMIN_C_REQUIRED}x Vitamin C")
-        
-        # Initialize state
-        numberOfRotates = 0
-        vitaminD_dispensed = 0
-        vitaminC_dispensed = 0
-        
-        # Start with Vitamin D dispenser
-        self.current_dispenser = "Vitamin D"
-        
-        # Measure baseline
-        print(f"\nMeasuring baseline distance...")
-        baseline_distance = get_distance()
-        print(f"✅ Baseline: {baseline_distance:.0f}mm")
-        
-        self.show_dispensing()
-        self.root.after(1000, self.dispense_loop)
+        return {"doses": doses_label}
     
-    def show_dispensing(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def update_verification(self, widgets):
+        lines = [f"🔸 {dose['medication']} - {pill_text(dose['pills'])}"
+                 for dose in self.flow.patient["doses"]]
+        widgets["doses"].config(text="\n".join(lines) or "No doses due")
+    
+    def build_dispensing(self, frame):
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
         
         tk.Label(container, text="⏳", font=("Arial", 80), bg="#f0f0f0").pack(pady=20)
         tk.Label(container, text="Dispensing Vitamins...",
                  font=("Arial", 36, "bold"), fg="#3498db", bg="#f0f0f0").pack(pady=20)
         
-        self.dispenser_label = tk.Label(container, text="", font=("Arial", 24),
-                                        fg="#34495e", bg="#f0f0f0")
-        self.dispenser_label.pack(pady=10)
+        dispenser_label = tk.Label(container, text="", font=("Arial", 24),
+                                   fg="#34495e", bg="#f0f0f0")
+        dispenser_label.pack(pady=10)
+        self.ui.bind("dispensing", "dispenser", dispenser_label)
         
-        self.status_label = tk.Label(container, text="", font=("Arial", 20),
-                                      fg="#7f8c8d", bg="#f0f0f0")
-        self.status_label.pack(pady=10)
+        status_label = tk.Label(container, text="", font=("Arial", 20),
+                                fg="#7f8c8d", bg="#f0f0f0")
+        status_label.pack(pady=10)
+        self.ui.bind("dispensing", "status", status_label)
     
-    def dispense_loop(self):
-        global numberOfRotates, vitaminD_dispensed, vitaminC_dispensed, baseline_distance
-        
-        # Check if all done
-        if vitaminD_dispensed >= VITAMIN_D_REQUIRED and vitaminC_dispensed >= VITAMIN_C_REQUIRED:
-            self.show_success()
-            return
-        
-        # Determine which dispenser to use
-        if vitaminD_dispensed < VITAMIN_D_REQUIRED:
-            current_servo = servo1
-            current_name = "Vitamin D"
-            current_count = vitaminD_dispensed
-            current_target = VITAMIN_D_REQUIRED
-        elif vitaminC_dispensed < VITAMIN_C_REQUIRED:
-            current_servo = servo2
-            current_name = "Vitamin C"
-            current_count = vitaminC_dispensed
-            current_target = VITAMIN_C_REQUIRED
-        else:
-            self.show_success()
+    def handle_engine_event(self, kind, data):
+        """Apply a dispense engine event on the UI thread"""
+        if self.flow.handle_engine_event(kind, data):
             return
-        
-        # Check max attempts for current pill
-        if numberOfRotates >= 5:
-            print(f"\n❌ MAX ATTEMPTS for {current_name}")
-            self.call_assistance()
+        if kind == "hardware_ready":
+            self.update_hardware_label()
+        elif kind == "prescriptions":
+            self.event_log.event("prescriptions",
+                                 f"Prescriptions updated ({data['patients']} patients)")
+            self.scheduler.load()
+        elif kind == "staged":
+            self.prestaging = False
+            self.event_log.event("staged", f"Dose for {data['due']} pre-staged",
+                                 staged=dict(self.holding_stage.staged), **data)
+            self.update_stage_label()  # shown when the home screen is next up
+        elif kind == "test_done":
+            self.show_test_feedback(data["servo_name"])
+    
+    def render(self, kind, data):
+        """Show the workflow's state (Tk thread)"""
+        if kind == "progress":
+            name, item = data["name"], data["progress"][data["name"]]
+            if item["done"]:
+                self.channel_status[name] = f"{name}: {item['count']}/{item['target']} ✓"
+                print(f"\n✅ {name} dispensed! Total: {item['count']}/{item['target']}")
+            else:
+                self.channel_status[name] = (f"{name}: {item['count']}/{item['target']}"
+                                             f"  (attempt {item['attempt']}/{MAX_ROTATES})")
+            self.update_dispensing_labels()
             return
         
-        # Update UI
-        self.dispenser_label.config(text=f"Dispensing: {current_name}")
-        self.status_label.config(text=f"Attempt {numberOfRotates + 1}/5 ({current_count + 1}/{current_target})")
-        
-        numberOfRotates += 1
-        
-        print(f"\n{'='*60}")
-        print(f"{current_name.upper()} - Attempt {numberOfRotates}/5")
-        print(f"Progress: {current_count}/{current_target}")
-        print(f"{'='*60}")
-        
-        # Rotate the appropriate servo
-        if PCA_OK:
-            rotate_servo_cycle(current_servo, current_name)
-        else:
-            print(f"   🔄 Simulation: {current_name} rotating")
-            time.sleep(2)
-        
-        print("⏳ Waiting for pill to drop...")
-        time.sleep(1)
-        
-        # Check sensor - multiple samples
-        print("📏 Detecting pill drop...")
-        samples = []
-        for i in range(10):
-            samples.append(get_distance())
-            time.sleep(0.1)
-        
-        min_dist = min(samples)
-        max_dist = max(samples)
-        variation = max_dist - min_dist
-        
-        detected = (abs(min_dist - baseline_distance) >= 5 or 
-                   abs(max_dist - baseline_distance) >= 5 or 
-                   variation >= 8)
-        
-        print(f"   Baseline:  {baseline_distance:.0f}mm")
-        print(f"   Range:     {min_dist:.0f} - {max_dist:.0f}mm")
-        print(f"   Variation: {variation:.0f}mm")
-        print(f"   Result:    {'✅ DETECTED' if detected else '❌ NOT DETECTED'}")
-        
-        if detected:
-            # Pill detected - increment the correct counter
-            if current_name == "Vitamin D":
-                vitaminD_dispensed += 1
-                print(f"\n✅ Vitamin D dispensed! Total: {vitaminD_dispensed}/{VITAMIN_D_REQUIRED}")
-            else:
-                vitaminC_dispensed += 1
-                print(f"\n✅ Vitamin C dispensed! Total: {vitaminC_dispensed}/{VITAMIN_C_REQUIRED}")
-            
-            # Reset for next pill
-            numberOfRotates = 0
-            time.sleep(1)
-            baseline_distance = get_distance()
-            print(f"   New baseline: {baseline_distance:.0f}mm")
-            
-            # Check if switching dispensers
-            if vitaminD_dispensed >= VITAMIN_D_REQUIRED and current_name == "Vitamin D":
-                print(f"\n✅ All Vitamin D dispensed! Switching to Vitamin C...")
-                time.sleep(2)
+        screen, dose = data["screen"], data["patient"]
+        if screen == "dispensing":
+            print("\n" + "="*60)
+            print("STARTING DUAL DISPENSE WORKFLOW")
+            print("="*60)
+            print("Target: " + ", ".join(f"{item['pills']}x {item['medication']}"
+                                         for item in dose["doses"]))
+            staged = {}
+            if self.holding_stage is not None:
+                staged = self.holding_stage.holds((dose["id"], dose["due"]))
+            if staged:
+                print(f"📦 Pre-staged: {staged} - topping up the rest")
+            self.channel_status = {}
+        elif screen == "done":
+            print("\n" + "="*60)
+            print("✅ SUCCESS - ALL VITAMINS DISPENSED")
+            for item in dose["doses"]:
+                print(f"   {item['medication']}: "
+                      f"{data['released'].get(item['medication'], 0)}/{item['pills']}")
+            print("="*60)
+        elif screen == "assistance":
+            print(f"\n⚠️ ASSISTANCE CALLED - {data['reason']}")
+        self.screens.show(SCREENS[screen])
+    
+    def update_dispensing_labels(self, widgets=None):
+        active = [name for name, text in self.channel_status.items() if not text.endswith("✓")]
+        if not self.channel_status:
+            self.ui.set("dispensing", "dispenser", text="Preparing dispensers...")
         else:
-            print(f"   Will retry... ({5 - numberOfRotates} attempts remaining)")
-        
-        self.root.after(500, self.dispense_loop)
+            self.ui.set("dispensing", "dispenser",
+                        text=f"Dispensing: {', '.join(active) or 'finishing'}")
+        self.ui.set("dispensing", "status", text="\n".join(self.channel_status.values()))
     
-    def show_success(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def build_success(self, frame):
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
         
         tk.Label(container, text="✅", font=("Arial", 80), bg="#f0f0f0").pack(pady=20)
@@ -397,11 +435,9 @@ class PillWheelUI:
         tk.Label(summary, text="Dispensed:", font=("Arial", 24, "bold"),
                  bg="white", fg="#2c3e50").pack(pady=15, padx=40)
         
-        tk.Label(summary, text=f"✓ Vitamin D: {vitaminD_dispensed} pills",
-                 font=("Arial", 22), bg="white", fg="#27ae60").pack(pady=10, padx=40)
-        
-        tk.Label(summary, text=f"✓ Vitamin C: {vitaminC_dispensed} pill",
-                 font=("Arial", 22), bg="white", fg="#27ae60").pack(pady=10, padx=40)
+        dispensed_label = tk.Label(summary, font=("Arial", 22), bg="white", fg="#27ae60",
+                                   justify="left")
+        dispensed_label.pack(pady=10, padx=40)
         
         tk.Label(summary, text=" ", bg="white").pack(pady=5)
         
@@ -410,19 +446,16 @@ class PillWheelUI:
         
         tk.Button(container, text="Complete", font=("Arial", 24, "bold"),
                   bg="#3498db", fg="white", padx=40, pady=20,
-                  command=self.show_home_screen).pack(pady=30)
+                  command=self.flow.collect).pack(pady=30)
         
-        print("\n" + "="*60)
-        print("✅ SUCCESS - ALL VITAMINS DISPENSED")
-        print(f"   Vitamin D: {vitaminD_dispensed}/{VITAMIN_D_REQUIRED}")
-        print(f"   Vitamin C: {vitaminC_dispensed}/{VITAMIN_C_REQUIRED}")
-        print("="*60)
+        return {"dispensed": dispensed_label}
+    
+    def update_success(self, widgets):
+        lines = [f"✓ {name}: {pill_text(count)}" for name, count in self.flow.released.items()]
+        widgets["dispensed"].config(text="\n".join(lines))
     
-    def call_assistance(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def build_assistance(self, frame):
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
         
         tk.Label(container, text="⚠️", font=("Arial", 80), bg="#f0f0f0").pack(pady=20)
@@ -431,16 +464,21 @@ class PillWheelUI:
         
         tk.Label(container, text="A care worker will help you shortly",
                  font=("Arial", 24), fg="#7f8c8d", bg="#f0f0f0").pack(pady=20)
-        
-        print("\n⚠️ ASSISTANCE CALLED")
-        self.root.after(10000, self.show_home_screen)
     
     def cleanup_and_exit(self):
         print("\n🛑 Shutting down...")
-        if PCA_OK:
-            servo1.angle = 0
-            servo2.angle = 0
-            pca.deinit()
+        self.scheduler.stop()
+        self.engine.stop()
+        if self.backend is not None:
+            self.backend.stop()
+        self.notifier.stop()
+        self.controller.shutdown()
+        self.hardware.shutdown()
+        print("\n⏱  Where the time went:\n" + tracer.summary())
+        print(f"📈 Trace written to {tracer.dump()} (open in https://ui.perfetto.dev)")
+        self.event_log.event("shutdown", "Shutting down")
+        if self.event_log.sink is not None:
+            self.event_log.sink.close()
         print("✅ Cleanup complete")
         self.root.quit()
 
@@ -449,12 +487,15 @@ if __name__ == "__main__":
     print("        PillWheel Dual Dispenser System")
     print("              Demo 1 - Dual Servo Setup")
     print("="*70)
-    print("Hardware:")
-    print(f"  Servos:  {'PCA9685 ✅' if PCA_OK else 'Simulation'}")
-    print(f"  Sensor:  {'VL53L0X ✅' if SENSOR_OK else 'Simulation'}")
-    print("\nPrescription:")
-    print(f"  Servo 1 (Ch 0): Vitamin D × {VITAMIN_D_REQUIRED}")
-    print(f"  Servo 2 (Ch 1): Vitamin C × {VITAMIN_C_REQUIRED}")
+    print("Hardware: PCA9685 + VL53L0X (initialized in the background)")
+    dose = get_prescription_store().patient_view(KIOSK_PATIENT_ID)
+    if dose is None:
+        # e.g. a backend prefetch replaced the patient list without the kiosk patient
+        print(f"\n⚠️ No prescription for patient {KIOSK_PATIENT_ID}")
+    else:
+        print(f"\nPrescription ({dose['name']}, due {dose['due']}):")
+        for item in dose["doses"]:
+            print(f"  Servo (Ch {item['channel']}): {item['medication']} × {item['pills']}")
     print("\nPress ESC to exit")
     print("="*70 + "\n")
     
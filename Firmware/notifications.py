@@ -0,0 +1,284 @@
+"""
+Staff notifications
+
+Assistance calls and missed doses alert the care staff. Notifier is an
+EventLog listener: an event of one of NOTIFY_KINDS becomes an alert that
+is put on each sink's bounded queue - a dict lookup and a queue put per
+sink on the caller's thread, so the kiosk screens (and the assistance
+screen's return home) never wait for it. Every sink has its own thread,
+so a pager that hangs doesn't hold up the alert to the backend:
+
+    FileNotifySink     appends JSON lines to NOTIFY_FILE
+    SocketNotifySink   JSON lines over TCP to a local listener (staff pager)
+    HttpNotifySink     POST /notifications to the backend (JAVA_API_URL)
+
+A sink that fails is retried with exponential backoff, up to NOTIFY_RETRIES
+attempts, on its own thread. The same alert for the same
+patient or medication (kind, patient, escalation level, medication) is
+only sent once per NOTIFY_DEDUPE_WINDOW.
+
+    python -m Firmware.notifications listen    # print alerts sent to NOTIFY_SOCKET
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from config.hardware_config import (JAVA_API_URL, KIOSK_ID, NOTIFY_DEDUPE_WINDOW, NOTIFY_FILE,
+                                    NOTIFY_KINDS, NOTIFY_QUEUE_SIZE, NOTIFY_RETRIES,
+                                    NOTIFY_RETRY_MAX, NOTIFY_SOCKET)
+
+
+# --- Sinks: send(alert) raises on failure ---
+
+class FileNotifySink:
+    name = "file"
+
+    def __init__(self, path=NOTIFY_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def send(self, alert):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(alert, default=str) + "\n")
+
+    def close(self):
+        pass
+
+
+class SocketNotifySink:
+    name = "socket"
+
+    def __init__(self, address=NOTIFY_SOCKET, timeout=2.0):
+        self.address = address
+        self.timeout = timeout
+        self.sock = None                # kept open between alerts
+
+    def send(self, alert):
+        data = (json.dumps(alert, default=str) + "\n").encode()
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, self.timeout)
+        try:
+            self.sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class HttpNotifySink:
+    name = "http"
+
+    def __init__(self, client=None, path="/notifications"):
+        from .backend import BackendClient
+        self.client = client or BackendClient()
+        self.path = path
+
+    def send(self, alert):
+        self.client.post(self.path, alert)
+
+    def close(self):
+        self.client.close()
+
+
+# --- Dispatcher ---
+
+class SinkWorker:
+    """One sink's bounded queue, retry heap and thread - a slow sink only delays itself"""
+
+    def __init__(self, notifier, sink, queue_size):
+        self.notifier = notifier
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.retrying = []              # heap of (time, seq, attempt, alert) - worker only
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"notifier-{self.sink.name}",
+                                       daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        clock = self.notifier.clock
+        while True:
+            timeout = None
+            if self.retrying:
+                timeout = max(0.0, self.retrying[0][0] - clock())
+            try:
+                alert = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                alert = False
+            if alert is None:
+                break
+            if alert:
+                self._send(alert, 1)
+            while self.retrying and self.retrying[0][0] <= clock():
+                at, seq, attempt, retried = heapq.heappop(self.retrying)
+                self.notifier.count("retried")
+                self._send(retried, attempt)
+        self.sink.close()
+
+    def _send(self, alert, attempt):
+        notifier = self.notifier
+        try:
+            self.sink.send(alert)
+        except Exception as e:
+            if attempt >= notifier.retries:
+                notifier.count("failed")
+                print(f"⚠️ Notification to {self.sink.name} failed after {attempt} "
+                      f"attempts: {e}")
+                return
+            delay = min(notifier.retry_max, 2 ** (attempt - 1))
+            heapq.heappush(self.retrying,
+                           (notifier.clock() + delay, next(notifier.seq), attempt + 1, alert))
+            return
+        notifier.count("sent")
+
+
+class Notifier:
+    def __init__(self, sinks, kinds=NOTIFY_KINDS, queue_size=NOTIFY_QUEUE_SIZE,
+                 dedupe_window=NOTIFY_DEDUPE_WINDOW, retries=NOTIFY_RETRIES,
+                 retry_max=NOTIFY_RETRY_MAX, kiosk_id=KIOSK_ID, clock=time.monotonic):
+        self.kinds = set(kinds)
+        self.dedupe_window = dedupe_window
+        self.retries = retries
+        self.retry_max = retry_max
+        self.kiosk_id = kiosk_id
+        self.clock = clock
+
+        self.workers = [SinkWorker(self, sink, queue_size) for sink in sinks]
+        self.recent = OrderedDict()     # (kind, patient, level, medication) -> last sent
+        self.lock = threading.Lock()    # recent and counts (caller and sink threads)
+        self.seq = itertools.count()
+        self.running = False
+        self.counts = {"alerts": 0, "suppressed": 0, "dropped": 0, "sent": 0, "retried": 0,
+                       "failed": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def put(self, entry):
+        """EventLog listener"""
+        if entry["kind"] in self.kinds:
+            self.alert(entry["kind"], entry.get("message", ""),
+                       **{key: value for key, value in entry.items()
+                          if key not in ("kind", "message")})
+
+    def alert(self, kind, message, patient_id=None, **fields):
+        """Queue an alert for the sinks (any thread, never blocks). False if suppressed,
+        or dropped because every sink's queue is full."""
+        now = self.clock()
+        key = (kind, patient_id, fields.get("level"), fields.get("medication"))
+        with self.lock:
+            # recent is in send order, so expired entries are all at the front
+            while self.recent:
+                if now - next(iter(self.recent.values())) < self.dedupe_window:
+                    break
+                self.recent.popitem(last=False)
+            if key in self.recent:
+                self.counts["suppressed"] += 1
+                return False
+            self.recent[key] = now
+        alert = {"kiosk": self.kiosk_id, "kind": kind, "message": message,
+                 "patient_id": patient_id, "time": fields.pop("time", time.time()), **fields}
+        queued = 0
+        for worker in self.workers:
+            try:
+                worker.queue.put_nowait(alert)
+                queued += 1
+            except queue.Full:
+                self.count("dropped")
+        if not queued:
+            with self.lock:
+                self.recent.pop(key, None)
+            return False
+        self.count("alerts")
+        return True
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.running = True
+        return self
+
+    def stop(self, timeout=2.0):
+        """Send what is queued (retries still waiting are given up) and stop"""
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.queue.put(None)
+        for worker in self.workers:
+            worker.thread.join(max(0.0, deadline - time.monotonic()))
+        self.running = False
+
+    def status(self):
+        with self.lock:
+            counts = dict(self.counts)
+        return dict(counts, queued=sum(worker.queue.qsize() for worker in self.workers),
+                    retrying=sum(len(worker.retrying) for worker in self.workers))
+
+
+def start_notifier(event_log=None):
+    """Notifier with the configured sinks, listening to event_log if given"""
+    sinks = [FileNotifySink()]
+    if NOTIFY_SOCKET:
+        sinks.append(SocketNotifySink())
+    if JAVA_API_URL:
+        sinks.append(HttpNotifySink())
+    notifier = Notifier(sinks)
+    if event_log is not None:
+        event_log.add_listener(notifier.put)
+    return notifier.start()
+
+
+# --- Local listener (stand-in for the staff pager) ---
+
+def listen(args):
+    class Pager(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                alert = json.loads(line)
+                print(f"🚨 [{alert['kind']}] {alert['message']} "
+                      f"(patient {alert.get('patient_id') or '-'}, {alert['kiosk']})")
+
+    server = socketserver.ThreadingTCPServer((args.host, args.port), Pager)
+    server.daemon_threads = True
+    print(f"📟 Listening for alerts on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Staff notifications")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    listen_parser = modes.add_parser("listen", help="print the alerts sent to the local socket")
+    host, port = NOTIFY_SOCKET or ("127.0.0.1", 8766)
+    listen_parser.add_argument("--host", default=host)
+    listen_parser.add_argument("--port", type=int, default=port)
+    args = parser.parse_args()
+    return listen(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
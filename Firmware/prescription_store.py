@@ -0,0 +1,251 @@
+"""
+Local prescription store
+
+Patients and their daily doses live in a SQLite file, indexed on patient
+id and due time. Patient records are kept in an in-memory LRU cache, so
+once a shift's patients are loaded (load_shift) the calling and
+verification screens render from a dict lookup instead of a query.
+
+    patients  id, name, room
+    doses     patient_id, medication, pills, channel, due ("HH:MM"), instructions
+
+channel is the PCA9685 channel of the dispenser holding the medication
+(None when it is not loaded in the PillWheel).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from config.hardware_config import PRESCRIPTION_CACHE_SIZE, PRESCRIPTION_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    room TEXT DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS doses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL REFERENCES patients(id),
+    medication TEXT NOT NULL,
+    pills INTEGER NOT NULL,
+    channel INTEGER,
+    due TEXT NOT NULL,
+    instructions TEXT DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS doses_by_patient ON doses(patient_id, due);
+CREATE INDEX IF NOT EXISTS doses_by_due ON doses(due);
+"""
+
+# Sample data for a fresh install (the old hard-coded demo prescription)
+DEMO_PATIENTS = [
+    ("001", "Patient 1", "", [
+        ("Vitamin D", 2, 0, "08:00", "Take with food"),
+        ("Vitamin C", 1, 1, "08:00", "Take with food"),
+        ("Vitamin D", 2, 0, "20:00", "Take with food"),
+        ("Vitamin C", 1, 1, "20:00", "Take with food"),
+    ]),
+]
+
+
+def pill_text(pills):
+    return f"{pills} pill" if pills == 1 else f"{pills} pills"
+
+
+def clock_text(due):
+    """ "20:00" -> "8:00 PM" """
+    return datetime.strptime(due, "%H:%M").strftime("%I:%M %p").lstrip("0")
+
+
+class PrescriptionStore:
+    def __init__(self, path=PRESCRIPTION_DB, cache_size=PRESCRIPTION_CACHE_SIZE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by the UI and the engine thread, guarded by the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+        self.cache = OrderedDict()      # patient id -> record, most recently used last
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.version = 0                # bumped on every write, for data derived from the store
+
+    # --- Writes ---
+
+    def add_patient(self, patient_id, name, room=""):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO patients (id, name, room) VALUES (?, ?, ?)",
+                            (patient_id, name, room))
+            self.version += 1
+        self.invalidate(patient_id)
+
+    def add_dose(self, patient_id, medication, pills, due, channel=None, instructions=""):
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO doses (patient_id, medication, pills, channel, due, "
+                            "instructions) VALUES (?, ?, ?, ?, ?, ?)",
+                            (patient_id, medication, pills, channel, due, instructions))
+            self.version += 1
+        self.invalidate(patient_id)
+
+    def replace_patients(self, patients):
+        """Swap in a full prescription list (a backend prefetch) in one transaction.
+        patients: [{"id", "name", "room", "doses": [{"medication", "pills", "due",
+        "channel", "instructions"}]}]"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM doses")
+            self.db.execute("DELETE FROM patients")
+            self.db.executemany("INSERT INTO patients (id, name, room) VALUES (?, ?, ?)",
+                                [(p["id"], p["name"], p.get("room") or "") for p in patients])
+            self.db.executemany("INSERT INTO doses (patient_id, medication, pills, channel, due, "
+                                "instructions) VALUES (?, ?, ?, ?, ?, ?)",
+                                [(p["id"], d["medication"], d["pills"], d.get("channel"),
+                                  d["due"], d.get("instructions") or "")
+                                 for p in patients for d in p.get("doses", [])])
+            self.cache.clear()
+            self.version += 1
+
+    def seed_demo(self):
+        """Insert the demo patients if the store is empty"""
+        with self.lock:
+            if self.db.execute("SELECT COUNT(*) FROM patients").fetchone()[0]:
+                return False
+            for patient_id, name, room, doses in DEMO_PATIENTS:
+                self.add_patient(patient_id, name, room)
+                for medication, pills, channel, due, instructions in doses:
+                    self.add_dose(patient_id, medication, pills, due, channel, instructions)
+        print(f"💊 Prescription store seeded with {len(DEMO_PATIENTS)} demo patient(s)")
+        return True
+
+    # --- Cached reads ---
+
+    def invalidate(self, patient_id=None):
+        """Drop one patient (or everyone) from the cache"""
+        with self.lock:
+            if patient_id is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(patient_id, None)
+
+    def patient(self, patient_id):
+        """Patient record with all doses sorted by due time, or None"""
+        with self.lock:
+            record = self.cache.get(patient_id)
+            if record is not None:
+                self.cache.move_to_end(patient_id)
+                self.hits += 1
+                return record
+            self.misses += 1
+            row = self.db.execute("SELECT id, name, room FROM patients WHERE id = ?",
+                                  (patient_id,)).fetchone()
+            if row is None:
+                return None
+            doses = self.db.execute("SELECT id, medication, pills, channel, due, instructions "
+                                    "FROM doses WHERE patient_id = ? ORDER BY due, id",
+                                    (patient_id,)).fetchall()
+            record = dict(row)
+            record["doses"] = [dict(dose) for dose in doses]
+            self._cache_put(patient_id, record)
+            return record
+
+    def _cache_put(self, patient_id, record):
+        self.cache[patient_id] = record
+        self.cache.move_to_end(patient_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def load_shift(self, start, end):
+        """Warm the cache with every patient who has a dose due in [start, end]"""
+        started = time.perf_counter()
+        ids = self.patients_due(start, end)
+        for patient_id in ids:
+            self.patient(patient_id)
+        print(f"💊 Loaded {len(ids)} patient(s) for {start}-{end} "
+              f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return ids
+
+    def patients_due(self, start, end):
+        """Ids of patients with a dose due between two "HH:MM" times"""
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT patient_id FROM doses "
+                                   "WHERE due BETWEEN ? AND ? ORDER BY due",
+                                   (start, end)).fetchall()
+        return [row[0] for row in rows]
+
+    def schedule(self):
+        """Every (due, patient id) pair in the store, in due order"""
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT due, patient_id FROM doses "
+                                   "ORDER BY due").fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def doses_due(self, patient_id, due):
+        """The doses a patient takes at one due time"""
+        record = self.patient(patient_id)
+        if record is None:
+            return []
+        return [dose for dose in record["doses"] if dose["due"] == due]
+
+    def next_due(self, patient_id, after=None):
+        """The patient's next due time at or after "HH:MM" (wrapping to tomorrow)"""
+        record = self.patient(patient_id)
+        if record is None or not record["doses"]:
+            return None
+        after = after or datetime.now().strftime("%H:%M")
+        times = sorted({dose["due"] for dose in record["doses"]})
+        return next((t for t in times if t >= after), times[0])
+
+    def patient_view(self, patient_id, due=None):
+        """What the kiosk screens show for one dose time (defaults to the next one)"""
+        record = self.patient(patient_id)
+        if record is None:
+            return None
+        due = due or self.next_due(patient_id)
+        doses = self.doses_due(patient_id, due)
+        times = sorted({dose["due"] for dose in record["doses"]})
+        following = times[(times.index(due) + 1) % len(times)] if due in times else None
+        # Two rows for one medication at the same time add up
+        required = {}
+        for dose in doses:
+            required[dose["medication"]] = required.get(dose["medication"], 0) + dose["pills"]
+        return {
+            "id": record["id"],
+            "name": record["name"],
+            "due": due,
+            "doses": doses,
+            "required": required,
+            "medication": ", ".join(required),
+            "dosage": ", ".join(pill_text(pills) for pills in required.values()),
+            "instructions": "; ".join(sorted({dose["instructions"] for dose in doses
+                                              if dose["instructions"]})),
+            "next_dose": clock_text(following) if following else "-",
+        }
+
+    def cache_stats(self):
+        return {"size": len(self.cache), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def get_prescription_store():
+    """The process-wide store, seeded with the demo patients on first use"""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = PrescriptionStore()
+            _shared_store.seed_demo()
+        return _shared_store
@@ -0,0 +1,76 @@
+"""
+Cached screen manager for the Tk kiosk UIs
+
+Each screen is built once, the first time it is shown, on its own frame
+stacked inside the main frame. Later transitions just refresh the
+screen's dynamic labels and raise its frame - no widgets are destroyed
+or recreated, so there is no flicker. Every switch is timed (a "screen
+<name>" tracer span, and report() per screen).
+Listeners (e.g. the UI bus) are told about every switch.
+"""
+
+import time
+import tkinter as tk
+
+from hardware.tracing import tracer
+
+
+class ScreenManager:
+    def __init__(self, parent, bg="#f0f0f0"):
+        self.parent = parent
+        self.bg = bg
+        self.builders = {}          # name -> (build, update)
+        self.screens = {}           # name -> (frame, widgets)
+        self.current = None
+        self.switch_times = {}      # name -> list of switch times in ms
+        self.listeners = []         # called with the screen name after each switch
+
+    def register(self, name, build, update=None):
+        """Register a screen.
+
+        build(frame) creates the widgets and returns a dict of the ones that
+        change. update(widgets, **fields) refreshes them on every show.
+        """
+        self.builders[name] = (build, update)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def show(self, name, **fields):
+        """Switch to a screen, building it on first use"""
+        started = time.perf_counter()
+        built = name not in self.screens
+        if built:
+            frame = tk.Frame(self.parent, bg=self.bg)
+            frame.place(relx=0, rely=0, relwidth=1, relheight=1)
+            widgets = self.builders[name][0](frame) or {}
+            self.screens[name] = (frame, widgets)
+
+        frame, widgets = self.screens[name]
+        update = self.builders[name][1]
+        if update is not None:
+            update(widgets, **fields)
+        frame.tkraise()
+        self.current = name
+        for callback in self.listeners:
+            callback(name)
+        self.parent.update_idletasks()
+
+        tracer.record(f"screen {name}", "ui", started, time.perf_counter() - started, built=built)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.switch_times.setdefault(name, []).append(elapsed)
+        return widgets
+
+    def widgets(self, name):
+        """Dynamic widgets of a built screen (empty before first show)"""
+        return self.screens.get(name, (None, {}))[1]
+
+    def report(self):
+        """Median and worst switch time per screen, in ms"""
+        summary = {}
+        for name, times in self.switch_times.items():
+            ordered = sorted(times)
+            summary[name] = {"count": len(times),
+                             "median_ms": ordered[len(ordered) // 2],
+                             "max_ms": ordered[-1]}
+        return summary
@@ -1,13 +1,32 @@
+import os
+import sys
 import tkinter as tk
 from datetime import datetime
 
+# Allow running this file directly (python3 Firmware/screencontrol.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Firmware.backend import start_backend
+from Firmware.dispense_controller import DispenseController
+from Firmware.dispense_engine import DispenseEngine
+from Firmware.dose_scheduler import DoseScheduler
+from Firmware.event_log import get_event_log
+from Firmware.notifications import start_notifier
+from Firmware.prescription_store import get_prescription_store
+from Firmware.screen_manager import ScreenManager
+from Firmware.state_manager import StateManager
+from Firmware.ui_bus import UIBus
+from Firmware.workflow import KioskWorkflow
+from hardware.provider import HardwareProvider
+from hardware.tracing import tracer
+
 """
 PILL DISPENSER TOUCHSCREEN INTERFACE
 
 Screen Flow:
 1. HOME SCREEN: Displays "PillWheel: Automated Medical Dispenser" with current date/time
-   - Default state when idle
+   - Default state when idle (the clock only ticks while this screen is shown)
    - Automatically transitions to "calling patient" when prescription is due
+     (DoseScheduler; patients due together are called one after another)
 
 2. CALLING PATIENT SCREEN: Alerts that a patient needs to collect medication
    - Shows "Calling for Patient [ID]"
@@ -18,9 +37,9 @@ Screen Flow:
    - Asks "Is this the correct prescription and dose?"
    - Buttons: "Yes" or "No"
    - If "No" → goes to assistance screen
-   - If "Yes" → proceeds to dispensing
+   - If "Yes" → pills are dispensed (DispenseController), then the dispensing screen
 
-4. ASSISTANCE SCREEN: If verification failed
+4. ASSISTANCE SCREEN: If verification or dispensing failed
    - Shows "Calling for Assistance"
    - Notifies staff that manual intervention is needed
    - Auto-returns to home screen after 10 seconds
@@ -32,6 +51,11 @@ Screen Flow:
    - Button: "Completed" for immediate return to home
    - Auto-returns to home screen after 5 seconds
 
+The flow itself (states, timeouts, dispensing) is workflow.KioskWorkflow,
+shared with the PillWheel UI and the headless kiosk; this class renders it.
+Widget updates from the engine and the clock go through the UI bus
+(coalesced per frame, applied only when changed and visible).
+
 Logging:
 - All actions are logged to the text widget with timestamps
 - Log displays at bottom of screen for debugging/monitoring
@@ -40,11 +64,15 @@ Logging:
 NOTE: Need to integrate with software team,
 Connect to database for real patient/prescription data
 Add facial recognition before showing verification screen
-Integrate with motor control code to actually dispense pills
 Add audio feedback for accessibility
 Connect notification system for missed doses
 """
 
+# Workflow state -> screen
+SCREENS = {"home": "home", "calling": "calling", "verification": "verification",
+           "dispensing": "preparing", "done": "dispensing", "assistance": "assistance"}
+
+
 class PillDispenserUI:
     def __init__(self, root):
         self.root = root
@@ -52,19 +80,53 @@ class PillDispenserUI:
         self.root.attributes("-fullscreen", True)
         self.root.configure(bg="#f0f0f0")
 
-        # Sample prescription data (NEED TO BE LINKED TO DATABASE!!)
-        self.current_patient = {
-            "id": "001",
-            "name": "Patient 1",
-            "medication": "Paracetamol",
-            "dosage": "2 pills",
-            "instructions": "Take after eating",
-            "next_dose": "8:00 PM"
-        }
+        # Prescriptions come from the local store; today's patients are cached up front
+        self.store = get_prescription_store()
+        self.store.load_shift("00:00", "23:59")
+
+        # Fires the calling screen when doses fall due and escalates missed ones
+        self.scheduler = DoseScheduler(self.store,
+                                       lambda kind, data: self.flow.handle_dose_event(kind, data))
+
+        # Same dispense path as the PillWheel kiosk; servo/sensor work runs on the engine
+        self.hardware = HardwareProvider()
+        self.controller = DispenseController.for_kiosk(self.hardware)
+        self.controller.use_state(StateManager())
+        self.engine = DispenseEngine(root, self.handle_engine_event)
+        self.root.bind('<Escape>', lambda e: self.shutdown())
 
         self.main_frame = tk.Frame(root, bg="#f0f0f0")
         self.main_frame.pack(expand=True, fill="both")
 
+        # Bounded in-memory log backing the on-screen view, persisted in the background
+        self.event_log = get_event_log()
+
+        # Screens are built once and raised on each transition
+        self.screens = ScreenManager(self.main_frame)
+        self.screens.register("home", self.build_home_screen)
+        self.screens.register("calling", self.build_calling_patient_screen,
+                              self.update_calling_patient_screen)
+        self.screens.register("verification", self.build_verification_screen,
+                              self.update_verification_screen)
+        self.screens.register("preparing", self.build_preparing_screen)
+        self.screens.register("assistance", self.build_assistance_screen)
+        self.screens.register("dispensing", self.build_dispensing_screen,
+                              self.update_dispensing_screen)
+        self.ui = UIBus(root, self.screens)
+        self.clock_day = None
+        self.clock_date = ""
+
+        # home → calling → verification → dispensing → done / assistance
+        self.flow = KioskWorkflow(
+            root, self.store, self.controller, self.engine, self.scheduler,
+            log=lambda kind, message="", **fields: self.log(message, kind, **fields))
+        self.flow.add_listener(self.render)
+
+        # Prescriptions are refreshed and dispense events uploaded in the background
+        self.backend = start_backend(self.store, self.event_log, self.engine)
+        # Assistance calls and missed doses alert the staff, off the UI thread
+        self.notifier = start_notifier(self.event_log)
+
         # REDUCED LOG HEIGHT - Now only ~5% of screen (80 pixels instead of 150)
         self.log_frame = tk.Frame(root, bg="white", height=80)
         self.log_frame.pack(side="bottom", fill="x")
@@ -84,29 +146,58 @@ class PillDispenserUI:
         self.log_text.config(yscrollcommand=scrollbar.set)
         scrollbar.config(command=self.log_text.yview)
 
-        self.show_home_screen()
+        self.flow.home()
         self.log("System initialized")
+        self.engine.submit(self.init_hardware_job)
+        self.scheduler.start(root)
 
-        self.update_clock()
+        self.ui.ticker("home", self.update_clock)
 
-    def log(self, message):
+    def log(self, message, kind="ui", **fields):
         """Add timestamped message to log"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
+        line = self.event_log.event(kind, message, ui="PillDispenserUI", **fields)
+        self.log_text.insert(tk.END, line + "\n")
 
-    def clear_main_frame(self):
-        """Clear all widgets from main frame"""
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-
-    def show_home_screen(self):
-        """Display default home screen with branding and time"""
-        self.clear_main_frame()
-        self.log("Displaying home screen")
+        # Keep the widget the same size as the ring buffer
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.event_log.lines.maxlen
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see(tk.END)
 
+    def init_hardware_job(self, engine):
+        """Bring up the servos and sensor (engine worker thread)"""
+        self.controller.start_hardware(self.hardware, engine.sleep)
+        engine.emit("hardware_ready")
+
+    def handle_engine_event(self, kind, data):
+        """Dispense engine events (Tk thread)"""
+        if self.flow.handle_engine_event(kind, data):
+            return
+        if kind == "hardware_ready":
+            self.log(self.hardware.status_text(), "hardware_ready")
+        elif kind == "prescriptions":
+            self.log(f"Prescriptions updated ({data['patients']} patients)", "prescriptions")
+            self.scheduler.load()
+
+    def render(self, kind, data):
+        """Show the workflow's state (Tk thread)"""
+        if kind == "progress":
+            item = data["progress"][data["name"]]
+            self.ui.set("preparing", "progress",
+                        text=f"{data['name']}: {item['count']}/{item['target']}"
+                             f"{' ✓' if item['done'] else ''}")
+            return
+        screen = SCREENS[data["screen"]]
+        if screen == "home":
+            self.log("Displaying home screen")
+        elif screen == "preparing":
+            self.ui.set("preparing", "progress", text="")
+        self.screens.show(screen, patient=data["patient"])
+
+    def build_home_screen(self, frame):
+        """Build home screen widgets (once)"""
         # centered container
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
 
         # Title
@@ -125,11 +216,12 @@ class PillDispenserUI:
         subtitle.pack(pady=10)
 
         # Date and time display
-        self.datetime_label = tk.Label(container,
-                                       font=("Arial", 24),
-                                       fg="#7f8c8d",
-                                       bg="#f0f0f0")
-        self.datetime_label.pack(pady=30)
+        datetime_label = tk.Label(container,
+                                  font=("Arial", 24),
+                                  fg="#7f8c8d",
+                                  bg="#f0f0f0")
+        datetime_label.pack(pady=30)
+        self.ui.bind("home", "clock", datetime_label)
 
         # SIMULATION!!
         test_btn = tk.Button(container,
@@ -139,22 +231,22 @@ class PillDispenserUI:
                              fg="white",
                              padx=30,
                              pady=15,
-                             command=self.show_calling_patient_screen)
+                             command=lambda: self.flow.call())
         test_btn.pack(pady=30)
 
     def update_clock(self):
-        """Update date/time display on home screen"""
-        if hasattr(self, 'datetime_label') and self.datetime_label.winfo_exists():
-            current_time = datetime.now().strftime("%A, %d %B %Y\n%H:%M:%S")
-            self.datetime_label.config(text=current_time)
-        self.root.after(1000, self.update_clock)
-
-    def show_calling_patient_screen(self):
-        """Display screen calling patient to collect medication"""
-        self.clear_main_frame()
-        self.log(f"Calling patient {self.current_patient['id']}")
-
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+        """Update date/time display on home screen (UI bus ticker, only runs while it is shown).
+        Returns seconds until the next full second."""
+        now = datetime.now()
+        if now.date() != self.clock_day:
+            self.clock_day = now.date()
+            self.clock_date = now.strftime("%A, %d %B %Y")
+        self.ui.set("home", "clock", text=f"{self.clock_date}\n{now:%H:%M:%S}")
+        return 1 - now.microsecond / 1e6
+
+    def build_calling_patient_screen(self, frame):
+        """Build calling patient widgets (once)"""
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
 
         # Alert icon (using text, could use image in production)
@@ -166,7 +258,6 @@ class PillDispenserUI:
 
         # Message
         message = tk.Label(container,
-                           text=f"Calling for {self.current_patient['name']}",
                            font=("Arial", 36, "bold"),
                            fg="#e74c3c",
                            bg="#f0f0f0")
@@ -187,15 +278,17 @@ class PillDispenserUI:
                               fg="white",
                               padx=40,
                               pady=25,
-                              command=self.show_verification_screen)
+                              command=self.flow.ready)
         ready_btn.pack(pady=40)
 
-    def show_verification_screen(self):
-        """Display prescription details for patient verification"""
-        self.clear_main_frame()
-        self.log("Showing prescription verification")
+        return {"message": message}
 
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def update_calling_patient_screen(self, widgets, patient):
+        widgets["message"].config(text=f"Calling for {patient['name']}")
+
+    def build_verification_screen(self, frame):
+        """Build prescription verification widgets (once)"""
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
 
         header = tk.Label(container,
@@ -211,14 +304,12 @@ class PillDispenserUI:
         details_frame.pack(pady=20, padx=40)
 
         med_name = tk.Label(details_frame,
-                            text=f"Medication: {self.current_patient['medication']}",
                             font=("Arial", 28, "bold"),
                             bg="white",
                             fg="#2c3e50")
         med_name.pack(pady=20, padx=50)
 
         dosage = tk.Label(details_frame,
-                          text=f"Dosage: {self.current_patient['dosage']}",
                           font=("Arial", 26),
                           bg="white",
                           fg="#34495e")
@@ -244,7 +335,7 @@ class PillDispenserUI:
                             width=10,
                             padx=30,
                             pady=20,
-                            command=self.show_dispensing_screen)
+                            command=self.flow.confirm)
         yes_btn.pack(side="left", padx=20)
 
         no_btn = tk.Button(button_frame,
@@ -255,15 +346,34 @@ class PillDispenserUI:
                            width=10,
                            padx=30,
                            pady=20,
-                           command=self.show_assistance_screen)
+                           command=lambda: self.flow.reject())
         no_btn.pack(side="left", padx=20)
 
-    def show_assistance_screen(self):
-        """Display assistance screen when verification fails"""
-        self.clear_main_frame()
-        self.log("Verification failed - calling for assistance")
+        return {"medication": med_name, "dosage": dosage}
+
+    def update_verification_screen(self, widgets, patient):
+        widgets["medication"].config(text=f"Medication: {patient['medication']}")
+        widgets["dosage"].config(text=f"Dosage: {patient['dosage']}")
 
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def build_preparing_screen(self, frame):
+        """Build the screen shown while the pills are dispensed (once)"""
+        container = tk.Frame(frame, bg="#f0f0f0")
+        container.place(relx=0.5, rely=0.5, anchor="center")
+
+        tk.Label(container, text="⏳", font=("Arial", 80), bg="#f0f0f0").pack(pady=20)
+        tk.Label(container,
+                 text="Preparing Your Medication...",
+                 font=("Arial", 36, "bold"),
+                 fg="#3498db",
+                 bg="#f0f0f0").pack(pady=20)
+
+        progress = tk.Label(container, font=("Arial", 24), fg="#7f8c8d", bg="#f0f0f0")
+        progress.pack(pady=10)
+        self.ui.bind("preparing", "progress", progress)
+
+    def build_assistance_screen(self, frame):
+        """Build assistance widgets (once)"""
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
 
         # Alert
@@ -287,15 +397,9 @@ class PillDispenserUI:
                         bg="#f0f0f0")
         info.pack(pady=10)
 
-        # Auto-return to home after 10 seconds
-        self.root.after(10000, self.show_home_screen)
-
-    def show_dispensing_screen(self):
-        """Display dispensing confirmation and instructions"""
-        self.clear_main_frame()
-        self.log("Dispensing medication")
-
-        container = tk.Frame(self.main_frame, bg="#f0f0f0")
+    def build_dispensing_screen(self, frame):
+        """Build dispensing confirmation widgets (once)"""
+        container = tk.Frame(frame, bg="#f0f0f0")
         container.place(relx=0.5, rely=0.5, anchor="center")
 
         # Success icon
@@ -326,7 +430,6 @@ class PillDispenserUI:
         inst_header.pack(pady=15, padx=40)
 
         inst_text = tk.Label(instructions_frame,
-                             text=self.current_patient['instructions'],
                              font=("Arial", 22),
                              bg="white",
                              fg="#34495e")
@@ -334,7 +437,6 @@ class PillDispenserUI:
 
         # Next dose info
         next_dose = tk.Label(container,
-                             text=f"Your next dose is scheduled for {self.current_patient['next_dose']}",
                              font=("Arial", 20),
                              fg="#7f8c8d",
                              bg="#f0f0f0")
@@ -348,16 +450,28 @@ class PillDispenserUI:
                                  fg="white",
                                  padx=40,
                                  pady=20,
-                                 command=self.complete_dispense)
+                                 command=self.flow.collect)
         complete_btn.pack(pady=20)
 
-        # Auto-return to home after 5 seconds
-        self.root.after(5000, self.complete_dispense)
-
-    def complete_dispense(self):
-        """Log completion and return to home screen"""
-        self.log("Dispensing completed - returning to home screen")
-        self.show_home_screen()
+        return {"instructions": inst_text, "next_dose": next_dose}
+
+    def update_dispensing_screen(self, widgets, patient):
+        widgets["instructions"].config(text=patient['instructions'])
+        widgets["next_dose"].config(text=f"Your next dose is scheduled for {patient['next_dose']}")
+
+    def shutdown(self):
+        self.scheduler.stop()
+        self.engine.stop()
+        if self.backend is not None:
+            self.backend.stop()
+        self.notifier.stop()
+        self.controller.shutdown()
+        self.hardware.shutdown()
+        self.log(f"Trace written to {tracer.dump()}")
+        # Write out what the file sink still has queued
+        if self.event_log.sink is not None:
+            self.event_log.sink.close()
+        self.root.quit()
 
 # Main application
 if __name__ == "__main__":
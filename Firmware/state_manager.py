@@ -0,0 +1,234 @@
+"""
+Dispense state manager
+
+The dispense state is an explicit state machine whose every change is an
+event appended to a JSON-lines log:
+
+    idle / complete     --start-->                  dispensing
+    dispensing          --attempt, pill, baseline-->  dispensing
+    dispensing          --complete-->               complete
+    dispensing          --fail-->                   failed
+    dispensing / failed --start (same dose)-->      dispensing   (resume)
+    dispensing / failed --reset-->                  idle         (staff emptied the stage)
+
+Events that must survive a power cut (start, pill, complete, fail, reset)
+are fsynced before the call returns. Everything else is written straight
+away but only fsynced with the next durable event, or once
+STATE_FSYNC_BATCH events / STATE_FSYNC_INTERVAL seconds have built up.
+The disk cost is one fsync per pill, not one per state change.
+
+Every STATE_SNAPSHOT_EVERY events the state is snapshotted (written to a
+temp file, fsynced, renamed) and the log is truncated. Recovery loads the
+snapshot and replays the log after it, cutting off a torn last line. The
+pills already dispensed for an unfinished dose are therefore known and
+are not dispensed again.
+"""
+
+import json
+import os
+import threading
+import time
+
+from config.hardware_config import (STATE_DIR, STATE_FSYNC_BATCH, STATE_FSYNC_INTERVAL,
+                                    STATE_SNAPSHOT_EVERY)
+
+IDLE = "idle"
+DISPENSING = "dispensing"
+COMPLETE = "complete"
+FAILED = "failed"
+
+# (state, event) -> next state
+TRANSITIONS = {
+    (IDLE, "start"): DISPENSING,
+    (COMPLETE, "start"): DISPENSING,
+    (DISPENSING, "start"): DISPENSING,      # resume the same dose only
+    (FAILED, "start"): DISPENSING,          # retry the same dose only
+    (DISPENSING, "attempt"): DISPENSING,
+    (DISPENSING, "pill"): DISPENSING,
+    (DISPENSING, "baseline"): DISPENSING,
+    (DISPENSING, "complete"): COMPLETE,
+    (DISPENSING, "fail"): FAILED,
+    (DISPENSING, "reset"): IDLE,
+    (FAILED, "reset"): IDLE,
+}
+
+DURABLE = {"start", "pill", "complete", "fail", "reset"}
+
+
+def initial_state():
+    return {"state": IDLE, "patient_id": None, "due": None, "required": {},
+            "dispensed": {}, "attempts": {}, "baseline": None, "seq": 0}
+
+
+def apply(state, event):
+    """Return the state after one event (pure, used live and for replay)"""
+    kind = event["kind"]
+    state = dict(state, state=TRANSITIONS[(state["state"], kind)], seq=event["seq"])
+    if kind == "start":
+        if event.get("resume"):
+            return state
+        state.update(patient_id=event["patient_id"], due=event["due"],
+                     required=dict(event["required"]), dispensed={}, attempts={},
+                     baseline=None)
+    elif kind == "attempt":
+        state["attempts"] = dict(state["attempts"])
+        state["attempts"][event["medication"]] = state["attempts"].get(event["medication"], 0) + 1
+    elif kind == "pill":
+        state["dispensed"] = dict(state["dispensed"])
+        state["dispensed"][event["medication"]] = state["dispensed"].get(event["medication"], 0) + 1
+    elif kind == "baseline":
+        state["baseline"] = event["mm"]
+    elif kind == "reset":
+        state = dict(initial_state(), seq=event["seq"])
+    return state
+
+
+class StateManager:
+    def __init__(self, directory=STATE_DIR, fsync_batch=STATE_FSYNC_BATCH,
+                 fsync_interval=STATE_FSYNC_INTERVAL, snapshot_every=STATE_SNAPSHOT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, "events.jsonl")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+
+        self.state = initial_state()
+        self.recovery_ms = self.recover()
+        self.log = open(self.log_path, "a")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.since_snapshot = 0
+        self.fsyncs = 0
+
+    # --- Recovery ---
+
+    def recover(self):
+        """Rebuild the state from the snapshot and the log. Returns milliseconds taken."""
+        started = time.perf_counter()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                self.state = json.load(f)
+        replayed = 0
+        if os.path.exists(self.log_path):
+            good = 0                    # byte offset just past the last whole event
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break           # torn write at power loss - everything after is lost
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    if event["seq"] > self.state["seq"]:
+                        self.state = apply(self.state, event)
+                        replayed += 1
+            # Cut the torn tail off, or the next event is appended onto it and
+            # the following replay stops there
+            if good < os.path.getsize(self.log_path):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good)
+                    os.fsync(f.fileno())
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.state["state"] != IDLE or replayed:
+            print(f"♻️  State recovered in {elapsed:.1f}ms ({replayed} events replayed): "
+                  f"{self.state['state']}, dispensed {self.state['dispensed']}")
+        return elapsed
+
+    # --- Transitions ---
+
+    def start(self, patient_id, due, required):
+        """Begin a dose, or resume it if it is the unfinished one"""
+        with self.lock:
+            same = (self.state["patient_id"], self.state["due"]) == (patient_id, due)
+            if self.state["state"] in (DISPENSING, FAILED):
+                if not same:
+                    raise ValueError(f"Cannot start {patient_id} {due}: "
+                                     f"{self.state['patient_id']} {self.state['due']} "
+                                     f"is {self.state['state']}")
+                return self._record("start", resume=True)
+            return self._record("start", patient_id=patient_id, due=due, required=required)
+
+    def attempt(self, medication):
+        return self._record("attempt", medication=medication)
+
+    def pill(self, medication):
+        return self._record("pill", medication=medication)
+
+    def baseline(self, mm):
+        return self._record("baseline", mm=mm)
+
+    def complete(self):
+        return self._record("complete")
+
+    def fail(self, reason=""):
+        return self._record("fail", reason=reason)
+
+    def reset(self):
+        return self._record("reset")
+
+    # --- Queries ---
+
+    @property
+    def in_progress(self):
+        return self.state["state"] in (DISPENSING, FAILED)
+
+    def dose_key(self):
+        return (self.state["patient_id"], self.state["due"])
+
+    def remaining(self):
+        """Pills still to dispense per medication for the current dose"""
+        return {name: count - self.state["dispensed"].get(name, 0)
+                for name, count in self.state["required"].items()}
+
+    # --- Storage ---
+
+    def _record(self, kind, **fields):
+        with self.lock:
+            if (self.state["state"], kind) not in TRANSITIONS:
+                raise ValueError(f"'{kind}' not allowed while {self.state['state']}")
+            event = {"seq": self.state["seq"] + 1, "kind": kind, "time": time.time()}
+            event.update(fields)
+            self.state = apply(self.state, event)
+
+            self.log.write(json.dumps(event) + "\n")
+            self.log.flush()
+            self.unsynced += 1
+            if (kind in DURABLE or self.unsynced >= self.fsync_batch
+                    or time.monotonic() - self.last_sync >= self.fsync_interval):
+                self._sync()
+
+            self.since_snapshot += 1
+            if self.since_snapshot >= self.snapshot_every:
+                self.snapshot()
+            return self.state
+
+    def _sync(self):
+        os.fsync(self.log.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.fsyncs += 1
+
+    def snapshot(self):
+        """Persist the whole state and truncate the log"""
+        with self.lock:
+            self._sync()
+            temp = self.snapshot_path + ".tmp"
+            with open(temp, "w") as f:
+                json.dump(self.state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.snapshot_path)
+            # Events up to the snapshot's seq are skipped on replay, so a crash
+            # between the rename and the truncate is harmless
+            self.log.truncate(0)
+            self.log.seek(0)
+            self.since_snapshot = 0
+
+    def close(self):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+            self.log.close()
@@ -0,0 +1,185 @@
+"""
+Offline detection tuning over recorded traces
+
+Loads labelled traces from TraceRecorder files and replays them through
+the rule the streaming DropDetector applies - `confirm` consecutive
+readings at least `delta` mm off the baseline, or a spread of
+`variation` mm across the last `window` readings (less the `confirm` - 1
+highest and lowest) - for every parameter
+combination in one NumPy batch, reporting false-positive and
+false-negative rates for each.
+
+A trace starts at release and (for a detection) ends at the detection;
+its baseline is the last reading before release, which also stands in
+for the readings already in the detector's window. As in the detector,
+the baseline follows the quiet readings (BaselineTracker's EWMA).
+
+Usage:
+    python -m Firmware.trace_analysis logs/dispense_traces.jsonl [more files...]
+"""
+
+import argparse
+
+try:
+    import numpy as np
+    NUMPY_OK = True
+except ImportError:
+    NUMPY_OK = False
+
+from .detection import (BASELINE_ALPHA, DETECT_CONFIRM, DETECT_DELTA_MM, DETECT_VARIATION_MM,
+                        DETECT_WINDOW)
+from .trace_recorder import load_traces
+
+DEFAULT_DELTAS = range(2, 21)           # mm
+DEFAULT_VARIATIONS = range(2, 31, 2)    # mm
+DEFAULT_CONFIRMS = (1, 2, 3, 4)         # readings
+DEFAULT_WINDOWS = (4, 6, 8, 12, 16)     # readings
+
+
+def traces_to_arrays(traces):
+    """Pack labelled traces into NaN-padded arrays.
+
+    Returns (samples, baselines, truth) with shapes (N, L), (N,), (N,).
+    """
+    labelled = [tr for tr in traces if tr.get("truth") is not None and tr["mm"]
+                and tr["baseline"] is not None]
+    if not labelled:
+        raise ValueError("no labelled traces to analyze")
+    length = max(len(tr["mm"]) for tr in labelled)
+
+    samples = np.full((len(labelled), length), np.nan)
+    for i, tr in enumerate(labelled):
+        samples[i, :len(tr["mm"])] = tr["mm"]
+    baselines = np.array([tr["baseline"] for tr in labelled], dtype=float)
+    truth = np.array([bool(tr["truth"]) for tr in labelled])
+    return samples, baselines, truth
+
+
+def off_baseline(samples, baselines, deltas, alpha=BASELINE_ALPHA):
+    """(D, N, L) readings at least delta off the tracked baseline"""
+    tracked = np.repeat(baselines[None, :], len(deltas), axis=0)       # (D, N)
+    off = np.zeros((len(deltas),) + samples.shape, dtype=bool)
+    for step in range(samples.shape[1]):
+        reading = samples[:, step]
+        with np.errstate(invalid="ignore"):
+            edge = np.abs(reading - tracked) >= deltas[:, None]
+        quiet = ~edge & ~np.isnan(reading)
+        tracked = np.where(quiet, tracked + alpha * (reading - tracked), tracked)
+        off[:, :, step] = edge
+    return off
+
+
+def longest_runs(edges):
+    """Longest run of True along the last axis"""
+    counts = np.cumsum(edges, axis=-1)
+    at_reset = np.maximum.accumulate(np.where(edges, 0, counts), axis=-1)
+    return (counts - at_reset).max(axis=-1)
+
+
+def max_spreads(samples, baselines, confirms, windows):
+    """(C, K, N) largest spread over any `window` consecutive readings, leaving
+    out the confirm - 1 highest and lowest"""
+    windows = [int(w) for w in windows]
+    # The window is full of pre-release readings when the trace starts
+    lead = np.repeat(baselines[:, None], max(windows) - 1, axis=1)
+    padded = np.concatenate([lead, samples], axis=1)
+    spreads = np.zeros((len(confirms), len(windows), len(samples)))
+    for k, window in enumerate(windows):
+        view = np.sort(np.lib.stride_tricks.sliding_window_view(padded, window, axis=1), axis=2)
+        # A window running into the NaN padding holds nothing a full one doesn't
+        full = ~np.isnan(view[:, :, -1])
+        for c, confirm in enumerate(confirms):
+            trim = min(int(confirm) - 1, (window - 1) // 2)
+            spread = view[:, :, window - 1 - trim] - view[:, :, trim]
+            spreads[c, k] = np.where(full, spread, 0.0).max(axis=1)
+    return spreads
+
+
+def sweep(samples, baselines, truth, deltas=DEFAULT_DELTAS, variations=DEFAULT_VARIATIONS,
+          confirms=DEFAULT_CONFIRMS, windows=DEFAULT_WINDOWS):
+    """Evaluate every (delta, variation, confirm, window) rule at once.
+
+    Returns a dict of arrays indexed [delta, variation, confirm, window]:
+    false_positive and false_negative rates, plus the axes.
+    """
+    deltas = np.asarray(list(deltas), dtype=float)
+    variations = np.asarray(list(variations), dtype=float)
+    confirms = np.asarray(list(confirms), dtype=int)
+    windows = np.asarray(list(windows), dtype=int)
+
+    # (D, N) longest run of readings off the baseline (NaN padding is never off)
+    runs = longest_runs(off_baseline(samples, baselines, deltas))
+    edge = runs[:, None, :] >= confirms[None, :, None]                     # (D, C, N)
+    spread = max_spreads(samples, baselines, confirms, windows)[None] >= \
+        variations[:, None, None, None]                                    # (V, C, K, N)
+
+    # (D, V, C, K, N) detection decisions
+    detected = edge[:, None, :, None, :] | spread[None]
+
+    positives = max(int(truth.sum()), 1)
+    negatives = max(int((~truth).sum()), 1)
+    false_positive = (detected & ~truth).sum(axis=-1) / negatives
+    false_negative = (~detected & truth).sum(axis=-1) / positives
+    return {
+        "deltas": deltas,
+        "variations": variations,
+        "confirms": confirms,
+        "windows": windows,
+        "false_positive": false_positive,
+        "false_negative": false_negative,
+    }
+
+
+def best_rules(result, fn_weight=1.0, top=10):
+    """Rank rules by fp + fn_weight * fn, fewest confirming readings first on ties"""
+    cost = result["false_positive"] + fn_weight * result["false_negative"]
+    confirms = result["confirms"][None, None, :, None]
+    order = np.lexsort((np.broadcast_to(confirms, cost.shape).ravel(), cost.ravel()))
+    rules = []
+    for flat in order[:top]:
+        d, v, c, w = np.unravel_index(flat, cost.shape)
+        rules.append({
+            "delta": float(result["deltas"][d]),
+            "variation": float(result["variations"][v]),
+            "confirm": int(result["confirms"][c]),
+            "window": int(result["windows"][w]),
+            "false_positive": float(result["false_positive"][d, v, c, w]),
+            "false_negative": float(result["false_negative"][d, v, c, w]),
+        })
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune pill detection thresholds")
+    parser.add_argument("files", nargs="+", help="trace files from TraceRecorder")
+    parser.add_argument("--fn-weight", type=float, default=1.0,
+                        help="cost of a missed pill relative to a false detection")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if not NUMPY_OK:
+        print("⚠️ NumPy is required for trace analysis (pip install numpy)")
+        return 1
+
+    traces = []
+    for path in args.files:
+        traces.extend(load_traces(path))
+    samples, baselines, truth = traces_to_arrays(traces)
+    print(f"{len(truth)} labelled traces ({int(truth.sum())} pills, {int((~truth).sum())} misses)")
+
+    result = sweep(samples, baselines, truth)
+    current = sweep(samples, baselines, truth, [DETECT_DELTA_MM], [DETECT_VARIATION_MM],
+                    [DETECT_CONFIRM], [DETECT_WINDOW])
+    print(f"Current rule (delta {DETECT_DELTA_MM}mm, variation {DETECT_VARIATION_MM}mm, "
+          f"confirm {DETECT_CONFIRM}, window {DETECT_WINDOW}): "
+          f"FP {current['false_positive'].item():.1%}  FN {current['false_negative'].item():.1%}")
+
+    print(f"\n{'delta':>6} {'var':>6} {'confirm':>8} {'window':>7} {'FP':>7} {'FN':>7}")
+    for rule in best_rules(result, args.fn_weight, args.top):
+        print(f"{rule['delta']:>6.0f} {rule['variation']:>6.0f} {rule['confirm']:>8} "
+              f"{rule['window']:>7} {rule['false_positive']:>7.1%} {rule['false_negative']:>7.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+"""
+Dispense attempt trace recorder
+
+Saves the raw ToF readings behind every detection decision so the
+thresholds can be tuned offline (see trace_analysis.py) instead of by
+watching printouts. One JSON object per line:
+
+    {"id": ..., "time": ..., "channel": "Vitamin D", "baseline": 150,
+     "t": [0.0, 0.02, ...], "mm": [150, 149, ...],
+     "detected": true, "truth": true}
+
+"t" is seconds since the pill was released. "truth" is the ground truth
+(did a pill actually drop) when it is known - the simulator always knows
+it (see truth_source); on hardware it can be added later with label().
+
+Traces are written by the event log's FileSink: batched on a background
+thread and rotated at TRACE_MAX_BYTES, keeping TRACE_BACKUPS old files.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from config.hardware_config import TOF_BUFFER_SIZE, TRACE_BACKUPS, TRACE_FILE, TRACE_MAX_BYTES
+
+from .event_log import FileSink
+
+
+class TraceRecorder:
+    def __init__(self, path=TRACE_FILE, capacity=TOF_BUFFER_SIZE, max_bytes=TRACE_MAX_BYTES,
+                 backups=TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent = deque(maxlen=capacity)    # (t, mm) from the sensor stream
+        self.lock = threading.Lock()
+        self.sink = None                # FileSink, started with the first trace
+        # Optional truth_source(channel, t_open, t_close) -> bool, e.g. from the simulator
+        self.truth_source = None
+
+    def feed(self, t, distance):
+        """ToFSampler listener - keeps recent readings for record_window()"""
+        self.recent.append((t, distance))
+
+    def record(self, channel, times, samples, baseline, detected, truth=None):
+        """Save one attempt's readings. times are seconds since release."""
+        trace = {
+            "id": uuid.uuid4().hex[:12],
+            "time": time.time(),
+            "channel": channel,
+            "baseline": baseline,
+            "t": [round(t, 4) for t in times],
+            "mm": list(samples),
+            "detected": bool(detected),
+            "truth": truth,
+        }
+        self._append(trace)
+        return trace["id"]
+
+    def record_window(self, channel, t_open, t_close, detected, truth=None):
+        """Save the streamed readings between release (t_open) and t_close"""
+        window = [(t, d) for t, d in list(self.recent) if t_open <= t <= t_close]
+        before = [d for t, d in list(self.recent) if t < t_open]
+        baseline = before[-1] if before else (window[0][1] if window else None)
+        if truth is None and self.truth_source is not None:
+            truth = self.truth_source(channel, t_open, t_close)
+        return self.record(channel, [t - t_open for t, d in window],
+                           [d for t, d in window], baseline, detected, truth)
+
+    def label(self, trace_id, truth):
+        """Attach ground truth to an earlier trace"""
+        self._append({"id": trace_id, "truth": bool(truth), "label": True})
+
+    def close(self):
+        """Write out the queued traces"""
+        with self.lock:
+            sink, self.sink = self.sink, None
+        if sink is not None:
+            sink.close()
+
+    def _append(self, entry):
+        with self.lock:
+            if self.sink is None:
+                self.sink = FileSink(self.path, self.max_bytes, self.backups,
+                                     name="trace-writer")
+            self.sink.put(entry)
+
+
+def load_traces(path, backups=TRACE_BACKUPS):
+    """Read a trace file and its rotated backups (oldest first), applying any
+    later labels. Returns a list of dicts."""
+    traces = {}
+    paths = [f"{path}.{index}" for index in range(backups, 0, -1)] + [path]
+    for name in paths:
+        if name != path and not os.path.exists(name):
+            continue
+        with open(name) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("label"):
+                    if entry["id"] in traces:
+                        traces[entry["id"]]["truth"] = entry["truth"]
+                else:
+                    traces[entry["id"]] = entry
+    return list(traces.values())
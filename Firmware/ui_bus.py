@@ -0,0 +1,99 @@
+"""
+Coalesced UI update bus for the Tk kiosk UIs
+
+Dispense engine, dose scheduler and clock events don't touch widgets
+themselves - they set fields on the bus:
+
+    ui.bind("dispensing", "status", status_label)     # in the screen builder
+    ui.set("dispensing", "status", text="Vitamin D: 1/2")
+
+Fields set during one frame (UI_FRAME_MS) are coalesced, the last value
+wins, and a widget is only configured when its options actually changed.
+Fields of a hidden screen wait until it is shown. Nothing is scheduled
+while nothing changes, and a ticker (the home screen clock) only runs
+while its screen is visible, so an idle kiosk does no Tk work.
+"""
+
+import time
+
+from config.hardware_config import UI_FRAME_MS
+from hardware.tracing import tracer
+
+
+class UIBus:
+    def __init__(self, root, screens, frame_ms=UI_FRAME_MS):
+        self.root = root
+        self.screens = screens      # screen_manager.ScreenManager
+        self.frame_ms = frame_ms
+
+        self.widgets = {}           # (screen, field) -> widget
+        self.pending = {}           # (screen, field) -> options not on screen yet
+        self.applied = {}           # (screen, field) -> options last configured
+        self.tickers = {}           # screen -> [callback, after id]
+        self.frame = None           # after id of the scheduled flush
+        self.sets = 0
+        self.configs = 0
+        screens.add_listener(self.screen_shown)
+
+    def bind(self, screen, field, widget):
+        """Route a field of a screen to a widget (call from the screen builder)"""
+        self.widgets[(screen, field)] = widget
+        self.applied.pop((screen, field), None)
+
+    def set(self, screen, field, **options):
+        """Queue widget options for the next frame (Tk thread only)"""
+        self.sets += 1
+        self.pending[(screen, field)] = options
+        if self.frame is None and screen == self.screens.current:
+            self.frame = self.root.after(self.frame_ms, self._on_frame)
+
+    def ticker(self, screen, callback):
+        """Call callback() while screen is visible; it returns seconds until the next call"""
+        self.tickers[screen] = [callback, None]
+        if screen == self.screens.current:
+            self._tick(screen)
+
+    def flush(self, screen=None):
+        """Apply the changed fields of the visible screen (or of `screen`)"""
+        screen = screen or self.screens.current
+        started = time.perf_counter()
+        configured = 0
+        for key in [key for key in self.pending if key[0] == screen and key in self.widgets]:
+            options = self.pending.pop(key)
+            widget = self.widgets[key]
+            if self.applied.get(key) == options:
+                continue
+            widget.config(**options)
+            self.applied[key] = options
+            configured += 1
+        if self.frame is not None and screen == self.screens.current:
+            self.root.after_cancel(self.frame)  # nothing left for the frame to do
+            self.frame = None
+        if configured:
+            self.configs += configured
+            tracer.record("ui_flush", "ui", started, time.perf_counter() - started,
+                          screen=screen, widgets=configured)
+
+    def screen_shown(self, name):
+        """ScreenManager listener: bring the new screen up to date, move the tickers"""
+        for screen, entry in self.tickers.items():
+            if screen != name and entry[1] is not None:
+                self.root.after_cancel(entry[1])
+                entry[1] = None
+        if name in self.tickers and self.tickers[name][1] is None:
+            self._tick(name, flush=False)
+        self.flush(name)
+
+    def _on_frame(self):
+        self.frame = None
+        self.flush()
+
+    def _tick(self, screen, flush=True):
+        entry = self.tickers[screen]
+        delay = entry[0]()
+        entry[1] = self.root.after(max(1, int(delay * 1000)), self._tick, screen)
+        if flush:
+            self.flush(screen)
+
+    def report(self):
+        return {"sets": self.sets, "configs": self.configs}
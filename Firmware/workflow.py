@@ -0,0 +1,313 @@
+"""
+Kiosk workflow
+
+The patient flow both touchscreen UIs run, with no widgets of its own:
+
+    home            --call-->                      calling
+    home / calling  --verify / ready-->            verification
+    verification    --confirm-->                   dispensing
+    verification    --reject-->                    assistance
+    dispensing      --done-->                      done
+    dispensing      --max_attempts / error-->      assistance
+    done            --collect / COLLECT_TIMEOUT--> home
+    assistance      --ASSISTANCE_TIMEOUT-->        home
+    assistance      --staff_reset-->               home    (clears a failed dose)
+
+A dose the dispenser can't cover (medication not loaded, or not enough
+left in the carousels) goes to assistance from confirm, before any servo
+moves. After each dose the inventory forecast is checked and a
+"low_stock" event is logged for medications that run out within
+LOW_STOCK_HOURS (once per medication until it is refilled). The dose
+schedule behind the forecast is only rebuilt when the store changes.
+
+Inputs are method calls (touchscreen buttons, CLI or socket commands),
+dose scheduler events and dispense engine events. Every change is
+reported to the listeners as (kind, data):
+
+    screen    {"screen", "patient", "reason", "released"}  the flow changed state
+    progress  {"name", "progress"}   an attempt or a pill; progress maps each
+                                     medication to count/target/attempt/done
+
+Timers go through root.after, so root is a Tk root or a headless
+event_loop.EventLoop; dispensing goes through an engine with submit() -
+DispenseEngine, or InlineEngine on virtual time. A Tk front end only
+renders screens; python -m Firmware.headless runs the same flow with no
+display at all.
+"""
+
+from datetime import datetime, timedelta
+
+from config.hardware_config import (ASSISTANCE_TIMEOUT, COLLECT_TIMEOUT, KIOSK_PATIENT_ID,
+                                    LOW_STOCK_HOURS)
+
+from .inventory import dose_schedule
+
+HOME = "home"
+CALLING = "calling"
+VERIFICATION = "verification"
+DISPENSING = "dispensing"
+DONE = "done"
+ASSISTANCE = "assistance"
+
+
+class KioskWorkflow:
+    def __init__(self, root, store, controller, engine, scheduler=None, log=None,
+                 auto_call=True, assistance_timeout=ASSISTANCE_TIMEOUT,
+                 collect_timeout=COLLECT_TIMEOUT):
+        self.root = root
+        self.store = store
+        self.controller = controller    # dispense_controller.DispenseController
+        self.engine = engine
+        self.scheduler = scheduler      # dose_scheduler.DoseScheduler, optional
+        self.log = log or (lambda kind, message="", **fields: None)  # EventLog.event signature
+        self.auto_call = auto_call      # call waiting patients when the kiosk is free
+        self.assistance_timeout = assistance_timeout
+        self.collect_timeout = collect_timeout
+
+        self.state = HOME
+        self.patient = None             # prescription_store.patient_view of the current dose
+        self.reason = ""                # why assistance was called
+        self.progress = {}              # medication -> {"count", "target", "attempt", "done"}
+        self.released = {}              # what the last dispense dropped into the tray
+        self.timer = None
+        self.listeners = []
+        self.counts = {"dispensed": 0, "assistance": 0, "collected": 0}
+        self.low_stock = set()          # medications staff were told to refill
+        self.schedule = None            # (store version, dose_schedule) for the forecast
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    # --- Inputs ---
+
+    def call(self, patient_id=KIOSK_PATIENT_ID, due=None):
+        """Call a patient to collect a dose (only from the home screen)"""
+        if self.state != HOME or not self._load(patient_id, due):
+            return False
+        self.log("calling", f"Calling patient {self.patient['id']}", patient_id=self.patient["id"])
+        self._enter(CALLING)
+        return True
+
+    def verify(self, patient_id=KIOSK_PATIENT_ID, due=None):
+        """Go straight to verification for a patient at the kiosk (due: see dose_for)"""
+        if self.state != HOME or not self._load(patient_id, due):
+            return False
+        return self.ready()
+
+    def ready(self):
+        """The called patient is at the kiosk - show their prescription"""
+        if self.state not in (HOME, CALLING) or self.patient is None:
+            return False
+        self.log("ui", "Showing prescription verification", patient_id=self.patient["id"])
+        self._enter(VERIFICATION)
+        return True
+
+    def confirm(self):
+        """The patient confirmed the prescription - dispense it"""
+        if self.state != VERIFICATION:
+            return False
+        patient = self.patient
+        problem = self.controller.unavailable(patient["required"], (patient["id"], patient["due"]))
+        if problem:
+            return self.assistance(problem)
+        self.log("dispense", "Dispensing medication", patient_id=patient["id"],
+                 due=patient["due"], doses=patient["required"])
+        self.progress = {}
+        self.released = {}
+        self._enter(DISPENSING)
+        # Queues behind anything already on the engine (hardware start-up, pre-staging)
+        self.engine.submit(self.dispense_job, patient)
+        return True
+
+    def reject(self, reason="Verification failed"):
+        if self.state not in (CALLING, VERIFICATION):
+            return False
+        return self.assistance(reason)
+
+    def collect(self):
+        """The patient took the dose - back to the home screen"""
+        if self.state != DONE:
+            return False
+        if self.scheduler is not None:
+            self.scheduler.mark_collected(self.patient["id"], self.patient["due"])
+        self.counts["collected"] += 1
+        self.log("collected", "Dispensing completed - returning to home screen",
+                 patient_id=self.patient["id"])
+        self.home()
+        return True
+
+    def staff_reset(self):
+        """A care worker cleared a failed dose (and the holding stage)"""
+        if self.state == DISPENSING:
+            return False
+        self.controller.reset_dose()
+        self.log("reset", "Staff reset the dispenser",
+                 patient_id=self.patient["id"] if self.patient else None)
+        if self.state == ASSISTANCE:
+            self.home()
+        return True
+
+    def refill(self, medication, count=None):
+        """A care worker refilled a medication's carousel (to capacity unless counted)"""
+        if self.state == DISPENSING or medication not in self.controller.channels:
+            return False
+        channel = self.controller.refill(medication, count)
+        self.low_stock.discard(medication)
+        left = self.controller.inventory.left(channel) if self.controller.inventory else count
+        self.log("refill", f"{medication} refilled ({left} pills)", medication=medication,
+                 channel=channel, left=left)
+        return True
+
+    def assistance(self, reason):
+        self.reason = reason
+        self.counts["assistance"] += 1
+        self.log("assistance", f"{reason} - calling for assistance",
+                 patient_id=self.patient["id"] if self.patient else None)
+        self._enter(ASSISTANCE)
+        return True
+
+    def home(self):
+        self._enter(HOME)
+        # Anyone still waiting is called as soon as the kiosk is free
+        if self.auto_call and self.scheduler is not None and self.scheduler.waiting:
+            self.root.after_idle(self.call_next_patient)
+
+    def call_next_patient(self):
+        """Call the next patient from the scheduler queue, if the kiosk is idle"""
+        if self.state != HOME or self.scheduler is None:
+            return False
+        waiting = self.scheduler.next_waiting()
+        return waiting is not None and self.call(*waiting)
+
+    # --- Events ---
+
+    def handle_dose_event(self, kind, data):
+        """Dose scheduler events (loop thread)"""
+        if kind == "due":
+            self.log("dose_due", f"Dose due for patient {data['patient_id']} ({data['due']})",
+                     **data)
+            if self.auto_call:
+                self.call_next_patient()
+        elif kind == "missed":
+            self.log("missed_dose", f"Missed dose: patient {data['patient_id']} ({data['due']}), "
+                     f"{data['minutes']} min late - {data['level']}", **data)
+            if self.auto_call and data["level"] == "remind":
+                self.call(data["patient_id"], data["due"])
+
+    def handle_engine_event(self, kind, data):
+        """Dispense engine events (loop thread). Returns True if the workflow used the event."""
+        if kind in ("attempt", "dispensed"):
+            self.progress[data["name"]] = {"count": data["count"], "target": data["target"],
+                                           "attempt": data.get("attempt"),
+                                           "done": kind == "dispensed"}
+            if kind == "dispensed":
+                self.log("dispensed",
+                         f"{data['name']} dispensed ({data['count']}/{data['target']})",
+                         patient_id=self.patient["id"] if self.patient else None)
+            self._notify("progress", name=data["name"], progress=self.progress)
+        elif kind == "done" and self.state == DISPENSING:
+            self.released = data.get("released") or {
+                name: item["count"] for name, item in self.progress.items()}
+            self.counts["dispensed"] += 1
+            self.log("dispense_done", "Medication ready for collection",
+                     patient_id=self.patient["id"], dispensed=self.released)
+            self._enter(DONE)
+            self.check_stock()
+        elif kind == "max_attempts" and self.state == DISPENSING:
+            if data.get("reason") == "empty":
+                self.assistance(f"{data['name']} dispenser looks empty")
+            else:
+                self.assistance(f"No {data['name']} detected after {data['attempts']} attempts")
+        elif kind == "error" and self.state != ASSISTANCE:
+            self.assistance(f"Dispensing failed: {data['message']}")
+        else:
+            return False
+        return True
+
+    def dispense_job(self, engine, patient):
+        """Dispense one dose (engine thread)"""
+        try:
+            done = self.controller.dispense(patient["required"], engine.sleep,
+                                            (patient["id"], patient["due"]), engine.emit)
+        except ValueError as e:
+            engine.emit("error", message=str(e))
+            return
+        if done:
+            engine.emit("done", released=dict(self.controller.released))
+
+    def check_stock(self, now=None):
+        """Forecast the carousels against the dose schedule; log "low_stock" for
+        medications that run out within LOW_STOCK_HOURS. Returns the forecast."""
+        inventory = self.controller.inventory
+        if inventory is None:
+            return {}
+        now = now or datetime.now()
+        holding = {name: self.controller.holding(name) for name in self.controller.channels}
+        forecast = inventory.forecast(self.dose_schedule(), holding, now)
+        soon = now + timedelta(hours=LOW_STOCK_HOURS)
+        for name, item in forecast.items():
+            if item["runs_out"] is None or item["runs_out"] > soon or name in self.low_stock:
+                continue
+            self.low_stock.add(name)
+            self.log("low_stock", f"{name} runs out {item['runs_out']:%a %d %b %H:%M} "
+                     f"({item['left']} left) - refill needed", medication=name,
+                     left=item["left"], runs_out=item["runs_out"])
+        return forecast
+
+    def dose_schedule(self):
+        """inventory.dose_schedule of the store, cached until the store changes"""
+        version = self.store.version
+        if self.schedule is None or self.schedule[0] != version:
+            self.schedule = (version, dose_schedule(self.store))
+        return self.schedule[1]
+
+    # --- State ---
+
+    def dose_for(self, patient_id):
+        """The dose to serve when none is asked for: an unfinished or pre-staged one,
+        then the oldest the scheduler fired that wasn't collected. None = next due."""
+        state, stage = self.controller.state, self.controller.stage
+        if state is not None and state.in_progress and state.dose_key()[0] == patient_id:
+            return state.dose_key()[1]
+        if stage is not None and stage.staged and stage.dose_key[0] == patient_id:
+            return stage.dose_key[1]
+        if self.scheduler is not None:
+            return self.scheduler.outstanding_due(patient_id)
+        return None
+
+    def _load(self, patient_id, due):
+        patient = self.store.patient_view(patient_id, due or self.dose_for(patient_id))
+        if patient is None:
+            self.log("ui", f"No prescription for patient {patient_id}")
+            return False
+        self.patient = patient
+        return True
+
+    def _enter(self, state):
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+        self.state = state
+        if state == ASSISTANCE:
+            self.timer = self.root.after(int(self.assistance_timeout * 1000), self._timeout)
+        elif state == DONE and self.collect_timeout is not None:
+            self.timer = self.root.after(int(self.collect_timeout * 1000), self._timeout)
+        self._notify("screen", screen=state, patient=self.patient, reason=self.reason,
+                     released=self.released)
+
+    def _timeout(self):
+        self.timer = None
+        if self.state == DONE:
+            self.collect()
+        else:
+            self.home()
+
+    def _notify(self, kind, **data):
+        for callback in self.listeners:
+            callback(kind, data)
+
+    def snapshot(self):
+        """Current state as plain data (status command, tests)"""
+        return {"state": self.state, "patient": self.patient["id"] if self.patient else None,
+                "due": self.patient["due"] if self.patient else None, "reason": self.reason,
+                "progress": self.progress, "counts": dict(self.counts)}
@@ -1,2 +1,2 @@
-from hardware_config import *
+from .hardware_config import *
 
@@ -1,6 +1,7 @@
 #Hardware pins (GPIO pins for Raspberry Pi/Arduino)
 IR_SENSOR_PIN = 17
 MOTOR_PIN = 27
+MOTOR_PINS = {0: MOTOR_PIN, 1: 18}  # GPIO build: servo channel -> pin, one per MEDICATION_CHANNELS
 DISPLAY_PINS = [22, 23, 24]
 
 # Hardware limits
@@ -8,13 +9,103 @@ MAX_ROTATES = 5
 MOTOR_ROTATION_SPEED = 100  # RPM
 MOTOR_STEP_ANGLE = 1.8  # degrees per step
 
+# Servo motion profile (PCA9685 channels)
+SERVO_SPEED_DPS = {0: 300, 1: 300}  # calibrated speed per channel, degrees/second
+SERVO_DEFAULT_SPEED_DPS = 250  # used for uncalibrated channels
+SERVO_SETTLE_TIME = 0.05  # seconds for the horn to stop after reaching the angle
+DISPENSE_SWEEP_ANGLE = 180  # degrees per dispense sweep
+SWEEP_STEP_ANGLE = 20  # degrees per step when a sweep can exit early
+PILL_SETTLE_TIME = 0.3  # seconds for a released pill to land in the tray
+MEDICATION_CHANNELS = {"Vitamin D": 0, "Vitamin C": 1}  # what is loaded on each servo channel
+
+# Holding stage (gate under the chute that keeps pre-dispensed pills)
+HOLDING_GATE_INSTALLED = False  # the two-servo PillWheel has no gate - and so no pre-staging
+HOLDING_GATE_CHANNEL = 2  # PCA9685 channel of the gate servo
+HOLDING_GATE_CLOSED = 0  # degrees
+HOLDING_GATE_OPEN = 90  # degrees
+PRESTAGE_LEAD_TIME = 5 * 60  # seconds before a dose is due to pre-dispense it
+
+# Pill inventory (Firmware/inventory.py)
+INVENTORY_FILE = "data/inventory.json"
+CAROUSEL_CAPACITY = 30  # pills in a full carousel (a refill without a count)
+SPARE_CHANNELS = {}  # medication -> more channels loaded with it, used when the main one is short
+LOW_STOCK_HOURS = 24  # alert staff when a medication will run out within this
+
+# Channel health / retry policy (MAX_ROTATES attempts per pill at most)
+CHANNEL_HEALTH_FILE = "data/channel_health.json"
+CHANNEL_HEALTH_WINDOW = 200  # recent pills per channel the statistics are based on
+HEALTH_MIN_TRIES = 20  # pills of history before the policy trusts a channel's statistics
+EMPTY_GIVE_UP_PROB = 0.01  # give up once the chance the channel still works is this low
+RETRY_MIN_SAMPLES = 10  # retries tried per move (sweep / wiggle) before the better one is chosen
+JAM_WIGGLE_ANGLE = 30  # degrees the wheel is rocked to free a jam
+JAM_WIGGLES = 2  # rocks per wiggle
+
 # Sensor thresholds
 IR_SENSOR_THRESHOLD = 0.5  # voltage threshold
 SENSOR_READ_DELAY = 0.1  # seconds
+TOF_SAMPLE_PERIOD = 0.02  # seconds between streamed VL53L0X readings
+TOF_TIMING_BUDGET_US = 20000  # VL53L0X measurement timing budget (default 33000)
+TOF_BUFFER_SIZE = 512  # readings kept in the ring buffer
+TRACE_FILE = "logs/dispense_traces.jsonl"  # raw readings of every dispense attempt
+TRACE_MAX_BYTES = 5000000  # rotate after ~5 MB
+TRACE_BACKUPS = 3  # rotated trace files kept
+
+# Span tracing (hardware/tracing.py)
+TRACING_ENABLED = True
+TRACE_SPAN_CAPACITY = 20000  # most recent spans kept in memory
+TRACE_SPANS_FILE = "logs/spans.json"  # Chrome trace written at shutdown
+
+# Touchscreen UI
+UI_FRAME_MS = 50  # widget updates are coalesced into one redraw per frame
+ENGINE_POLL_MS = 30  # dispense engine event polling while a job runs
+ENGINE_IDLE_POLL_MS = 500  # ... and while it is idle
+ASSISTANCE_TIMEOUT = 10  # seconds the assistance screen stays up
+COLLECT_TIMEOUT = 5  # seconds before a collected dose returns to the home screen (None = wait)
+HEADLESS_PORT = 8765  # TCP port of the headless kiosk (python -m Firmware.headless serve)
+
+# Event log
+EVENT_LOG_FILE = "logs/events.jsonl"
+EVENT_LOG_MAX_BYTES = 1000000  # rotate after ~1 MB
+EVENT_LOG_BACKUPS = 5  # rotated files kept
+LOG_VIEW_LINES = 200  # lines kept in memory / on screen
+
+# Notifications (Firmware/notifications.py)
+NOTIFY_KINDS = ("assistance", "missed_dose", "low_stock")  # event log kinds that alert staff
+NOTIFY_QUEUE_SIZE = 256  # alerts waiting to be sent; new ones are dropped beyond this
+NOTIFY_DEDUPE_WINDOW = 5 * 60  # seconds a repeated alert for the same patient is suppressed
+NOTIFY_RETRIES = 5  # attempts per sink before an alert is given up
+NOTIFY_RETRY_MAX = 30  # seconds, longest wait between attempts
+NOTIFY_FILE = "logs/notifications.jsonl"
+NOTIFY_SOCKET = ("127.0.0.1", 8766)  # staff pager listening for JSON lines (None = off)
+
+# Prescriptions
+PRESCRIPTION_DB = "data/prescriptions.db"  # local SQLite store
+PRESCRIPTION_CACHE_SIZE = 256  # patients kept in memory (about one shift)
+KIOSK_PATIENT_ID = "001"  # patient served by the single-patient demo kiosk
+# Missed dose escalation: (seconds after the due time, level)
+MISSED_DOSE_ESCALATION = [(15 * 60, "remind"), (30 * 60, "staff")]
+DOSE_SCHEDULE_FILE = "data/dose_schedule.json"  # doses already fired / not yet collected
+
+# Dispense state (crash recovery)
+STATE_DIR = "data/state"  # event log + snapshot
+STATE_FSYNC_BATCH = 50  # non-critical events written before an fsync is forced
+STATE_FSYNC_INTERVAL = 2.0  # seconds before buffered events are fsynced anyway
+STATE_SNAPSHOT_EVERY = 500  # events between snapshots (the log is truncated after each)
 
 # Timing
 DISPENSE_TIMEOUT = 30  # seconds
 ROTATION_DELAY = 0.5  # seconds between rotations
 
 # API endpoints (for Java communication)
-JAVA_API_URL = "http://localhost:8080/api"
\ No newline at end of file
+JAVA_API_URL = "http://localhost:8080/api"  # None = run without the backend
+KIOSK_ID = "kiosk-1"  # sent with every upload
+BACKEND_TIMEOUT = 3  # seconds per request (only the sync thread ever waits on it)
+BACKEND_POOL_SIZE = 2  # idle keep-alive connections kept open
+BACKEND_BATCH_SIZE = 100  # events per upload
+BACKEND_FLUSH_INTERVAL = 2.0  # seconds events wait to be batched before an upload
+BACKEND_PREFETCH_INTERVAL = 15 * 60  # seconds between refreshes of the day's prescriptions
+BACKEND_RETRY_MAX = 60  # seconds, longest wait between retries while the backend is down
+BACKEND_OUTBOX = "data/outbox.db"  # events not yet accepted by the backend
+BACKEND_OUTBOX_MAX = 100000  # oldest events are dropped beyond this
+BACKEND_EVENT_KINDS = ("dispense", "dispensed", "dispense_done", "assistance", "collected",
+                       "missed_dose", "reset", "refill", "low_stock")  # event log kinds uploaded
\ No newline at end of file
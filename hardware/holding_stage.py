@@ -0,0 +1,49 @@
+"""
+Holding stage
+
+A gate servo under the chute. Pills dispensed while it is closed are
+kept in the stage (they still pass the ToF sensor on the way, so each one
+is confirmed) and all of them drop into the tray in one move when it
+opens. This lets a dose be pre-dispensed before the patient arrives.
+"""
+
+import time
+
+from config.hardware_config import HOLDING_GATE_CLOSED, HOLDING_GATE_OPEN, PILL_SETTLE_TIME
+
+
+class HoldingStage:
+    def __init__(self, motion, closed=HOLDING_GATE_CLOSED, opened=HOLDING_GATE_OPEN):
+        self.motion = motion            # ServoMotion of the gate servo
+        self.closed = closed
+        self.opened = opened
+        self.staged = {}                # medication -> pills held
+        self.dose_key = None            # (patient_id, due) the pills belong to
+
+    def close(self, sleep=time.sleep):
+        return self.motion.move_to(self.closed, sleep)
+
+    def add(self, medication, count=1):
+        self.staged[medication] = self.staged.get(medication, 0) + count
+
+    def holds(self, dose_key):
+        """Pills held for this dose ({} if the stage holds another dose or nothing)"""
+        return dict(self.staged) if dose_key == self.dose_key else {}
+
+    def open_gate(self):
+        """Start opening the gate (non-blocking). Returns seconds until the pills are out."""
+        return self.motion.start_move(self.opened) + PILL_SETTLE_TIME
+
+    def close_gate(self):
+        """Start closing the gate and empty the stage. Returns (released, seconds to close)."""
+        released = dict(self.staged)
+        self.staged = {}
+        self.dose_key = None
+        return released, self.motion.start_move(self.closed)
+
+    def release(self, sleep=time.sleep):
+        """Open the gate, let everything drop, close again. Returns what was held."""
+        sleep(self.open_gate())
+        released, closing = self.close_gate()
+        sleep(closing)
+        return released
@@ -0,0 +1,201 @@
+"""
+I2C bus manager
+
+The PCA9685 and the VL53L0X share one bus. Instead of each driver
+grabbing it whenever it likes, the manager owns the bus and runs every
+transaction on a single worker thread, taking the most urgent first:
+
+    PRIORITY_SENSOR      ToF reads - keeps sampling jitter low
+    PRIORITY_SERVO       PWM writes
+    PRIORITY_BACKGROUND  device setup, configuration, shutdown
+
+Servo writes are coalesced: angles set on BusServo objects are queued per
+channel and flushed by one job, which writes each run of adjacent
+channels as a single burst (the PCA9685 auto-increments the register
+address - the adafruit driver turns MODE1.AI on when it sets the
+frequency). Moving more servos at once therefore adds at most one short
+transaction in front of the next sensor read.
+
+Every transaction's queue wait and bus time are recorded per kind (see
+stats()) and as an "i2c <kind>" span (hardware.tracing) - sensor reads,
+which run all shift, only in a histogram.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from .tracing import tracer
+
+PRIORITY_SENSOR = 0
+PRIORITY_SERVO = 1
+PRIORITY_BACKGROUND = 2
+
+# PCA9685 registers
+PCA9685_LED0_ON_L = 0x06        # each channel has 4 registers from here: ON_L ON_H OFF_L OFF_H
+
+
+class I2CBusManager:
+    def __init__(self, i2c, stats_size=1000):
+        self.i2c = i2c
+        self.jobs = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.thread = None
+
+        self.pending_pwm = {}           # (address, channel) -> 12-bit off count
+        self.pending_lock = threading.Lock()
+        self.flush_queued = False
+
+        self.latencies = {}             # kind -> deque of (wait, busy) seconds
+        self.stats_size = stats_size
+        self.bursts = 0
+        self.pwm_writes = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="i2c-bus", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        if self.thread is not None:
+            self.jobs.put((PRIORITY_BACKGROUND + 1, next(self.seq), None, None, None))
+            self.thread.join(timeout)
+            self.thread = None
+
+    def submit(self, priority, kind, fn, *args):
+        """Queue fn(*args) to run on the bus worker. Returns a Future."""
+        future = Future()
+        future.queued_at = time.perf_counter()
+        self.jobs.put((priority, next(self.seq), kind, (fn, args), future))
+        return future
+
+    def call(self, priority, kind, fn, *args, timeout=None):
+        """Run fn(*args) on the bus worker and wait for its result"""
+        if threading.current_thread() is self.thread:
+            return fn(*args)            # already on the bus (e.g. from a job)
+        return self.submit(priority, kind, fn, *args).result(timeout)
+
+    def write_pwm(self, address, channel, off):
+        """Queue a PWM write (coalesced with other channels' writes)"""
+        with self.pending_lock:
+            self.pending_pwm[(address, channel)] = off
+            if self.flush_queued:
+                return
+            self.flush_queued = True
+        self.submit(PRIORITY_SERVO, "pwm", self._flush_pwm)
+
+    def stats(self):
+        """Per-kind transaction stats in ms: queue wait and time on the bus"""
+        summary = {}
+        for kind, samples in self.latencies.items():
+            waits = sorted(wait for wait, busy in samples)
+            busys = sorted(busy for wait, busy in samples)
+            summary[kind] = {
+                "count": len(samples),
+                "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 3),
+                "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 3),
+                "busy_p50_ms": round(busys[len(busys) // 2] * 1000, 3),
+                "busy_max_ms": round(busys[-1] * 1000, 3),
+            }
+        summary["pwm_bursts"] = self.bursts
+        summary["pwm_writes"] = self.pwm_writes
+        return summary
+
+    def _run(self):
+        while True:
+            priority, _, kind, call, future = self.jobs.get()
+            if call is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            fn, args = call
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finished = time.perf_counter()
+            samples = self.latencies.setdefault(kind, deque(maxlen=self.stats_size))
+            samples.append((started - future.queued_at, finished - started))
+            if priority == PRIORITY_SENSOR:
+                # The sensor poll runs all shift: tallied, so it doesn't crowd out the spans
+                tracer.count(f"i2c {kind}", finished - started)
+            else:
+                tracer.record(f"i2c {kind}", "i2c", started, finished - started,
+                              wait_ms=round((started - future.queued_at) * 1000, 3))
+
+    def _flush_pwm(self):
+        with self.pending_lock:
+            pending = self.pending_pwm
+            self.pending_pwm = {}
+            self.flush_queued = False
+
+        # Group adjacent channels on the same chip into one burst
+        for address, first, offs in self._runs(pending):
+            data = bytearray([PCA9685_LED0_ON_L + 4 * first])
+            for off in offs:
+                data += bytes([0, 0, off & 0xFF, (off >> 8) & 0x0F])
+            self._write(address, data)
+            self.bursts += 1
+            self.pwm_writes += len(offs)
+
+    @staticmethod
+    def _runs(pending):
+        """{(address, channel): off} -> [(address, first_channel, [off, ...])]"""
+        runs = []
+        for address, channel in sorted(pending):
+            off = pending[(address, channel)]
+            if runs and runs[-1][0] == address and runs[-1][1] + len(runs[-1][2]) == channel:
+                runs[-1][2].append(off)
+            else:
+                runs.append((address, channel, [off]))
+        return runs
+
+    def _write(self, address, data):
+        while not self.i2c.try_lock():
+            pass
+        try:
+            self.i2c.writeto(address, data)
+        finally:
+            self.i2c.unlock()
+
+
+class BusServo:
+    """Servo on a PCA9685 channel whose writes go through the bus manager.
+
+    Same angle interface as adafruit_motor.servo.Servo (and the same pulse
+    range defaults). frequency should be the one the chip actually runs at
+    (PCA9685.frequency read back) - the prescaler only approximates the
+    one asked for.
+    """
+
+    def __init__(self, bus, address, channel, frequency=50, actuation_range=180,
+                 min_pulse=750, max_pulse=2250):
+        self.bus = bus
+        self.address = address
+        self.channel = channel
+        self.frequency = frequency
+        self.actuation_range = actuation_range
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self._angle = None
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        if value is None:
+            off = 0                     # no pulse - servo goes limp
+        else:
+            value = max(0, min(self.actuation_range, value))
+            pulse_us = (self.min_pulse
+                        + (self.max_pulse - self.min_pulse) * value / self.actuation_range)
+            off = int(pulse_us * self.frequency * 4096 / 1000000)
+        self._angle = value
+        self.bus.write_pwm(self.address, self.channel, off)
@@ -0,0 +1,52 @@
+"""
+IR break-beam pill sensor
+
+A falling pill interrupts the beam. Each break is timestamped from a GPIO
+edge interrupt, and detected_since(t0) answers the same question as
+Firmware.detection.DropDetector - so either sensor can be plugged into
+the dispense controller.
+"""
+
+import threading
+import time
+from collections import deque
+
+from config.hardware_config import IR_SENSOR_PIN
+
+
+class IRSensor:
+    def __init__(self, pin=IR_SENSOR_PIN, clock=time.monotonic, bounce_ms=5, capacity=256):
+        self.pin = pin
+        self.clock = clock
+        self.bounce_ms = bounce_ms
+        self.breaks = deque(maxlen=capacity)    # times the beam was broken
+        self.lock = threading.Lock()
+        self.gpio = None
+
+    def start(self):
+        """Watch the beam (falling edge = beam broken)"""
+        try:
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.add_event_detect(self.pin, GPIO.FALLING, callback=lambda channel: self.beam_broken(),
+                                  bouncetime=self.bounce_ms)
+            self.gpio = GPIO
+            print(f"✅ IR sensor on GPIO {self.pin}")
+        except Exception as e:
+            print(f"⚠️ IR sensor unavailable: {e}")
+        return self
+
+    def beam_broken(self, t=None):
+        with self.lock:
+            self.breaks.append(self.clock() if t is None else t)
+
+    def detected_since(self, t0):
+        """Time of the first beam break at or after t0, or None"""
+        with self.lock:
+            return next((t for t in self.breaks if t >= t0), None)
+
+    def stop(self):
+        if self.gpio is not None:
+            self.gpio.remove_event_detect(self.pin)
+            self.gpio = None
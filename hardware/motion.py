@@ -0,0 +1,119 @@
+"""
+Servo motion profiles
+
+Replaces fixed sleeps after every servo write with move times computed
+from the angle delta and each channel's calibrated speed. A profile
+remembers where its servo was last sent and when that move finishes, so
+a caller can start a move and carry on (non-blocking), or wait for it -
+or stop it partway (the angle reached is worked out from the profile).
+"""
+
+import time
+
+from config.hardware_config import (DISPENSE_SWEEP_ANGLE, SERVO_DEFAULT_SPEED_DPS,
+                                    SERVO_SETTLE_TIME, SERVO_SPEED_DPS, SWEEP_STEP_ANGLE)
+
+from .tracing import tracer
+
+
+class ServoMotion:
+    def __init__(self, servo_obj, channel, speed_dps=None, settle=SERVO_SETTLE_TIME,
+                 clock=time.monotonic):
+        self.servo = servo_obj          # adafruit_motor servo, or None in simulation
+        self.channel = channel
+        self.speed = speed_dps or SERVO_SPEED_DPS.get(channel, SERVO_DEFAULT_SPEED_DPS)
+        self.settle = settle
+        self.clock = clock
+
+        self.angle = 0                  # last commanded angle
+        self.busy_until = 0.0           # when the last commanded move finishes
+        self.moved_from = 0             # angle the last move started from
+        self.moved_at = 0.0             # when it started
+        self.span_name = f"servo_move ch{channel}"
+
+    def move_time(self, target, start=None):
+        """Seconds to reach target from the last commanded angle"""
+        start = self.angle if start is None else start
+        delta = abs(target - start)
+        if delta == 0:
+            return 0.0
+        return delta / self.speed + self.settle
+
+    def remaining(self):
+        """Seconds until the move in progress finishes"""
+        return max(0.0, self.busy_until - self.clock())
+
+    def start_move(self, target):
+        """Command a move and return when it will finish (does not wait)"""
+        duration = self.remaining() + self.move_time(target)
+        if self.servo is not None:
+            self.servo.angle = target
+        if duration:
+            # Planned, not measured - the profile is all we know about the horn
+            tracer.record(self.span_name, "servo", tracer.clock(), duration,
+                          from_angle=self.angle, to_angle=target)
+        self.moved_from = self.angle
+        self.moved_at = self.clock() + self.remaining()
+        self.angle = target
+        self.busy_until = self.clock() + duration
+        return duration
+
+    def position(self):
+        """Angle the horn has reached by now, going by the profile"""
+        travelled = max(0.0, self.clock() - self.moved_at) * self.speed
+        if travelled >= abs(self.angle - self.moved_from):
+            return self.angle
+        direction = 1 if self.angle > self.moved_from else -1
+        return self.moved_from + direction * round(travelled)
+
+    def stop(self):
+        """Halt the move in progress where the horn is now. Returns the angle."""
+        if self.remaining() == 0:
+            return self.angle
+        angle = self.position()
+        if self.servo is not None:
+            self.servo.angle = angle
+        self.moved_from = self.angle = angle
+        self.busy_until = self.clock() + self.settle
+        return angle
+
+    def move_to(self, target, sleep=time.sleep):
+        """Move and wait exactly as long as the move takes"""
+        duration = self.start_move(target)
+        return sleep(duration) is not False
+
+    def sweep(self, target, sleep=time.sleep, stop=None, step=SWEEP_STEP_ANGLE):
+        """Partial-capable sweep: moves in steps and halts as soon as stop() is True.
+
+        Returns the angle reached.
+        """
+        if stop is None:
+            self.move_to(target, sleep)
+            return self.angle
+
+        direction = 1 if target > self.angle else -1
+        while self.angle != target:
+            if stop():
+                break
+            next_angle = self.angle + direction * step
+            if (target - next_angle) * direction < 0:
+                next_angle = target
+            if not self.move_to(next_angle, sleep):
+                break
+        return self.angle
+
+    def dispense_cycle(self, sleep=time.sleep, pill_seen=None, sweep_angle=DISPENSE_SWEEP_ANGLE):
+        """One dispense rotation 0° → sweep_angle → 0°.
+
+        The pill is released as the wheel leaves sweep_angle. With pill_seen
+        (early exit mode) the return sweep is aborted once the sensor has
+        seen the pill, and the next cycle's out sweep starts from where the
+        wheel stopped instead of from 0°.
+        Returns True if the pill was seen during the cycle.
+        """
+        if self.angle != 0 and pill_seen is None:
+            self.move_to(0, sleep)
+
+        self.move_to(sweep_angle, sleep)
+        self.sweep(0, sleep, stop=pill_seen)
+        return bool(pill_seen and pill_seen())
@@ -0,0 +1,171 @@
+"""
+Hardware provider
+
+Owns the I2C bus, PCA9685 servo driver and VL53L0X sensor. Nothing is
+imported or opened until initialize() is called, so importing the UI
+modules (e.g. for tests) has no side effects and the first screen can be
+drawn before the Adafruit libraries are even loaded. initialize() brings
+the two devices up in parallel and records how long each one took.
+
+Once the bus is open every transaction goes through the I2C bus manager
+(hardware.i2c_bus): sensor reads first, servo writes coalesced into
+burst writes, setup and shutdown last.
+
+Any device that fails to come up falls back to simulation. With neither
+device present the simulator (hardware.simulator) stands in for both on
+the real clock, so a simulated dispense behaves like a real one.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from .i2c_bus import PRIORITY_BACKGROUND, PRIORITY_SENSOR, BusServo, I2CBusManager
+from .tracing import tracer
+
+SIMULATED_DISTANCE = 150  # mm returned when there is no sensor
+
+
+class HardwareProvider:
+    def __init__(self, pwm_frequency=50):
+        self.pwm_frequency = pwm_frequency
+        self.pwm_actual_frequency = pwm_frequency   # read back from the PCA9685 prescaler
+
+        self.i2c = None
+        self.bus = None             # I2CBusManager once the bus is open
+        self.pca = None
+        self.tof = None
+        self.servos = {}            # PCA9685 channel -> adafruit_motor servo
+        self.simulator = None       # SimulatedHardware when no devices are found
+
+        self.pca_ok = False
+        self.sensor_ok = False
+        self.timings = {}           # step name -> seconds
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+
+    def initialize(self):
+        """Open the bus and bring up both devices in parallel (blocking)"""
+        if self.ready.is_set():
+            return self
+        started = time.perf_counter()
+
+        try:
+            with self._timed("i2c"):
+                import board
+                self.i2c = board.I2C()
+                self.bus = I2CBusManager(self.i2c).start()
+        except Exception as e:
+            print(f"⚠️ I2C bus error: {e}")
+
+        if self.bus is not None:
+            workers = [threading.Thread(target=self._init_pca, name="init-pca9685"),
+                       threading.Thread(target=self._init_tof, name="init-vl53l0x")]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        if not self.pca_ok and not self.sensor_ok:
+            from .simulator import SimulatedHardware
+            self.simulator = SimulatedHardware()
+
+        self.timings["total"] = time.perf_counter() - started
+        print("⏱  Hardware init: " +
+              ", ".join(f"{name} {secs * 1000:.0f}ms" for name, secs in self.timings.items()))
+        self.ready.set()
+        return self
+
+    def servo(self, channel):
+        """Servo object for a PCA9685 channel (created on first use), or None"""
+        if self.simulator is not None:
+            return self.simulator.servo(channel)
+        if not self.pca_ok:
+            return None
+        with self.lock:
+            if channel not in self.servos:
+                self.servos[channel] = BusServo(self.bus, self.pca.i2c_device.device_address,
+                                                channel, frequency=self.pwm_actual_frequency)
+            return self.servos[channel]
+
+    def read_distance(self):
+        """Read TOF sensor distance"""
+        if self.sensor_ok:
+            with tracer.tally("tof_read"):     # 50 Hz - a histogram, not spans
+                return self.bus.call(PRIORITY_SENSOR, "tof_read", lambda: self.tof.range)
+        if self.simulator is not None:
+            return self.simulator.read_distance()
+        return SIMULATED_DISTANCE  # Simulation
+
+    def status_text(self):
+        if not self.ready.is_set():
+            return "Hardware: starting..."
+        return " | ".join([
+            "Servos: OK ✅" if self.pca_ok else "Servos: Simulation",
+            "Sensor: OK ✅" if self.sensor_ok else "Sensor: Simulation",
+        ])
+
+    def start_ranging(self, timing_budget_us):
+        """Put the VL53L0X in continuous ranging mode (for ToFSampler)"""
+        if not self.sensor_ok:
+            return
+
+        def job():
+            self.tof.measurement_timing_budget = timing_budget_us
+            self.tof.start_continuous()
+        try:
+            self.bus.call(PRIORITY_BACKGROUND, "config", job)
+        except Exception as e:
+            print(f"⚠️ ToF continuous mode unavailable: {e}")
+
+    def shutdown(self):
+        """Park all servos, release the PCA9685 and stop the bus worker"""
+        if self.pca_ok:
+            for servo_obj in self.servos.values():
+                servo_obj.angle = 0
+            self.bus.call(PRIORITY_BACKGROUND, "shutdown", self.pca.deinit)
+        if self.sensor_ok:
+            try:
+                self.bus.call(PRIORITY_BACKGROUND, "shutdown", self.tof.stop_continuous)
+            except Exception:
+                pass
+        if self.bus is not None:
+            print(f"📊 I2C bus: {self.bus.stats()}")
+            self.bus.stop()
+
+    def _init_pca(self):
+        try:
+            with self._timed("pca9685"):
+                from adafruit_pca9685 import PCA9685
+
+                def setup():
+                    pca = PCA9685(self.i2c)
+                    pca.frequency = self.pwm_frequency  # 50Hz for servos (and MODE1.AI on)
+                    # Pulse widths are worked out from the rate the prescaler gives
+                    self.pwm_actual_frequency = pca.frequency
+                    return pca
+                # The import runs in parallel with the sensor's; bus traffic is serialized
+                self.pca = self.bus.call(PRIORITY_BACKGROUND, "init", setup)
+            self.pca_ok = True
+            print("✅ Servos initialized on PCA9685")
+        except Exception as e:
+            print(f"⚠️ PCA9685 init error: {e}")
+
+    def _init_tof(self):
+        try:
+            with self._timed("vl53l0x"):
+                import adafruit_vl53l0x
+                self.tof = self.bus.call(PRIORITY_BACKGROUND, "init",
+                                         adafruit_vl53l0x.VL53L0X, self.i2c)
+            self.sensor_ok = True
+            print("✅ Sensor initialized")
+        except Exception as e:
+            print(f"⚠️ Sensor error: {e}")
+
+    @contextmanager
+    def _timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
@@ -0,0 +1,72 @@
+"""
+GPIO servo backend
+
+Drives servos straight from Raspberry Pi GPIO pins with software PWM, for
+builds without the PCA9685. Like HardwareProvider and SimulatedHardware
+it hands out servo objects per channel (servo(channel)), so it can be
+plugged into Firmware.dispense_controller.DispenseController.
+"""
+
+from config.hardware_config import MOTOR_PINS
+
+
+class GPIOServo:
+    """Servo on one GPIO pin (angle interface like adafruit_motor.servo.Servo)"""
+
+    def __init__(self, gpio, pin, frequency=50, actuation_range=180, min_pulse=750,
+                 max_pulse=2250):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.actuation_range = actuation_range
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self._angle = None
+        gpio.setup(pin, gpio.OUT)
+        self.pwm = gpio.PWM(pin, frequency)
+        self.pwm.start(0)
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        if value is None:
+            duty = 0
+        else:
+            value = max(0, min(self.actuation_range, value))
+            pulse_us = self.min_pulse + (self.max_pulse - self.min_pulse) * value / self.actuation_range
+            duty = pulse_us * self.frequency / 10000    # percent of the period
+        self._angle = value
+        self.pwm.ChangeDutyCycle(duty)
+
+
+class MotorController:
+    def __init__(self, pins=None):
+        self.pins = dict(pins or MOTOR_PINS)    # channel -> GPIO pin (BCM numbering)
+        self.gpio = None
+        self.servos = {}
+
+    def initialize(self):
+        try:
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            self.gpio = GPIO
+        except Exception as e:
+            print(f"⚠️ GPIO unavailable: {e}")
+        return self
+
+    def servo(self, channel):
+        """Servo object for a channel, or None without GPIO"""
+        if self.gpio is None or channel not in self.pins:
+            return None
+        if channel not in self.servos:
+            self.servos[channel] = GPIOServo(self.gpio, self.pins[channel])
+        return self.servos[channel]
+
+    def shutdown(self):
+        for servo_obj in self.servos.values():
+            servo_obj.pwm.stop()
+        if self.gpio is not None:
+            self.gpio.cleanup(list(self.pins.values()))
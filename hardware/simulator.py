@@ -0,0 +1,268 @@
+"""
+Hardware-in-the-loop simulator
+
+Stands in for the PCA9685 servos and the VL53L0X so the real dispense
+code (motion profiles, channel scheduler, streaming detector) can run
+without hardware:
+
+    VirtualClock      virtual time - sleep() returns instantly, firing any
+                      periodic callbacks (e.g. sensor polls) on the way
+    VirtualServo      accepts angle writes; a return from the end of the
+                      dispense sweep is when a pill may be released
+    PillDropModel     stochastic release: drop probability, jams, empty hopper
+    ToFNoiseModel     synthetic distance: tray level, noise, the dip of a
+                      falling pill, outliers, slow drift
+    SimulatedDispenser  wires it all together and runs whole prescriptions
+                      through the DispenseController
+
+With a virtual clock thousands of prescriptions run per second. The same
+models also run on the real clock, which is what the kiosk uses when no
+hardware is found.
+"""
+
+import random
+import time
+
+from config.hardware_config import DISPENSE_SWEEP_ANGLE, TOF_SAMPLE_PERIOD
+
+from .tof_sensor import ToFSampler
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+        self.tickers = []           # [period, next_time, callback]
+
+    def monotonic(self):
+        return self.now
+
+    def every(self, period, callback):
+        """Call callback() every period seconds of virtual time"""
+        self.tickers.append([period, self.now + period, callback])
+
+    def sleep(self, seconds):
+        """Advance virtual time, running periodic callbacks that fall due"""
+        end = self.now + max(0.0, seconds)
+        if len(self.tickers) == 1:
+            # Fast path for the usual single sensor poll
+            ticker = self.tickers[0]
+            period, callback = ticker[0], ticker[2]
+            while ticker[1] <= end:
+                self.now = ticker[1]
+                ticker[1] += period
+                callback()
+        else:
+            while self.tickers:
+                ticker = min(self.tickers, key=lambda tk: tk[1])
+                if ticker[1] > end:
+                    break
+                self.now = ticker[1]
+                ticker[1] += ticker[0]
+                ticker[2]()
+        self.now = end
+        return True
+
+    def advance(self, seconds):
+        """Jump ahead without running the periodic callbacks (they resume from the new time)"""
+        self.now += max(0.0, seconds)
+        for ticker in self.tickers:
+            ticker[1] = max(ticker[1], self.now)
+
+
+class PillDropModel:
+    """Decides whether a dispense sweep releases a pill"""
+
+    def __init__(self, drop_prob=0.9, jam_rate=0.0, unjam_prob=0.5, wiggle_unjam_prob=0.7,
+                 pills=None, fall_time=0.15, rng=None):
+        self.drop_prob = drop_prob      # chance a sweep releases a pill when not jammed
+        self.jam_rate = jam_rate        # chance a sweep jams the wheel
+        self.unjam_prob = unjam_prob    # chance a jammed sweep frees it again
+        self.wiggle_unjam_prob = wiggle_unjam_prob  # chance a small rock frees it
+        self.pills = pills              # pills left in the hopper (None = unlimited)
+        self.fall_time = fall_time      # seconds from release to passing the sensor
+        self.rng = rng or random.Random()
+        self.jammed = False
+
+    def release(self):
+        """One sweep. Returns True if a pill drops."""
+        if self.jammed:
+            self.jammed = self.rng.random() >= self.unjam_prob
+            return False
+        if self.rng.random() < self.jam_rate:
+            self.jammed = True
+            return False
+        if self.pills is not None and self.pills <= 0:
+            return False
+        if self.rng.random() >= self.drop_prob:
+            return False
+        if self.pills is not None:
+            self.pills -= 1
+        return True
+
+    def wiggle(self):
+        """A small rock at the home position - may free a jam, never drops a pill"""
+        if self.jammed and self.rng.random() < self.wiggle_unjam_prob:
+            self.jammed = False
+
+
+class ToFNoiseModel:
+    """Synthetic VL53L0X readings for the tray under the chute"""
+
+    def __init__(self, clock, base=150.0, noise_sd=1.0, pill_dip=40.0, dip_time=0.06,
+                 tray_step=1.5, miss_rate=0.0, outlier_rate=0.0, drift=0.0, rng=None):
+        self.clock = clock
+        self.base = base                # mm to the empty tray
+        self.noise_sd = noise_sd
+        self.pill_dip = pill_dip        # mm closer while a pill falls through the beam
+        self.dip_time = dip_time        # seconds a falling pill stays in the beam
+        self.tray_step = tray_step      # mm the tray level rises per landed pill
+        self.miss_rate = miss_rate      # chance a falling pill is not seen at all
+        self.outlier_rate = outlier_rate
+        self.drift = drift              # mm/s the empty-tray reading creeps (temperature, ambient light)
+        self.rng = rng or random.Random()
+        self.started = clock()
+
+        self.falls = []                 # (start, end) of pills in the beam
+        self.landings = []              # times pills reach the tray
+        self.landed = 0
+
+    def pill_released(self, fall_time):
+        """Register a pill that will pass the sensor after fall_time"""
+        start = self.clock() + fall_time
+        self.landings.append(start + self.dip_time)
+        if self.rng.random() >= self.miss_rate:
+            self.falls.append((start, start + self.dip_time))
+
+    def read(self):
+        now = self.clock()
+        while self.landings and self.landings[0] <= now:
+            self.landings.pop(0)
+            self.landed += 1
+        distance = (self.base - self.landed * self.tray_step + self.drift * (now - self.started)
+                    + self.rng.gauss(0.0, self.noise_sd))
+        if self.falls:
+            self.falls = [fall for fall in self.falls if fall[1] >= now]
+            if any(start <= now for start, end in self.falls):
+                distance -= self.pill_dip
+        if self.outlier_rate and self.rng.random() < self.outlier_rate:
+            distance += self.rng.choice((-1, 1)) * self.rng.uniform(10, 40)
+        return round(distance)
+
+
+class VirtualServo:
+    """Fake adafruit_motor servo; a return from the sweep end may drop a pill"""
+
+    def __init__(self, drop_model, tof_model):
+        self.drop_model = drop_model
+        self.tof_model = tof_model
+        self._angle = 0
+        self.releases = []              # virtual time of each real pill release
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        if self._angle == DISPENSE_SWEEP_ANGLE and value < self._angle:
+            if self.drop_model.release():
+                self.releases.append(self.tof_model.clock())
+                self.tof_model.pill_released(self.drop_model.fall_time)
+        elif 0 < self._angle < DISPENSE_SWEEP_ANGLE and value < self._angle:
+            self.drop_model.wiggle()
+        self._angle = value
+
+
+class SimulatedHardware:
+    """Virtual servos and ToF sensor sharing one tray, on any clock"""
+
+    def __init__(self, clock=time.monotonic, seed=None, drop_prob=0.9, jam_rate=0.0,
+                 miss_rate=0.0, noise_sd=1.0, outlier_rate=0.0, drift=0.0, pills=None):
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.tof_model = ToFNoiseModel(clock, noise_sd=noise_sd, miss_rate=miss_rate,
+                                       outlier_rate=outlier_rate, drift=drift, rng=self.rng)
+        self.drop_settings = dict(drop_prob=drop_prob, jam_rate=jam_rate, pills=pills)
+        self.servos = {}
+
+    def servo(self, channel):
+        if channel not in self.servos:
+            model = PillDropModel(rng=self.rng, **self.drop_settings)
+            self.servos[channel] = VirtualServo(model, self.tof_model)
+        return self.servos[channel]
+
+    def read_distance(self):
+        return self.tof_model.read()
+
+
+class SimulatedDispenser:
+    """Runs complete prescriptions through the DispenseController on virtual time"""
+
+    def __init__(self, seed=None, sample_period=TOF_SAMPLE_PERIOD, health=None,
+                 **hardware_options):
+        # Imported here so the hardware package does not depend on Firmware at import time
+        from Firmware.detection import DropDetector
+        from Firmware.dispense_controller import DispenseController
+        self.DispenseController = DispenseController
+        self.DropDetector = DropDetector
+
+        self.seed = seed
+        self.sample_period = sample_period
+        self.health = health            # HealthMonitor shared by every run (learns over runs)
+        self.hardware_options = hardware_options
+        self.rng = random.Random(seed)
+
+    def run(self, prescription, recorder=None, serial=False):
+        """Dispense one prescription {name: (channel, count)} from a fresh state.
+
+        serial dispenses one medication after another instead of overlapping
+        the channels. Returns a dict with success, virtual duration, the
+        event timeline and the ground-truth number of pills released per
+        channel.
+        """
+        clock = VirtualClock()
+        sim = SimulatedHardware(clock.monotonic, seed=self.rng.random(), **self.hardware_options)
+        if self.health is not None and self.hardware_options.get("pills") is not None:
+            self.health.reset()         # the hoppers were refilled for this run
+        sampler = ToFSampler(sim.read_distance, period=self.sample_period, clock=clock.monotonic)
+        detector = self.DropDetector()
+        sampler.add_listener(detector.feed)
+        if recorder is not None:
+            # Every run restarts virtual time at 0 - readings left from an earlier
+            # run would land in this run's trace windows
+            recorder.recent.clear()
+            sampler.add_listener(recorder.feed)
+        clock.every(self.sample_period, sampler.poll)
+
+        channels = {name: channel for name, (channel, count) in prescription.items()}
+        controller = self.DispenseController(channels, sim.read_distance, detector,
+                                             recorder=recorder, clock=clock.monotonic,
+                                             verbose=False, health=self.health)
+        controller.attach(sim)
+        if recorder is not None:
+            recorder.truth_source = lambda name, t_open, t_close: any(
+                t_open <= t <= t_close for t in sim.servo(channels[name]).releases)
+
+        events = []
+        dispensed = {name: 0 for name in prescription}
+
+        def emit(kind, **data):
+            events.append((clock.now, kind, data))
+            if kind == "dispensed":
+                dispensed[data["name"]] += 1
+
+        required = {name: count for name, (channel, count) in prescription.items()}
+        batches = [{name: count} for name, count in required.items()] if serial else [required]
+        success = True
+        for batch in batches:
+            success = controller.dispense(batch, clock.sleep, emit=emit)
+            if not success:
+                break
+        return {
+            "success": success,
+            "duration": clock.now,
+            "events": events,
+            "released": {name: len(sim.servo(channel).releases)
+                         for name, channel in channels.items()},
+            "dispensed": dispensed,
+        }
@@ -0,0 +1,95 @@
+"""
+Streaming VL53L0X sampler
+
+Puts the sensor in continuous-ranging mode and reads it on a background
+thread into a fixed-size ring buffer of (timestamp, distance) pairs.
+Listeners (e.g. a pill-drop detector) are called with every reading, so
+detection runs while the servo is still moving instead of after it.
+
+Without a thread, poll() can be called directly to take one reading -
+this is how the simulator drives it on a virtual clock.
+"""
+
+import threading
+import time
+from collections import deque
+
+from config.hardware_config import TOF_BUFFER_SIZE, TOF_SAMPLE_PERIOD, TOF_TIMING_BUDGET_US
+
+
+class ToFSampler:
+    def __init__(self, read, tof=None, period=TOF_SAMPLE_PERIOD, capacity=TOF_BUFFER_SIZE,
+                 clock=time.monotonic):
+        self.read = read                # callable returning distance in mm
+        self.tof = tof                  # adafruit_vl53l0x.VL53L0X, or None (simulation, or
+                                        # configured by the provider through the bus manager)
+        self.period = period
+        self.clock = clock
+
+        self.buffer = deque(maxlen=capacity)
+        self.listeners = []
+        self.running = threading.Event()
+        self.thread = None
+
+    def add_listener(self, callback):
+        """Call callback(t, distance) for every new reading"""
+        self.listeners.append(callback)
+
+    def start(self):
+        """Switch the sensor to continuous ranging and start the sampling thread"""
+        if self.thread is not None:
+            return
+        if self.tof is not None:
+            try:
+                self.tof.measurement_timing_budget = TOF_TIMING_BUDGET_US
+                self.tof.start_continuous()
+            except Exception as e:
+                print(f"⚠️ ToF continuous mode unavailable: {e}")
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name="tof-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+        if self.tof is not None:
+            try:
+                self.tof.stop_continuous()
+            except Exception:
+                pass
+
+    def poll(self):
+        """Take one reading, store it and notify listeners"""
+        t = self.clock()
+        distance = self.read()
+        self.buffer.append((t, distance))
+        for callback in self.listeners:
+            callback(t, distance)
+        return distance
+
+    def latest(self):
+        """Most recent (t, distance), or None before the first reading"""
+        try:
+            return self.buffer[-1]
+        except IndexError:
+            return None
+
+    def samples_since(self, t0):
+        """Readings taken at or after t0, oldest first"""
+        return [(t, d) for t, d in list(self.buffer) if t >= t0]
+
+    def _run(self):
+        next_read = time.monotonic()
+        while self.running.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️ ToF read error: {e}")
+            next_read += self.period
+            delay = next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_read = time.monotonic()
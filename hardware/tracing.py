@@ -0,0 +1,261 @@
+"""
+Dispense-path tracing
+
+Span timers for the hot path - servo moves, sensor reads, settle waits,
+detection windows, engine sleeps, I2C transactions and screen switches -
+collected in memory by one process-wide Tracer:
+
+    with tracer.span("dispense", "dispense"):
+        ...
+    tracer.record("settle", "dispense", start, duration)   # a span timed elsewhere
+
+A span is one tuple appended to a bounded deque (no locks, no I/O), so
+tracing can stay on in production; set TRACING_ENABLED = False to make
+every call a no-op. Calls made many times a second all shift long (the
+50 Hz sensor poll) would push everything else out of the deque, so they
+are tallied into a histogram instead of kept as spans:
+
+    with tracer.tally("tof_read"):
+        ...
+ Spans that were planned rather than measured (a
+servo move's duration comes from its motion profile) are recorded with
+that duration.
+
+The collector can be dumped as Chrome trace JSON (open it in
+chrome://tracing or https://ui.perfetto.dev, tallies go in its
+"histograms") or summarized as latency histograms per name:
+
+    python -m hardware.tracing logs/spans.json
+"""
+
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config.hardware_config import TRACE_SPAN_CAPACITY, TRACE_SPANS_FILE, TRACING_ENABLED
+
+# Histogram bucket upper bounds in ms
+BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc):
+        tracer = self.tracer
+        tracer.spans.append((self.name, self.category, self.start, tracer.clock() - self.start,
+                             threading.get_ident(), self.args))
+        return False
+
+
+class _Tally:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.count(self.name, self.tracer.clock() - self.start)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    def __init__(self, capacity=TRACE_SPAN_CAPACITY, enabled=TRACING_ENABLED,
+                 clock=time.perf_counter):
+        self.spans = deque(maxlen=capacity)    # (name, category, start, seconds, thread, args)
+        self.tallies = {}                       # name -> [count, seconds, max, bucket counts]
+        self.tally_lock = threading.Lock()
+        self.enabled = enabled
+        self.clock = clock
+        self.origin = clock()
+
+    def span(self, name, category="", **args):
+        """Context manager timing the block it wraps"""
+        if not self.enabled:
+            return NO_SPAN
+        return _Span(self, name, category, args or None)
+
+    def record(self, name, category, start, seconds, **args):
+        """Add a span timed by the caller (start on this tracer's clock)"""
+        if self.enabled:
+            self.spans.append((name, category, start, seconds, threading.get_ident(),
+                               args or None))
+
+    def record_since(self, name, category, seconds, **args):
+        """Add a span of `seconds` that ends now"""
+        if self.enabled:
+            self.spans.append((name, category, self.clock() - seconds, seconds,
+                               threading.get_ident(), args or None))
+
+    def tally(self, name):
+        """Context manager adding the block's duration to a histogram (no span kept)"""
+        if not self.enabled:
+            return NO_SPAN
+        return _Tally(self, name)
+
+    def count(self, name, seconds):
+        """Add a duration timed by the caller to the `name` histogram"""
+        if not self.enabled:
+            return
+        bucket = bisect.bisect_left(BUCKETS_MS, seconds * 1000)
+        with self.tally_lock:
+            tally = self.tallies.get(name)
+            if tally is None:
+                tally = self.tallies[name] = [0, 0.0, 0.0, [0] * (len(BUCKETS_MS) + 1)]
+            tally[0] += 1
+            tally[1] += seconds
+            tally[2] = max(tally[2], seconds)
+            tally[3][bucket] += 1
+
+    def clear(self):
+        self.spans.clear()
+        with self.tally_lock:
+            self.tallies.clear()
+
+    # --- Output ---
+
+    def chrome_trace(self):
+        """Spans as a Chrome trace ("X" complete events, microseconds)"""
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = []
+        for thread, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread,
+                           "args": {"name": name}})
+        for name, category, start, seconds, thread, args in list(self.spans):
+            event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread,
+                     "ts": round((start - self.origin) * 1e6, 1),
+                     "dur": round(seconds * 1e6, 1)}
+            if args:
+                event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "histograms": self.tally_histograms()}
+
+    def dump(self, path=TRACE_SPANS_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def histograms(self):
+        """{name: stats and bucket counts} over the collected spans"""
+        durations = {}
+        for name, category, start, seconds, thread, args in list(self.spans):
+            durations.setdefault(name, []).append(seconds * 1000)
+        histograms = {name: histogram(values) for name, values in durations.items()}
+        histograms.update(self.tally_histograms())
+        return histograms
+
+    def tally_histograms(self):
+        with self.tally_lock:
+            return {name: bucket_histogram(count, seconds * 1000, longest * 1000, list(buckets))
+                    for name, (count, seconds, longest, buckets) in self.tallies.items()}
+
+    def summary(self):
+        return format_histograms(self.histograms())
+
+
+def histogram(values_ms):
+    ordered = sorted(values_ms)
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in ordered:
+        counts[next((i for i, bound in enumerate(BUCKETS_MS) if value <= bound),
+                    len(BUCKETS_MS))] += 1
+    return {
+        "count": len(ordered),
+        "total_ms": round(sum(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95)], 3),
+        "max_ms": round(ordered[-1], 3),
+        "buckets": counts,
+    }
+
+
+def bucket_histogram(count, total_ms, max_ms, counts):
+    """histogram() for values only counted into buckets - p50/p95 are bucket bounds"""
+    def percentile(share):
+        rank, seen = int(count * share), 0
+        for bound, n in zip(BUCKETS_MS, counts):
+            seen += n
+            if seen > rank:
+                return min(bound, max_ms)
+        return max_ms
+
+    return {
+        "count": count,
+        "total_ms": round(total_ms, 3),
+        "p50_ms": round(percentile(0.5), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "max_ms": round(max_ms, 3),
+        "buckets": counts,
+    }
+
+
+def format_histograms(histograms):
+    """Text report, the names that took the most time in total first"""
+    lines = []
+    for name, h in sorted(histograms.items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:<24} n={h['count']:<6} total {h['total_ms'] / 1000:8.2f}s  "
+                     f"p50 {h['p50_ms']:8.2f}ms  p95 {h['p95_ms']:8.2f}ms  "
+                     f"max {h['max_ms']:8.2f}ms")
+        peak = max(h["buckets"]) or 1
+        labels = [f"≤{bound:g}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]:g}ms"]
+        for label, count in zip(labels, h["buckets"]):
+            if count:
+                lines.append(f"    {label:>9} {'█' * max(1, round(count / peak * 30))} {count}")
+    return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a dumped span trace")
+    parser.add_argument("path", nargs="?", default=TRACE_SPANS_FILE)
+    args = parser.parse_args()
+
+    with open(args.path) as f:
+        trace = json.load(f)
+    durations = {}
+    for event in trace["traceEvents"]:
+        if event.get("ph") == "X":
+            durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+    histograms = {name: histogram(values) for name, values in durations.items()}
+    histograms.update(trace.get("histograms", {}))
+    print(format_histograms(histograms))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,95 @@
-from firmware.dispense_controller import DispenseController
-from firmware.state_manager import StateManager
+"""
+Console dispenser for the GPIO build (servos on MOTOR_PINS, IR break-beam
+sensor on IR_SENSOR_PIN) - no touchscreen, no PCA9685. Same kiosk workflow
+as the touchscreen UIs, answered on the console.
+
+    python3 main.py
+"""
+
+from Firmware.channel_health import HealthMonitor
+from Firmware.dispense_controller import DispenseController
+from Firmware.dispense_engine import DispenseEngine
+from Firmware.event_loop import EventLoop
+from Firmware.inventory import Inventory
+from Firmware.notifications import start_notifier
+from Firmware.prescription_store import get_prescription_store, pill_text
+from Firmware.state_manager import StateManager
+from Firmware.workflow import KioskWorkflow
 from hardware.servo_controller import MotorController
 from hardware.ir_sensor import IRSensor
-from hardware.display import Display
+from hardware.tracing import tracer
 from config.hardware_config import *
-import time
+
+
+def ready_for_collection(dose):
+    print(f"\n🔔 {dose['name']}: your {dose['due']} dose is ready for collection")
+    for item in dose["doses"]:
+        print(f"   {item['medication']} - {pill_text(item['pills'])}")
+
+
+def call_for_assistance(notifier, reason, patient_id):
+    print(f"\n⚠️ {reason} - calling for assistance")
+    notifier.alert("assistance", f"{reason} - calling for assistance", patient_id)
+
 
 def main():
-   # Show ready for collection
-   ready_for_collection()
+    motors = MotorController().initialize()
+    sensor = IRSensor().start()
+    # Only the medications on a channel with a GPIO servo can be dispensed here
+    channels = {name: channel for name, channel in MEDICATION_CHANNELS.items()
+                if channel in motors.pins}
+    for name in MEDICATION_CHANNELS.keys() - channels.keys():
+        print(f"⚠️ No GPIO pin for {name} (channel {MEDICATION_CHANNELS[name]}) - "
+              "add it to MOTOR_PINS")
+    controller = DispenseController(channels, detector=sensor, health=HealthMonitor(),
+                                    inventory=Inventory())
+    controller.attach(motors)
+    controller.use_state(StateManager())
+    notifier = start_notifier()
+
+    # One patient flow: verify → dispense → collect, then exit
+    loop = EventLoop()
+    flow = None
+    engine = DispenseEngine(loop, lambda kind, data: flow.handle_engine_event(kind, data))
+    flow = KioskWorkflow(loop, get_prescription_store(), controller, engine,
+                         assistance_timeout=0, collect_timeout=0)
 
-   # Input verification/consent
-    verification_consent = bool(input("Press Enter to simulate user verification..."))
-    
-    if verification_consent==True:
-        # In firmware/dispense_controller.py
-        dispense_all_medicines()
-    else:
-        call_for_assistance()
+    def verify():
+        # Input verification/consent
+        answer = input("Is this the correct prescription and dose? [y/N] ")
+        if answer.strip().lower().startswith("y"):
+            flow.confirm()
+        else:
+            flow.reject()
 
-   
+    def show(kind, data):
+        if kind != "screen":
+            return
+        dose = data["patient"]
+        if data["screen"] == "verification":
+            # Show ready for collection
+            ready_for_collection(dose)
+            loop.after_idle(verify)
+        elif data["screen"] == "done":
+            print(f"✅ Dispensed - {dose['instructions'] or 'take as directed'}")
+        elif data["screen"] == "assistance":
+            call_for_assistance(notifier, data["reason"], dose["id"])
+        elif data["screen"] == "home":
+            loop.quit()
 
+    flow.add_listener(show)
+    loop.after_idle(flow.verify, KIOSK_PATIENT_ID)
+    try:
+        loop.mainloop()
+    finally:
+        engine.stop()
+        notifier.stop()
+        controller.shutdown()
+        sensor.stop()
+        motors.shutdown()
+        print("\n⏱  Where the time went:\n" + tracer.summary())
+        tracer.dump()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from Firmware.backend import BackendClient, BackendSync, Outbox
+from Firmware.backend_stub import StubBackend
+from Firmware.event_log import EventLog
+from Firmware.prescription_store import PrescriptionStore
+
+PATIENTS = [{"id": "001", "name": "Sarah Johnson", "room": "12",
+             "doses": [{"medication": "Vitamin D", "pills": 2, "due": "08:00"},
+                       {"medication": "Vitamin C", "pills": 1, "due": "08:00", "channel": 1}]}]
+
+
+def events(count, start=0):
+    return [{"id": f"e{number}", "kind": "dispensed", "seq": number}
+            for number in range(start, start + count)]
+
+
+@pytest.fixture
+def stub():
+    stub = StubBackend(patients=PATIENTS).start()
+    yield stub
+    stub.stop()
+
+
+def sync_to(stub, outbox, **options):
+    return BackendSync(PrescriptionStore(":memory:"), BackendClient(stub.url, timeout=1), outbox,
+                       channels={"Vitamin D": 0}, retry_max=0, **options)
+
+
+def test_outbox_keeps_events_until_removed_and_across_restarts(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, max_events=5)
+    outbox.add(events(3))
+    last_seq, batch = outbox.peek(2)
+    assert [event["id"] for event in batch] == ["e0", "e1"]
+    outbox.remove(last_seq)
+    outbox.close()
+
+    outbox = Outbox(path, max_events=5)
+    assert outbox.pending == 1
+    # Over max_events the oldest are dropped
+    outbox.add(events(6, start=3))
+    assert outbox.pending == 5 and outbox.dropped == 2
+    assert [event["id"] for event in outbox.peek(10)[1]] == [f"e{n}" for n in range(4, 9)]
+
+
+def test_prefetch_fills_the_store_and_skips_unchanged_lists(stub):
+    updates = []
+    sync = sync_to(stub, Outbox(":memory:"), on_update=updates.append)
+    assert sync.prefetch()
+    assert sync.prefetch()
+    assert updates == [1] and sync.prefetched == 1     # the second answer was a 304
+    view = sync.store.patient_view("001", "08:00")
+    assert view["required"] == {"Vitamin D": 2, "Vitamin C": 1}
+    # A dose without a channel goes on the one the medication is loaded on
+    assert {dose["medication"]: dose["channel"] for dose in view["doses"]} == \
+        {"Vitamin D": 0, "Vitamin C": 1}
+
+
+def test_outbox_is_replayed_once_the_backend_is_back(stub, tmp_path):
+    path = str(tmp_path / "outbox.db")
+    sync = sync_to(stub, Outbox(path), batch_size=4)
+    sync.outbox.add(events(10))
+    stub.down = True
+    assert not sync.upload()
+    assert sync.online is False and sync.outbox.pending == 10
+    sync.outbox.close()
+
+    # Kiosk restarted while the backend was down
+    sync = sync_to(stub, Outbox(path), batch_size=4)
+    stub.down = False
+    assert sync.upload()
+    assert sync.online is True and sync.outbox.pending == 0
+    assert sorted(stub.events) == sorted(f"e{n}" for n in range(10))
+    assert stub.batches == 3 and stub.duplicates == 0
+
+
+def test_logged_events_are_uploaded_in_the_background(stub):
+    log = EventLog()
+    sync = sync_to(stub, Outbox(":memory:"), flush_interval=0.01)
+    log.add_listener(sync.put)
+    sync.start()
+    for number in range(20):
+        log.event("dispensed", "Vitamin D dispensed", patient_id="001", seq=number)
+    log.event("ui", "not uploaded")
+    sync.stop()
+    assert len(stub.events) == 20
+    assert sorted(event["seq"] for event in stub.events.values()) == list(range(20))
+
+
+@pytest.mark.parametrize("body", [
+    b"[]",
+    json.dumps({"patients": [{"id": "001", "doses": []}]}).encode(),
+    json.dumps({"patients": [{"id": "001", "name": "A"}, {"id": "001", "name": "B"}]}).encode(),
+    json.dumps({"patients": [{"id": "001", "name": "A", "doses": [{"medication": "Vitamin D",
+                                                                   "due": "08:00"}]}]}).encode(),
+])
+def test_malformed_prescriptions_leave_the_store_alone(stub, body):
+    sync = sync_to(stub, Outbox(":memory:"))
+    assert sync.prefetch()
+    stub.body = lambda: body
+    assert not sync.prefetch()
+    assert sync.online is True and sync.prefetched == 1
+    assert sync.store.patient_view("001", "08:00")["name"] == "Sarah Johnson"
+
+
+def test_sync_thread_survives_an_unexpected_error(stub):
+    def on_update(count):
+        raise RuntimeError("UI went away")
+
+    log = EventLog()
+    sync = sync_to(stub, Outbox(":memory:"), on_update=on_update, flush_interval=0.01)
+    log.add_listener(sync.put)
+    sync.start()
+    for number in range(5):
+        log.event("dispensed", "Vitamin D dispensed", patient_id="001", seq=number)
+    sync.stop()
+    assert len(stub.events) == 5
+    assert "UI went away" in sync.last_error
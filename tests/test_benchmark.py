@@ -0,0 +1,24 @@
+import json
+import sys
+
+from Firmware import benchmark
+
+
+def test_percentiles():
+    assert benchmark.percentiles([]) == {"count": 0}
+    values = benchmark.percentiles([4, 1, 3, 2, 5])
+    assert values["p50"] == 3 and values["max"] == 5 and values["mean"] == 3
+    assert values["p95"] == 4.8
+
+
+def test_benchmark_smoke_run(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "bench.json"
+    monkeypatch.setattr(sys, "argv", ["benchmark", "--runs", "5", "--json", str(path)])
+    benchmark.main()
+    assert "pillwheel" in capsys.readouterr().out
+    output = json.loads(path.read_text())
+    assert set(output["results"]) == {"pillwheel", "serial"}
+    for report in output["results"].values():
+        assert report["runs"] == 5
+        assert report["time_per_pill_s"]["count"] > 0
+        assert report["success_rate"] > 0
@@ -0,0 +1,76 @@
+from Firmware.channel_health import ChannelHealth, HealthMonitor, RetryPolicy
+
+
+def history(health, pills, first_try=0.8, gave_up=0):
+    """pills tries, most on the first attempt, plus some the channel gave up on"""
+    for number in range(pills):
+        health.record_try(1 if number < pills * first_try else 2, True)
+    for _ in range(gave_up):
+        health.record_try(5, False)
+
+
+def test_channel_is_given_up_once_it_is_probably_empty():
+    health = ChannelHealth(0)
+    history(health, 40, gave_up=4)
+    policy = RetryPolicy(give_up_prob=0.05, min_attempts=3)
+    assert policy.next_action(health, 0) == ("sweep", None)
+    # Two misses are not enough on their own, three are for this channel
+    for misses in (1, 2, 3):
+        health.record_attempt(False)
+        action, reason = policy.next_action(health, misses)
+        assert (reason == "empty") == (misses == 3), misses
+    assert health.p_working(3) < 0.05 < health.p_working(2)
+    # The streak carries over: on the next dose one probe is enough
+    assert policy.next_action(health, 1) == ("give_up", "empty")
+    health.reset()
+    assert policy.next_action(health, 1)[0] != "give_up"
+
+
+def test_untrusted_channel_is_only_given_up_at_max_attempts():
+    health = ChannelHealth(0)
+    history(health, 5, gave_up=5)
+    policy = RetryPolicy(give_up_prob=0.5)
+    for misses in range(1, 5):
+        health.record_attempt(False)
+        assert policy.next_action(health, misses, max_attempts=5)[0] != "give_up"
+    assert policy.next_action(health, 5, max_attempts=5) == ("give_up", "max_attempts")
+
+
+def test_retry_move_is_learned_per_channel():
+    health = ChannelHealth(0)
+    policy = RetryPolicy(give_up_prob=0.0, min_samples=3)
+    # Both moves are tried min_samples times, least tried first
+    tried = []
+    for _ in range(6):
+        action, reason = policy.next_action(health, 1)
+        assert reason == "learning"
+        tried.append(action)
+        health.record_retry(action, action == "wiggle")
+    assert sorted(tried) == ["sweep"] * 3 + ["wiggle"] * 3
+    assert policy.next_action(health, 1) == ("wiggle", "learned")
+    # A wiggle that takes much longer than a sweep loses to it
+    assert policy.next_action(health, 1, costs={"sweep": 1.0, "wiggle": 10.0}) == \
+        ("sweep", "learned")
+
+
+def test_stats_survive_a_reload(tmp_path):
+    path = str(tmp_path / "data" / "channel_health.json")
+    monitor = HealthMonitor(path)
+    health = monitor.get(2)
+    history(health, 10, gave_up=1)
+    health.record_attempt(False)
+    health.record_retry("wiggle", True)
+    monitor.save()
+
+    reloaded = HealthMonitor(path).get(2)
+    assert list(reloaded.tries) == list(health.tries)
+    assert reloaded.streak == 1 and reloaded.longest_streak == 1
+    assert reloaded.retries == {"sweep": [0, 0], "wiggle": [1, 1]}
+    assert reloaded.p_working(1) == health.p_working(1)
+    assert HealthMonitor(path).summary()[2]["gave_up"] == 1
+
+
+def test_corrupt_file_starts_afresh(tmp_path):
+    path = tmp_path / "channel_health.json"
+    path.write_text("{not json")
+    assert HealthMonitor(str(path)).channels == {}
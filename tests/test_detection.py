@@ -0,0 +1,89 @@
+import random
+
+from Firmware.detection import BaselineTracker, DropDetector
+
+PERIOD = 0.02
+
+
+def feed(detector, readings, start=0.0):
+    for step, distance in enumerate(readings):
+        detector.feed(start + step * PERIOD, distance)
+    return start + len(readings) * PERIOD
+
+
+def steady(detector, readings=10):
+    """Warm the baseline up on the empty tray; returns the time after"""
+    return feed(detector, [150, 151, 150, 149, 150, 150, 151, 150, 149, 150][:readings])
+
+
+def test_dip_is_detected_on_the_confirming_reading():
+    detector = DropDetector()
+    t = steady(detector)
+    feed(detector, [150, 112, 110, 148, 150], start=t)
+    assert detector.detected_since(t) == t + 2 * PERIOD
+    assert abs(detector.baseline - 150) < 1
+
+
+def test_lone_outlier_is_not_a_drop():
+    detector = DropDetector()
+    t = steady(detector)
+    end = feed(detector, [150, 176, 150, 151, 150, 120] + [150, 149, 150, 151] * 2, start=t)
+    assert detector.detected_since(t) is None
+    # ...and does not move the baseline
+    assert abs(detector.baseline - 150) < 1
+    # A real dip once they left the window is still seen
+    feed(detector, [150, 111, 111], start=end)
+    assert detector.detected_since(end) == end + 2 * PERIOD
+
+
+def test_window_closes_without_a_detection():
+    detector = DropDetector()
+    t = steady(detector)
+    feed(detector, [150, 151, 149, 152, 150, 148, 150, 151] * 6, start=t)
+    assert detector.detected_since(t) is None
+    assert detector.detected_since(0.0) is None
+
+
+def test_rearms_on_the_new_tray_level():
+    detector = DropDetector()
+    t = steady(detector)
+    # A pill lands: the tray reads 2mm closer from then on
+    end = feed(detector, [150, 110, 110, 140] + [148] * 8, start=t)
+    assert detector.detected_since(t) == t + 2 * PERIOD
+    assert detector.armed and detector.baseline == 148
+    feed(detector, [148, 109, 108], start=end)
+    assert detector.detected_since(end) == end + 2 * PERIOD
+    assert len(detector.events) == 2
+
+
+def drifting(seconds, rate, rng, start=150.0):
+    """Empty-tray readings creeping `rate` mm/s, with sensor noise"""
+    return [round(start + rate * step * PERIOD + rng.gauss(0, 1))
+            for step in range(int(seconds / PERIOD))]
+
+
+def test_tracker_warms_up_on_the_median_and_ignores_outliers():
+    tracker = BaselineTracker(warmup=5)
+    for distance in (150, 190, 149, 151, 150):
+        tracker.update(distance)
+    assert tracker.value == 150
+    tracker.update(120)                 # a falling pill, not the tray
+    assert tracker.value == 150
+
+
+def test_slow_drift_is_followed_without_false_detections():
+    rng = random.Random(4)
+    detector = DropDetector()
+    # 2 mm/s for 10s: the tray reads 20mm further off by the end
+    readings = drifting(10, 2.0, rng)
+    end = feed(detector, readings)
+    assert detector.detected_since(0.0) is None
+    assert abs(detector.baseline - readings[-1]) < 3
+    # A pill at the drifted level is still seen
+    feed(detector, [readings[-1] - 40] * 2, start=end)
+    assert detector.detected_since(end) == end + PERIOD
+
+    # With the baseline held where it started, the same drift is a false drop
+    fixed = DropDetector(alpha=0.0)
+    feed(fixed, drifting(10, 2.0, random.Random(4)))
+    assert fixed.detected_since(0.0) is not None
@@ -0,0 +1,170 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from Firmware.dose_scheduler import DoseScheduler
+from Firmware.prescription_store import PrescriptionStore
+
+DUE = datetime(2026, 10, 17, 8, 0).timestamp()
+TOMORROW = datetime(2026, 10, 18, 8, 0).timestamp()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def london(monkeypatch):
+    """Local time with a DST change (clocks go back on 25 Oct 2026)"""
+    monkeypatch.setenv("TZ", "Europe/London")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def store():
+    store = PrescriptionStore(":memory:")
+    store.add_patient("001", "Patient 1")
+    store.add_dose("001", "Vitamin D", 2, "08:00", 0)
+    return store
+
+
+def scheduler(store, clock, events, path=None):
+    return DoseScheduler(store, lambda kind, data: events.append((kind, data)), clock=clock,
+                         escalation=[(15 * 60, "remind"), (30 * 60, "staff")], path=path)
+
+
+def kinds(events):
+    return [kind for kind, data in events]
+
+
+def test_due_then_escalates_until_collected(store):
+    clock, events = Clock(DUE - 60), []
+    doses = scheduler(store, clock, events)
+    doses.load()
+    clock.now = DUE + 1
+    doses.run_due()
+    assert kinds(events) == ["due"]
+    assert list(doses.waiting) == [("001", "08:00")]
+
+    clock.now = DUE + 15 * 60
+    doses.run_due()
+    assert events[-1] == ("missed", {"patient_id": "001", "due": "08:00",
+                                     "level": "remind", "minutes": 15})
+    doses.mark_collected("001", "08:00")
+    clock.now = DUE + 30 * 60
+    doses.run_due()
+    assert kinds(events) == ["due", "missed"]
+    assert not doses.waiting
+
+
+def test_reload_after_collect_does_not_fire_again(store):
+    clock, events = Clock(DUE - 60), []
+    doses = scheduler(store, clock, events)
+    doses.load()
+    clock.now = DUE + 30
+    doses.run_due()
+    doses.mark_collected("001", "08:00")
+
+    clock.now = DUE + 10 * 60
+    doses.load()
+    doses.run_due()
+    assert kinds(events) == ["due"]
+    assert not doses.waiting
+    assert doses.next_delay() == pytest.approx(TOMORROW - clock.now)
+
+
+def test_reload_keeps_pending_escalation(store):
+    clock, events = Clock(DUE - 60), []
+    doses = scheduler(store, clock, events)
+    doses.load()
+    clock.now = DUE + 30
+    doses.run_due()
+
+    clock.now = DUE + 10 * 60
+    doses.load()
+    doses.run_due()
+    assert kinds(events) == ["due"]     # nothing re-fired, nothing escalated early
+    clock.now = DUE + 15 * 60
+    doses.run_due()
+    assert kinds(events) == ["due", "missed"]
+    assert list(doses.waiting) == [("001", "08:00")]
+
+
+def test_reload_drops_doses_no_longer_prescribed(store):
+    clock, events = Clock(DUE + 30), []
+    doses = scheduler(store, clock, events)
+    doses.load()
+    doses.run_due()
+    assert list(doses.waiting) == [("001", "08:00")]
+
+    store.replace_patients([])
+    doses.load()
+    assert not doses.waiting and not doses.outstanding and not doses.heap
+
+
+def test_restart_remembers_fired_and_waiting(store, tmp_path):
+    path = str(tmp_path / "doses.json")
+    clock, events = Clock(DUE - 60), []
+    doses = scheduler(store, clock, events, path)
+    doses.load()
+    clock.now = DUE + 30
+    doses.run_due()
+
+    # Restarted before the patient came: called again, but "due" doesn't fire twice
+    clock.now = DUE + 20 * 60
+    restarted = scheduler(store, clock, events, path)
+    restarted.load()
+    restarted.run_due()
+    assert list(restarted.waiting) == [("001", "08:00")]
+    assert kinds(events) == ["due"]
+    clock.now = DUE + 30 * 60
+    restarted.run_due()
+    assert events[-1][1]["level"] == "staff"
+
+    restarted.mark_collected("001", "08:00")
+    again = scheduler(store, clock, events, path)
+    again.load()
+    again.run_due()
+    assert not again.waiting
+    assert kinds(events) == ["due", "missed"]
+
+
+def test_upcoming_fires_lead_time_before(store):
+    clock, events = Clock(DUE - 10 * 60), []
+    doses = DoseScheduler(store, lambda kind, data: events.append((kind, data)), clock=clock,
+                          lead=5 * 60, path=None)
+    doses.load()
+    clock.now = DUE - 5 * 60
+    doses.run_due()
+    doses.load()
+    doses.run_due()
+    assert kinds(events) == ["upcoming"]
+
+
+@pytest.mark.skipif(not hasattr(time, "tzset"), reason="needs time.tzset")
+def test_dose_keeps_its_local_time_across_dst(store, london):
+    before = datetime(2026, 10, 24, 8, 0).timestamp()
+    after = datetime(2026, 10, 25, 8, 0).timestamp()
+    assert after - before == 25 * 60 * 60
+    clock, events = Clock(before - 60), []
+    doses = DoseScheduler(store, lambda kind, data: events.append((kind, data)), clock=clock,
+                          escalation=[], lead=5 * 60, path=None)
+    doses.load()
+    clock.now = before
+    doses.run_due()
+    assert kinds(events) == ["upcoming", "due"]
+    assert sorted((entry[2], entry[5]) for entry in doses.heap) == \
+        [("due", after), ("upcoming", after)]
+    # A reload after firing finds the same next occurrence
+    doses.load()
+    assert sorted((entry[2], entry[5]) for entry in doses.heap) == \
+        [("due", after), ("upcoming", after)]
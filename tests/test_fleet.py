@@ -0,0 +1,53 @@
+import queue
+
+from Firmware.fleet import FleetController
+
+ONE_PILL = {"Vitamin C": (1, 1)}
+THREE_PILLS = {"Vitamin D": (0, 2), "Vitamin C": (1, 1)}
+
+
+def in_process_fleet(units):
+    """A fleet whose units are plain queues, driven by the test"""
+    fleet = FleetController(units)
+    fleet.results = queue.Queue()
+    fleet.queues = [queue.Queue() for _ in range(units)]
+    return fleet
+
+
+def test_patients_go_to_the_least_loaded_unit():
+    fleet = in_process_fleet(2)
+    assert fleet.assign("001", THREE_PILLS)[1] == 0
+    assert fleet.assign("002", ONE_PILL)[1] == 1
+    # Same number of patients: the unit with less estimated work
+    assert fleet.assign("003", ONE_PILL)[1] == 1
+    # Fewer outstanding patients comes first, whatever the work
+    job_id, unit_id = fleet.assign("004", ONE_PILL)
+    assert unit_id == 0
+    assert [unit.load for unit in fleet.units] == [(2, 6.0), (2, 3.0)]
+    assert fleet.queues[0].get_nowait() == ("dispense", 1, "001", THREE_PILLS)
+
+    # Unit 0 finishes its first patient (in 4.5 simulated seconds)
+    fleet.results.put(("done", 0, 1, True, 4.5))
+    assert fleet.poll()
+    assert fleet.units[0].load == (1, 1.5)
+    assert fleet.assign("005", ONE_PILL)[1] == 0
+    # Estimates now use the measured 1.5s per pill
+    assert fleet.estimate(THREE_PILLS) == 4.5
+
+    fleet.results.put(("error", 1, 2, "servo fault"))
+    fleet.poll()
+    assert fleet.units[1].failed == 1 and fleet.outstanding() == 3
+
+
+def test_ward_round_on_two_unit_processes():
+    fleet = FleetController(2, time_scale=0, seed=3).start()
+    try:
+        units = [fleet.assign(f"{n:03}", THREE_PILLS)[1] for n in range(6)]
+        assert fleet.wait(timeout=30)
+    finally:
+        fleet.stop()
+    assert units == [0, 1, 0, 1, 0, 1]
+    status = fleet.status()
+    assert status["completed"] + status["failed"] == 6
+    assert all(unit["completed"] + unit["failed"] == 3 for unit in status["units"])
+    assert status["patients_per_hour"] is None
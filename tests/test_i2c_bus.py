@@ -0,0 +1,44 @@
+from hardware.i2c_bus import PRIORITY_BACKGROUND, BusServo, I2CBusManager
+
+
+class FakeI2C:
+    def __init__(self):
+        self.writes = []
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def writeto(self, address, data):
+        self.writes.append((address, bytes(data)))
+
+
+def run(frequency, angles):
+    i2c = FakeI2C()
+    bus = I2CBusManager(i2c)
+    servos = {channel: BusServo(bus, 0x40, channel, frequency=frequency) for channel in angles}
+    for channel, angle in angles.items():
+        servos[channel].angle = angle
+    bus.start()
+    bus.call(PRIORITY_BACKGROUND, "sync", lambda: None)   # PWM writes go first
+    bus.stop()
+    return i2c.writes
+
+
+def off_counts(data):
+    return [data[i + 2] | data[i + 3] << 8 for i in range(1, len(data), 4)]
+
+
+def test_adjacent_channels_are_written_in_one_burst():
+    writes = run(50, {0: 0, 1: 90, 3: 180})
+    assert [(address, data[0]) for address, data in writes] == [(0x40, 0x06), (0x40, 0x12)]
+    assert off_counts(writes[0][1]) == [153, 307]
+    assert off_counts(writes[1][1]) == [460]
+
+
+def test_pulse_width_uses_the_frequency_the_chip_runs_at():
+    # 1500us at the 51.3Hz a 50Hz request can come out as
+    [(address, data)] = run(51.3, {0: 90})
+    assert off_counts(data) == [int(1500 * 51.3 * 4096 / 1000000)]
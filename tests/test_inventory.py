@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from Firmware import workflow
+from Firmware.dispense_controller import DispenseController
+from Firmware.inventory import Inventory, dose_schedule
+from Firmware.prescription_store import PrescriptionStore
+from Firmware.workflow import KioskWorkflow
+
+NOW = datetime(2026, 10, 17, 9, 0)
+
+
+@pytest.fixture
+def store():
+    store = PrescriptionStore(":memory:")
+    store.add_patient("001", "Sarah Johnson")
+    store.add_dose("001", "Vitamin D", 2, "08:00", 0)
+    store.add_dose("001", "Vitamin D", 1, "20:00", 0)
+    store.add_patient("002", "Tom Baker")
+    store.add_dose("002", "Vitamin D", 1, "08:00", 0)
+    return store
+
+
+def test_dose_schedule_adds_up_patients_due_together(store):
+    assert dose_schedule(store) == [("08:00", {"Vitamin D": 3}), ("20:00", {"Vitamin D": 1})]
+
+
+def test_forecast_finds_the_first_dose_that_cant_be_covered(store):
+    inventory = Inventory(path=None)
+    inventory.refill(0, 9)
+    forecast = inventory.forecast(dose_schedule(store), {"Vitamin D": [0]}, NOW)
+    # 9 - 1 (20:00 today) - 4 (tomorrow) - 4 (the day after) leaves 0 for 08:00 on the 20th
+    assert forecast["Vitamin D"] == {"left": 9, "per_day": 4,
+                                     "runs_out": datetime(2026, 10, 20, 8, 0)}
+
+
+def test_forecast_of_an_uncounted_carousel_is_unknown(store):
+    forecast = Inventory(path=None).forecast(dose_schedule(store), {"Vitamin D": [0]}, NOW)
+    assert forecast["Vitamin D"]["runs_out"] is None
+
+
+def test_controller_refuses_a_dose_the_carousels_cant_cover():
+    inventory = Inventory(path=None)
+    controller = DispenseController({"Vitamin D": 0}, inventory=inventory,
+                                    spares={"Vitamin D": [3]}, verbose=False)
+    inventory.refill(0, 1)
+    inventory.refill(3, 0)
+    assert controller.unavailable({"Vitamin D": 2}) == \
+        "Not enough left in this dispenser: Vitamin D (1 left, 2 needed)"
+    inventory.refill(3, 5)
+    assert controller.unavailable({"Vitamin D": 2}) is None
+    assert controller.route("Vitamin D", 2) == 3
+    assert controller.unavailable({"Paracetamol": 1}) == \
+        "Not loaded in this dispenser: Paracetamol"
+
+
+def test_check_stock_rebuilds_the_schedule_only_when_the_store_changes(store, monkeypatch):
+    built = []
+    monkeypatch.setattr(workflow, "dose_schedule",
+                        lambda store: built.append(1) or dose_schedule(store))
+    inventory = Inventory(path=None)
+    inventory.refill(0, 9)
+    logged = []
+    flow = KioskWorkflow(None, store, DispenseController({"Vitamin D": 0}, inventory=inventory,
+                                                         verbose=False), None,
+                         log=lambda kind, message="", **fields: logged.append(kind))
+    flow.check_stock(NOW)
+    flow.check_stock(NOW)
+    assert len(built) == 1
+    assert logged == []
+
+    store.add_dose("002", "Vitamin D", 3, "20:00", 0)
+    forecast = flow.check_stock(NOW)
+    assert len(built) == 2
+    assert forecast["Vitamin D"]["runs_out"] == datetime(2026, 10, 18, 20, 0)
+    assert logged == []
+
+    # Pills taken don't change the schedule; running out within LOW_STOCK_HOURS is logged once
+    inventory.refill(0, 4)
+    assert flow.check_stock(NOW)["Vitamin D"]["runs_out"] == datetime(2026, 10, 18, 8, 0)
+    flow.check_stock(NOW)
+    assert len(built) == 2
+    assert logged == ["low_stock"]
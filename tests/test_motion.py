@@ -0,0 +1,70 @@
+import pytest
+
+from Firmware.detection import DropDetector
+from Firmware.dispense_controller import DispenseController
+from hardware.motion import ServoMotion
+from hardware.simulator import SimulatedHardware, VirtualClock
+from hardware.tof_sensor import ToFSampler
+
+
+class Servo:
+    angle = 0
+
+
+def motion(clock):
+    return ServoMotion(Servo(), 0, speed_dps=300, settle=0.05, clock=clock.monotonic)
+
+
+def test_move_time_follows_the_angle_delta():
+    wheel = motion(VirtualClock())
+    assert wheel.move_time(180) == pytest.approx(0.65)
+    assert wheel.move_time(90, start=180) == pytest.approx(0.35)
+    assert wheel.move_time(0) == 0.0
+
+
+def test_stop_halts_the_horn_where_it_is():
+    clock = VirtualClock()
+    wheel = motion(clock)
+    wheel.move_to(180, clock.sleep)
+    wheel.start_move(0)
+    clock.sleep(0.2)
+    assert wheel.stop() == 120
+    assert wheel.servo.angle == 120
+    assert wheel.remaining() == pytest.approx(0.05)
+    assert wheel.move_time(180) == pytest.approx(0.25)
+
+
+def test_early_exit_aborts_the_return_sweep():
+    clock = VirtualClock()
+    wheel = motion(clock)
+    # The pill is seen as soon as the wheel leaves the sweep end
+    assert wheel.dispense_cycle(clock.sleep, pill_seen=lambda: wheel.angle < 180)
+    assert wheel.angle == 160
+    first = clock.now
+    # The next cycle starts from there, not from 0°
+    wheel.dispense_cycle(clock.sleep, pill_seen=lambda: wheel.angle < 180)
+    assert clock.now - first < first / 2
+
+
+def run_dose(pills):
+    clock = VirtualClock()
+    sim = SimulatedHardware(clock.monotonic, seed=3, drop_prob=1.0)
+    sampler = ToFSampler(sim.read_distance, clock=clock.monotonic)
+    detector = DropDetector()
+    sampler.add_listener(detector.feed)
+    clock.every(sampler.period, sampler.poll)
+    controller = DispenseController({"Vitamin D": 0}, sim.read_distance, detector,
+                                    clock=clock.monotonic, verbose=False)
+    controller.attach(sim)
+    assert controller.dispense({"Vitamin D": pills}, clock.sleep)
+    return clock.now, sim.servo(0), controller.motions[0]
+
+
+def test_scheduler_aborts_the_return_sweep_between_pills():
+    one, servo, wheel = run_dose(1)
+    three, servo, wheel = run_dose(3)
+    assert len(servo.releases) == 3
+    # A full cycle (0° → 180° → 0°) per extra pill would take 1.3s each
+    assert three - one < 2 * 1.3 * 0.75
+    # The last pill's return sweep is not aborted - the wheel ends up home
+    assert wheel.angle == 0
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from Firmware.notifications import Notifier
+
+
+class Sink:
+    def __init__(self, name="sink", failures=0):
+        self.name = name
+        self.failures = failures        # sends that fail before one goes through
+        self.sent = []
+        self.attempts = 0
+        self.closed = False
+
+    def send(self, alert):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise OSError("pager offline")
+        self.sent.append(alert)
+
+    def close(self):
+        self.closed = True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_repeated_alerts_are_sent_once_per_window():
+    now = [0.0]
+    notifier = Notifier([Sink()], dedupe_window=300, clock=lambda: now[0])
+    assert notifier.alert("assistance", "Verification failed", "001")
+    assert not notifier.alert("assistance", "Verification failed", "001")
+    # Another patient, or another escalation level, is a different alert
+    assert notifier.alert("assistance", "Verification failed", "002")
+    assert notifier.alert("missed_dose", "Missed", "001", level="remind")
+    assert notifier.alert("missed_dose", "Missed", "001", level="staff")
+    now[0] = 301
+    assert notifier.alert("assistance", "Verification failed", "001")
+    assert notifier.counts["suppressed"] == 1
+    assert notifier.status()["queued"] == 5
+
+
+def test_full_queue_drops_the_alert_without_blocking():
+    notifier = Notifier([Sink()], queue_size=1)
+    assert notifier.alert("assistance", "first", "001")
+    assert not notifier.alert("assistance", "second", "002")
+    assert notifier.counts["dropped"] == 1
+    # Dropped, not sent - so it is not suppressed when raised again
+    notifier.workers[0].queue.get_nowait()
+    assert notifier.alert("assistance", "second", "002")
+
+
+def test_failing_sink_is_retried_without_holding_up_the_others():
+    flaky, steady = Sink("flaky", failures=2), Sink("steady")
+    notifier = Notifier([flaky, steady], retries=3, retry_max=0.01).start()
+    notifier.alert("assistance", "Verification failed", "001")
+    assert wait_for(lambda: flaky.sent)
+    notifier.stop()
+    assert steady.attempts == 1 and flaky.attempts == 3
+    assert flaky.sent[0]["patient_id"] == "001"
+    assert notifier.counts["retried"] == 2
+    assert notifier.counts["sent"] == 2
+    assert flaky.closed and steady.closed
+
+
+def test_sink_is_given_up_after_the_last_retry():
+    dead = Sink("dead", failures=100)
+    notifier = Notifier([dead], retries=3, retry_max=0.01).start()
+    notifier.alert("assistance", "Verification failed", "001")
+    assert wait_for(lambda: notifier.counts["failed"] == 1)
+    notifier.stop()
+    assert dead.attempts == 3
+    assert notifier.counts["sent"] == 0
+
+
+def test_event_log_listener_only_alerts_on_notify_kinds():
+    notifier = Notifier([Sink()], kinds=["assistance", "missed_dose"])
+    notifier.put({"kind": "dispensed", "message": "Vitamin D dispensed", "patient_id": "001"})
+    notifier.put({"kind": "assistance", "message": "Verification failed - calling for assistance",
+                  "patient_id": "001", "time": 123.0})
+    alert = notifier.workers[0].queue.get_nowait()
+    assert alert["kind"] == "assistance" and alert["time"] == 123.0
+    assert notifier.workers[0].queue.empty()
+
+
+def test_hanging_sink_does_not_hold_up_the_others():
+    release = threading.Event()
+
+    class HangingSink(Sink):
+        def send(self, alert):
+            release.wait(5)
+            super().send(alert)
+
+    pager, backend = HangingSink("pager"), Sink("http")
+    notifier = Notifier([pager, backend]).start()
+    notifier.alert("assistance", "Verification failed", "001")
+    notifier.alert("missed_dose", "Missed", "002")
+    assert wait_for(lambda: len(backend.sent) == 2, timeout=1.0)
+    assert not pager.sent
+    release.set()
+    notifier.stop()
+    assert len(pager.sent) == 2 and notifier.counts["sent"] == 4
+
+
+def test_alert_is_kept_while_one_sink_has_room():
+    full, free = Sink("full"), Sink("free")
+    notifier = Notifier([full, free], queue_size=1)
+    notifier.workers[0].queue.put_nowait({"kind": "earlier"})
+    assert notifier.alert("assistance", "Verification failed", "001")
+    assert notifier.counts["dropped"] == 1 and notifier.counts["alerts"] == 1
+    assert notifier.workers[1].queue.get_nowait()["patient_id"] == "001"
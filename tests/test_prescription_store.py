@@ -0,0 +1,68 @@
+from Firmware.prescription_store import PrescriptionStore
+
+
+def store_with_patient(**options):
+    store = PrescriptionStore(":memory:", **options)
+    store.add_patient("001", "Sarah Johnson", "12")
+    store.add_dose("001", "Vitamin D", 2, "08:00", channel=0, instructions="Take with food")
+    store.add_dose("001", "Vitamin C", 1, "08:00", channel=1)
+    store.add_dose("001", "Vitamin D", 2, "20:00", channel=0)
+    return store
+
+
+def test_patient_view_for_a_dose_time():
+    store = store_with_patient()
+    view = store.patient_view("001", "08:00")
+    assert view["required"] == {"Vitamin D": 2, "Vitamin C": 1}
+    assert view["medication"] == "Vitamin D, Vitamin C"
+    assert view["dosage"] == "2 pills, 1 pill"
+    assert view["instructions"] == "Take with food"
+    assert view["next_dose"] == "8:00 PM"
+    assert store.patient_view("001", "20:00")["next_dose"] == "8:00 AM"
+
+
+def test_two_rows_for_one_medication_add_up():
+    store = store_with_patient()
+    store.add_dose("001", "Vitamin D", 1, "08:00", channel=0)
+    view = store.patient_view("001", "08:00")
+    assert view["required"] == {"Vitamin D": 3, "Vitamin C": 1}
+    assert view["dosage"] == "3 pills, 1 pill"
+
+
+def test_missing_patient():
+    store = store_with_patient()
+    assert store.patient("999") is None
+    assert store.patient_view("999") is None
+    assert store.doses_due("999", "08:00") == []
+    assert store.next_due("999") is None
+
+
+def test_cache_is_invalidated_by_writes():
+    store = store_with_patient()
+    store.patient("001")
+    store.patient("001")
+    assert store.cache_stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    version = store.version
+    store.add_dose("001", "Vitamin C", 1, "20:00", channel=1)
+    assert store.version > version
+    assert store.patient_view("001", "20:00")["required"] == {"Vitamin D": 2, "Vitamin C": 1}
+
+    version = store.version
+    store.replace_patients([{"id": "002", "name": "Tom Baker",
+                             "doses": [{"medication": "Vitamin C", "pills": 1, "due": "09:00"}]}])
+    assert store.version > version and store.cache_stats()["size"] == 0
+    assert store.patient("001") is None
+    assert store.patient_view("002")["required"] == {"Vitamin C": 1}
+    assert store.seed_demo() is False      # not empty, so the demo patient is not put back
+
+
+def test_least_recently_used_patient_is_evicted():
+    store = store_with_patient(cache_size=2)
+    for patient_id in ("002", "003"):
+        store.add_patient(patient_id, f"Patient {patient_id}")
+    store.patient("001")
+    store.patient("002")
+    store.patient("001")
+    store.patient("003")
+    assert list(store.cache) == ["001", "003"]
@@ -0,0 +1,43 @@
+from config.hardware_config import MEDICATION_CHANNELS
+from hardware.servo_controller import MotorController
+
+
+class FakeGPIO:
+    OUT = "out"
+
+    def __init__(self):
+        self.duty = {}
+
+    def setup(self, pin, mode):
+        pass
+
+    def PWM(self, pin, frequency):
+        gpio = self
+
+        class PWM:
+            def start(self, duty):
+                gpio.duty[pin] = duty
+
+            def ChangeDutyCycle(self, duty):
+                gpio.duty[pin] = duty
+
+            def stop(self):
+                pass
+
+        return PWM()
+
+
+def test_every_medication_channel_has_a_gpio_servo():
+    motors = MotorController()
+    motors.gpio = FakeGPIO()
+    for name, channel in MEDICATION_CHANNELS.items():
+        assert motors.servo(channel) is not None, name
+    assert len(set(motors.pins.values())) == len(motors.pins)
+
+
+def test_angle_sets_the_pulse_width():
+    motors = MotorController({0: 27})
+    motors.gpio = FakeGPIO()
+    motors.servo(0).angle = 90
+    # 1500us of a 20ms period
+    assert motors.gpio.duty[27] == 7.5
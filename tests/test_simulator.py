@@ -0,0 +1,17 @@
+from Firmware.trace_recorder import TraceRecorder, load_traces
+from hardware.simulator import SimulatedDispenser
+
+
+def test_negative_traces_stay_flat_when_one_recorder_spans_runs(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    recorder = TraceRecorder(path)
+    dispenser = SimulatedDispenser(seed=3, drop_prob=0.5)
+    for _ in range(4):
+        dispenser.run({"Vitamin D": (0, 2), "Vitamin C": (1, 1)}, recorder=recorder)
+    recorder.close()
+
+    negatives = [trace for trace in load_traces(path) if trace["truth"] is False]
+    assert negatives
+    for trace in negatives:
+        # No pill dip (40mm) from an earlier run's readings
+        assert max(trace["mm"]) - min(trace["mm"]) < 15, trace["mm"]
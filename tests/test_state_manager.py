@@ -0,0 +1,78 @@
+import pytest
+
+from Firmware.state_manager import COMPLETE, DISPENSING, FAILED, IDLE, StateManager
+
+REQUIRED = {"Vitamin D": 2, "Vitamin C": 1}
+
+
+def test_unfinished_dose_resumes_after_a_restart(tmp_path):
+    state = StateManager(str(tmp_path))
+    state.start("001", "08:00", REQUIRED)
+    state.attempt("Vitamin D")
+    state.pill("Vitamin D")
+    state.close()
+
+    state = StateManager(str(tmp_path))
+    assert state.state["state"] == DISPENSING and state.in_progress
+    assert state.state["attempts"] == {"Vitamin D": 1}
+    assert state.remaining() == {"Vitamin D": 1, "Vitamin C": 1}
+    # Starting the same dose resumes it, another one is refused
+    with pytest.raises(ValueError):
+        state.start("002", "08:00", {"Vitamin D": 1})
+    state.start("001", "08:00", REQUIRED)
+    assert state.remaining() == {"Vitamin D": 1, "Vitamin C": 1}
+    state.close()
+
+
+def test_recovery_replays_the_log_after_the_snapshot(tmp_path):
+    state = StateManager(str(tmp_path), snapshot_every=3)
+    state.start("001", "08:00", REQUIRED)
+    state.pill("Vitamin D")
+    state.pill("Vitamin D")             # snapshot, log truncated
+    state.pill("Vitamin C")
+    state.complete()
+    state.close()
+
+    state = StateManager(str(tmp_path))
+    assert state.state["state"] == COMPLETE and not state.in_progress
+    assert state.state["seq"] == 5
+    assert state.remaining() == {"Vitamin D": 0, "Vitamin C": 0}
+    state.close()
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    state = StateManager(str(tmp_path))
+    state.start("001", "08:00", REQUIRED)
+    state.pill("Vitamin D")
+    state.close()
+    with open(state.log_path, "a") as f:
+        f.write('{"seq": 3, "kind": "pi')      # power cut mid-write
+
+    state = StateManager(str(tmp_path))
+    assert state.state["seq"] == 2
+    assert state.remaining() == {"Vitamin D": 1, "Vitamin C": 1}
+    # Events after the recovery are not lost behind the torn fragment
+    state.pill("Vitamin D")
+    state.pill("Vitamin C")
+    state.complete()
+    state.close()
+
+    state = StateManager(str(tmp_path))
+    assert state.state["state"] == COMPLETE and state.state["seq"] == 5
+    assert state.remaining() == {"Vitamin D": 0, "Vitamin C": 0}
+    state.close()
+
+
+def test_failed_dose_is_retried_or_reset(tmp_path):
+    state = StateManager(str(tmp_path))
+    state.start("001", "08:00", REQUIRED)
+    state.pill("Vitamin D")
+    state.fail("jam")
+    assert state.state["state"] == FAILED
+    with pytest.raises(ValueError):
+        state.pill("Vitamin D")
+    state.start("001", "08:00", REQUIRED)
+    assert state.state["dispensed"] == {"Vitamin D": 1}
+    state.reset()
+    assert state.state["state"] == IDLE and state.remaining() == {}
+    state.close()
@@ -0,0 +1,74 @@
+import pytest
+
+from Firmware.detection import DropDetector
+
+np = pytest.importorskip("numpy")
+from Firmware.trace_analysis import best_rules, longest_runs, sweep, traces_to_arrays  # noqa: E402
+
+BASELINE = 150
+TRACES = [
+    # A pill falling through the beam
+    {"mm": [150, 149, 112, 110, 148, 149], "truth": True},
+    {"mm": [150, 150, 151, 118, 117, 116], "truth": True},
+    # Nothing released: quiet, one outlier, slow creep
+    {"mm": [150, 151, 149, 150, 150, 151, 150], "truth": False},
+    {"mm": [150, 150, 175, 150, 149, 150, 150], "truth": False},
+    {"mm": [150, 151, 152, 153, 154, 155, 156], "truth": False},
+]
+
+
+def labelled(traces=TRACES):
+    return [dict(trace, t=[i * 0.02 for i in range(len(trace["mm"]))], baseline=BASELINE)
+            for trace in traces]
+
+
+def replay(trace, delta, variation, confirm, window):
+    """What the streaming detector decides for one trace"""
+    detector = DropDetector(window=window, confirm=confirm, delta=delta, variation=variation)
+    for step in range(window):
+        detector.feed(-1.0 + step * 0.02, BASELINE)    # steady readings before release
+    for step, distance in enumerate(trace["mm"]):
+        detector.feed(step * 0.02, distance)
+    return detector.detected_since(0.0) is not None
+
+
+def test_longest_runs():
+    edges = np.array([[0, 1, 1, 0, 1, 1, 1, 0], [0, 0, 0, 0, 0, 0, 0, 0]], dtype=bool)
+    assert longest_runs(edges).tolist() == [3, 0]
+
+
+def test_unlabelled_traces_are_skipped():
+    traces = labelled() + [{"mm": [150, 110], "t": [0, 0.02], "baseline": 150, "truth": None},
+                           {"mm": [150, 110], "t": [0, 0.02], "baseline": None, "truth": True}]
+    samples, baselines, truth = traces_to_arrays(traces)
+    assert samples.shape == (5, 7) and np.isnan(samples[0, 6])
+    assert truth.tolist() == [True, True, False, False, False]
+    with pytest.raises(ValueError):
+        traces_to_arrays(traces[-2:])
+
+
+def test_sweep_matches_the_streaming_detector():
+    deltas, variations, confirms, windows = (3, 5, 8), (4, 8, 30), (1, 2, 3), (4, 8)
+    result = sweep(*traces_to_arrays(labelled()), deltas, variations, confirms, windows)
+    for d, delta in enumerate(deltas):
+        for v, variation in enumerate(variations):
+            for c, confirm in enumerate(confirms):
+                for w, window in enumerate(windows):
+                    decisions = [replay(trace, delta, variation, confirm, window)
+                                 for trace in TRACES]
+                    fp = sum(hit and not tr["truth"] for hit, tr in zip(decisions, TRACES)) / 3
+                    fn = sum(not hit and tr["truth"] for hit, tr in zip(decisions, TRACES)) / 2
+                    rule = (delta, variation, confirm, window)
+                    assert result["false_positive"][d, v, c, w] == pytest.approx(fp), rule
+                    assert result["false_negative"][d, v, c, w] == pytest.approx(fn), rule
+
+
+def test_best_rule_rejects_the_outlier_and_the_creep():
+    result = sweep(*traces_to_arrays(labelled()), deltas=(3, 5, 8), variations=(8, 30),
+                   confirms=(1, 2, 3), windows=(4, 8))
+    best = best_rules(result, top=3)
+    assert all(rule["false_positive"] == 0 and rule["false_negative"] == 0 for rule in best)
+    # Ties go to the rule that confirms soonest; one reading would pass the outlier
+    assert best[0]["confirm"] == 2
+    assert result["false_positive"][2, 0, 0, 0] == pytest.approx(1 / 3)
+    assert result["false_positive"][2, 0, 1, 0] == 0
@@ -0,0 +1,40 @@
+import os
+import threading
+
+from Firmware.trace_recorder import TraceRecorder, load_traces
+
+
+def test_traces_are_batched_rotated_and_labelled(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    recorder = TraceRecorder(path, max_bytes=1000, backups=2)
+    first = recorder.record("Vitamin D", [0.0, 0.02, 0.04], [150, 110, 149], 150, True)
+    recorder.label(first, False)
+    ids = []
+    for _ in range(3):
+        ids += [recorder.record("Vitamin C", [0.0, 0.02], [150, 150], 150, False)
+                for _ in range(4)]
+        writers = [thread for thread in threading.enumerate() if thread.name == "trace-writer"]
+        assert len(writers) == 1
+        recorder.close()                # each close writes a batch out
+
+    assert os.path.exists(path + ".1")
+    assert os.path.getsize(path) <= 1000
+    traces = {trace["id"]: trace for trace in load_traces(path, backups=2)}
+    assert traces[first]["truth"] is False
+    assert set(ids) <= set(traces)
+    assert traces[ids[-1]]["mm"] == [150, 150]
+
+
+def test_record_window_keeps_the_streamed_readings(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    recorder = TraceRecorder(path)
+    for step, distance in enumerate([150, 150, 151, 110, 112, 149]):
+        recorder.feed(step * 0.02, distance)
+    recorder.truth_source = lambda channel, t_open, t_close: True
+    recorder.record_window("Vitamin D", 0.04, 0.1, True)
+    recorder.close()
+
+    [trace] = load_traces(path)
+    assert trace["baseline"] == 150
+    assert trace["mm"] == [151, 110, 112, 149]
+    assert trace["detected"] and trace["truth"]
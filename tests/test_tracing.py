@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from hardware.tracing import Tracer
+
+
+def virtual_tracer(**options):
+    now = [0.0]
+    return Tracer(clock=lambda: now[0], **options), now
+
+
+def test_spans_are_timed_on_the_tracer_clock():
+    tracer, now = virtual_tracer(enabled=True)
+    with tracer.span("tof_read", "sensor", channel=0):
+        now[0] += 0.002
+    tracer.record("servo_move", "dispense", 0.5, 0.3)
+    now[0] = 1.0
+    tracer.record_since("settle", "dispense", 0.1)
+    spans = [(name, category, start, seconds, args)
+             for name, category, start, seconds, thread, args in tracer.spans]
+    assert spans == [("tof_read", "sensor", 0.0, 0.002, {"channel": 0}),
+                     ("servo_move", "dispense", 0.5, 0.3, None),
+                     ("settle", "dispense", 0.9, 0.1, None)]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer, now = virtual_tracer(enabled=False)
+    with tracer.span("tof_read", "sensor"):
+        pass
+    tracer.record("servo_move", "dispense", 0.0, 0.3)
+    tracer.record_since("settle", "dispense", 0.1)
+    assert not tracer.spans
+
+
+def test_capacity_keeps_the_newest_spans():
+    tracer, now = virtual_tracer(enabled=True, capacity=3)
+    for step in range(5):
+        tracer.record(f"span{step}", "test", step, 0.001)
+    assert [span[0] for span in tracer.spans] == ["span2", "span3", "span4"]
+
+
+def test_dump_writes_chrome_trace_and_summary_histograms(tmp_path):
+    tracer, now = virtual_tracer(enabled=True)
+    for seconds in (0.0004, 0.003, 0.003, 0.15):
+        tracer.record("tof_read", "sensor", now[0], seconds)
+        now[0] += seconds
+    tracer.record("servo_move", "dispense", now[0], 1.2, channel=1)
+
+    path = tracer.dump(str(tmp_path / "logs" / "spans.json"))
+    with open(path) as f:
+        trace = json.load(f)
+    assert trace["displayTimeUnit"] == "ms"
+    complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [(event["name"], event["dur"]) for event in complete] == \
+        [("tof_read", 400.0), ("tof_read", 3000.0), ("tof_read", 3000.0),
+         ("tof_read", 150000.0), ("servo_move", 1200000.0)]
+    assert complete[1]["ts"] == 400.0 and complete[-1]["args"] == {"channel": 1}
+
+    reads = tracer.histograms()["tof_read"]
+    assert reads["count"] == 4 and reads["p50_ms"] == 3.0 and reads["max_ms"] == 150.0
+    assert sum(reads["buckets"]) == 4
+    # The names that took the most time come first
+    assert tracer.summary().splitlines()[0].startswith("servo_move")
+
+
+def test_tallies_go_into_histograms_not_spans(tmp_path):
+    tracer, now = virtual_tracer(enabled=True, capacity=10)
+    tracer.record("dispense", "dispense", 0.0, 2.0)
+    for _ in range(1000):
+        with tracer.tally("tof_read"):
+            now[0] += 0.0008
+    tracer.count("tof_read", 0.03)
+    # The poll didn't push the dispense span out
+    assert [span[0] for span in tracer.spans] == ["dispense"]
+
+    reads = tracer.histograms()["tof_read"]
+    assert reads["count"] == 1001 and reads["max_ms"] == 30.0
+    assert reads["p50_ms"] == 1 and reads["total_ms"] == pytest.approx(830)
+    path = tracer.dump(str(tmp_path / "spans.json"))
+    with open(path) as f:
+        assert json.load(f)["histograms"]["tof_read"] == reads
+    tracer.clear()
+    assert tracer.histograms() == {}
@@ -0,0 +1,95 @@
+import pytest
+
+from Firmware import screen_manager
+from Firmware.event_loop import EventLoop
+from Firmware.screen_manager import ScreenManager
+from Firmware.ui_bus import UIBus
+from hardware.simulator import VirtualClock
+
+
+class Widget:
+    def __init__(self):
+        self.options = {}
+        self.configs = 0
+
+    def config(self, **options):
+        self.options.update(options)
+        self.configs += 1
+
+
+class Frame(Widget):
+    """Stands in for tk.Frame, so no display is needed"""
+    def __init__(self, parent, bg=None):
+        super().__init__()
+        self.raised = 0
+
+    def place(self, **options):
+        pass
+
+    def tkraise(self):
+        self.raised += 1
+
+
+class Root(EventLoop):
+    def update_idletasks(self):
+        pass
+
+
+@pytest.fixture
+def ui(monkeypatch):
+    monkeypatch.setattr(screen_manager.tk, "Frame", Frame)
+    clock = VirtualClock()
+    root = Root(clock.monotonic, clock.advance)
+    screens = ScreenManager(root)
+    bus = UIBus(root, screens, frame_ms=50)
+    built = []
+
+    def builder(name):
+        def build(frame):
+            built.append(name)
+            widgets = {"status": Widget(), "frame": frame}
+            bus.bind(name, "status", widgets["status"])
+            return widgets
+        return build
+
+    for name in ("home", "dispensing"):
+        screens.register(name, builder(name))
+    return root, screens, bus, built
+
+
+def test_updates_in_one_frame_are_coalesced_into_one_render(ui):
+    root, screens, bus, built = ui
+    status = screens.show("dispensing")["status"]
+    for count in range(1, 6):
+        bus.set("dispensing", "status", text=f"Vitamin D: {count}/5")
+    root.mainloop()
+    assert status.configs == 1 and status.options == {"text": "Vitamin D: 5/5"}
+    # The same value again is not configured again
+    bus.set("dispensing", "status", text="Vitamin D: 5/5")
+    root.mainloop()
+    assert status.configs == 1
+    assert bus.report() == {"sets": 6, "configs": 1}
+
+
+def test_hidden_screen_is_updated_when_shown(ui):
+    root, screens, bus, built = ui
+    status = screens.show("dispensing")["status"]
+    screens.show("home")
+    bus.set("dispensing", "status", text="Done")
+    root.mainloop()
+    assert status.configs == 0
+    screens.show("dispensing")
+    assert status.options == {"text": "Done"}
+
+
+def test_show_raises_the_cached_screen_without_rebuilding_it(ui):
+    root, screens, bus, built = ui
+    shown = []
+    screens.add_listener(shown.append)
+    first = screens.show("home")
+    screens.show("dispensing")
+    again = screens.show("home")
+    assert built == ["home", "dispensing"]
+    assert again is first and first["frame"].raised == 2
+    assert screens.current == "home" and shown == ["home", "dispensing", "home"]
+    assert screens.report()["home"]["count"] == 2
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from Firmware.detection import DropDetector
+from Firmware.dispense_controller import DispenseController
+from Firmware.dispense_engine import InlineEngine
+from Firmware.dose_scheduler import DoseScheduler
+from Firmware.event_loop import EventLoop
+from Firmware.prescription_store import PrescriptionStore
+from Firmware.state_manager import StateManager
+from Firmware.workflow import DONE, VERIFICATION, KioskWorkflow
+from hardware.holding_stage import HoldingStage
+from hardware.motion import ServoMotion
+from hardware.simulator import SimulatedHardware, VirtualClock
+from hardware.tof_sensor import ToFSampler
+
+# A dose that fell due a moment ago, and one later on - the "next due" one
+NOW = datetime.now()
+EARLIER = (NOW - timedelta(minutes=2)).strftime("%H:%M")
+LATER = (NOW + timedelta(hours=1)).strftime("%H:%M")
+
+
+@pytest.fixture
+def store():
+    store = PrescriptionStore(":memory:")
+    store.add_patient("001", "Sarah Johnson")
+    store.add_dose("001", "Vitamin D", 2, EARLIER, 0, "Take with food")
+    store.add_dose("001", "Vitamin C", 1, EARLIER, 1, "Take with food")
+    store.add_dose("001", "Vitamin D", 1, LATER, 0, "Take with food")
+    return store
+
+
+class Kiosk:
+    """KioskWorkflow on simulated hardware with a holding stage, on virtual time"""
+
+    def __init__(self, store, state_dir, scheduler=None):
+        self.clock = VirtualClock()
+        self.loop = EventLoop(self.clock.monotonic, self.clock.advance)
+        self.sim = SimulatedHardware(self.clock.monotonic, seed=1, drop_prob=1.0)
+        sampler = ToFSampler(self.sim.read_distance, clock=self.clock.monotonic)
+        detector = DropDetector()
+        sampler.add_listener(detector.feed)
+        self.clock.every(sampler.period, sampler.poll)
+        stage = HoldingStage(ServoMotion(None, 2, clock=self.clock.monotonic))
+        self.controller = DispenseController({"Vitamin D": 0, "Vitamin C": 1},
+                                             self.sim.read_distance, detector, stage,
+                                             clock=self.clock.monotonic, verbose=False)
+        self.controller.attach(self.sim)
+        self.controller.use_state(StateManager(str(state_dir)))
+        self.engine = InlineEngine(self.loop, self.on_event, self.clock.sleep)
+        self.flow = KioskWorkflow(self.loop, store, self.controller, self.engine, scheduler,
+                                  auto_call=False, collect_timeout=None)
+
+    def on_event(self, kind, data):
+        self.flow.handle_engine_event(kind, data)
+
+    def prestage(self, patient):
+        dose_key = (patient["id"], patient["due"])
+        self.engine.submit(lambda engine: self.controller.dispense(
+            patient["required"], engine.sleep, dose_key, hold=True))
+        self.loop.mainloop()
+
+    def run(self):
+        self.loop.mainloop()
+
+
+def test_verify_after_prestage_serves_the_staged_dose(store, tmp_path):
+    kiosk = Kiosk(store, tmp_path)
+    kiosk.prestage(store.patient_view("001", EARLIER))
+    assert kiosk.controller.stage.holds(("001", EARLIER)) == {"Vitamin D": 2, "Vitamin C": 1}
+
+    # The button asks for no dose in particular; "next due" would be LATER
+    assert kiosk.flow.verify("001")
+    assert kiosk.flow.state == VERIFICATION
+    assert kiosk.flow.patient["due"] == EARLIER
+    assert kiosk.flow.confirm()
+    kiosk.run()
+
+    assert kiosk.flow.state == DONE
+    assert kiosk.flow.released == {"Vitamin D": 2, "Vitamin C": 1}
+    assert kiosk.controller.stage.staged == {}
+    assert not kiosk.controller.state.in_progress
+    # Nothing was dispensed twice
+    assert sum(len(kiosk.sim.servo(channel).releases) for channel in (0, 1)) == 3
+
+
+def test_verify_after_restart_resumes_the_unfinished_dose(store, tmp_path):
+    kiosk = Kiosk(store, tmp_path)
+    kiosk.prestage(store.patient_view("001", EARLIER))
+
+    restarted = Kiosk(store, tmp_path)
+    assert restarted.controller.stage.holds(("001", EARLIER)) == {"Vitamin D": 2, "Vitamin C": 1}
+    assert restarted.flow.verify("001")
+    assert restarted.flow.patient["due"] == EARLIER
+
+
+def test_verify_serves_the_dose_waiting_to_be_collected(store, tmp_path):
+    scheduler = DoseScheduler(store, lambda kind, data: None, path=None)
+    scheduler.load()
+    scheduler.run_due()
+    assert scheduler.outstanding_due("001") == EARLIER
+
+    kiosk = Kiosk(store, tmp_path, scheduler)
+    assert kiosk.flow.verify("001")
+    assert kiosk.flow.patient["due"] == EARLIER
+    assert kiosk.flow.confirm()
+    kiosk.run()
+    assert kiosk.flow.collect()
+
+    # Collected - the button moves on to the next dose
+    assert scheduler.outstanding_due("001") is None
+    assert kiosk.flow.verify("001")
+    assert kiosk.flow.patient["due"] == LATER